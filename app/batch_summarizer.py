@@ -0,0 +1,364 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from app.config import OPENAI_API_KEY, SUMMARY_BATCH_POLL_SECONDS, SUMMARY_BATCH_MAX_REQUESTS
+from app.models import VideoSummary
+from app.http_clients import get_openai_client
+from app.storage import (
+    get_connection,
+    write_transaction,
+    get_cached_summary,
+    save_summary,
+    acquire_lease,
+    release_lease,
+)
+from app.summarizer import (
+    build_prompt,
+    build_reduce_prompt,
+    chunk_prompts,
+    completion_request,
+    record_usage,
+    summary_fingerprint,
+    PROMPT_VERSION,
+    MODEL,
+)
+from app.summary_cache import save_summary as save_fingerprint_summary
+from app.metrics import RETRIES
+from app.logs import log_print
+
+BATCH_LEASE = "summary_batches"
+# Un ciclo (consultar, descargar resultados y enviar lo nuevo) no debería tardar más que esto
+BATCH_LEASE_TTL_SECONDS = 600
+# Intentos de cada prompt antes de guardar el video con el resumen de error
+MAX_ATTEMPTS = 3
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+ERROR_SUMMARY = "Hubo un error generando el resumen."
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_batches (
+    batch_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    input_file_id TEXT NOT NULL,
+    request_count INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summary_batch_videos (
+    video_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    chunks INTEGER NOT NULL,
+    queued_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summary_batch_videos_fingerprint ON summary_batch_videos(fingerprint);
+CREATE TABLE IF NOT EXISTS summary_batch_requests (
+    custom_id TEXT PRIMARY KEY,
+    video_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    part INTEGER NOT NULL,
+    prompt TEXT NOT NULL,
+    result TEXT,
+    batch_id TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_summary_batch_requests_video ON summary_batch_requests(video_id);
+CREATE INDEX IF NOT EXISTS idx_summary_batch_requests_batch ON summary_batch_requests(batch_id);
+"""
+
+_schema_ready = False
+
+def _connection():
+    global _schema_ready
+    conn = get_connection()
+    if not _schema_ready:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(summary_batch_videos)")}
+        if columns and "fingerprint" not in columns:
+            # Videos encolados antes de la huella: quedan sin deduplicar
+            with write_transaction():
+                conn.execute("ALTER TABLE summary_batch_videos ADD COLUMN fingerprint TEXT NOT NULL DEFAULT ''")
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+def _parse_result(line: dict) -> Optional[dict]:
+    """Respuesta de chat.completions de una línea del archivo de salida, o None si ese prompt falló."""
+    response = line.get("response") or {}
+    if line.get("error") or response.get("status_code") != 200:
+        return None
+    return response.get("body")
+
+class BatchSummarizer:
+    """
+    Modo batch de los resúmenes, para backlogs grandes (un canal nuevo, un cambio de prompt).
+    El refresh en modo batch encola los prompts de cada video en la base en vez de llamar a OpenAI;
+    un ciclo periódico los envía a la Batch API como un archivo JSONL, consulta los batches en curso
+    y guarda cada resumen con save_summary cuando llega. Los transcripts largos siguen el mismo
+    map-reduce que en vivo: cuando terminan sus chunks se encola el prompt de reduce. Los videos
+    con un transcript idéntico a otro ya encolado (misma huella) esperan el resumen de ese.
+    Los ciclos toman el lease "summary_batches", así con varios workers corre uno a la vez.
+    """
+
+    def __init__(self, max_requests: int = SUMMARY_BATCH_MAX_REQUESTS):
+        self.max_requests = max(1, max_requests)
+        self._poller: Optional[asyncio.Task] = None
+
+    # --- Cola ---
+
+    def enqueue(self, video: VideoSummary, transcript: str) -> int:
+        """Encola los prompts del video; devuelve cuántos se enviarán en el próximo batch."""
+        fingerprint = summary_fingerprint(transcript)
+        chunks = chunk_prompts(transcript, video.title, video.channel_name)
+        if chunks is None:
+            requests = [("summary", 0, build_prompt(transcript, video.title, video.channel_name))]
+        else:
+            requests = [("chunk", part, prompt) for part, prompt in enumerate(chunks, start=1)]
+        conn = _connection()
+        with write_transaction():
+            leader = conn.execute(
+                "SELECT video_id FROM summary_batch_videos WHERE fingerprint = ? AND video_id != ? LIMIT 1",
+                (fingerprint, video.video_id),
+            ).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO summary_batch_videos (video_id, data, fingerprint, chunks, queued_at) VALUES (?, ?, ?, ?, ?)",
+                (video.video_id, json.dumps(video.dict()), fingerprint, len(chunks or []), time.time()),
+            )
+            conn.execute("DELETE FROM summary_batch_requests WHERE video_id = ?", (video.video_id,))
+            if leader is not None:
+                # Mismo transcript que otro video encolado: se guarda con el resumen de ese
+                return 0
+            conn.executemany(
+                "INSERT INTO summary_batch_requests (custom_id, video_id, kind, part, prompt) VALUES (?, ?, ?, ?, ?)",
+                [(f"{video.video_id}:{kind}:{part}", video.video_id, kind, part, prompt) for kind, part, prompt in requests],
+            )
+        return len(requests)
+
+    def is_queued(self, video_id: str) -> bool:
+        row = _connection().execute(
+            "SELECT 1 FROM summary_batch_videos WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        return row is not None
+
+    # --- Ciclo ---
+
+    def run_cycle(self) -> bool:
+        """Consulta los batches en curso y envía los prompts pendientes; False si otro worker tiene el lease."""
+        owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        if not acquire_lease(BATCH_LEASE, owner, BATCH_LEASE_TTL_SECONDS):
+            return False
+        try:
+            self.poll()
+            self.submit()
+        finally:
+            release_lease(BATCH_LEASE, owner)
+        return True
+
+    def submit(self) -> List[str]:
+        """Envía los prompts que todavía no están en un batch, en batches de hasta max_requests."""
+        conn = _connection()
+        client = get_openai_client()
+        batch_ids = []
+        while True:
+            rows = conn.execute(
+                "SELECT custom_id, prompt FROM summary_batch_requests WHERE batch_id IS NULL AND result IS NULL LIMIT ?",
+                (self.max_requests,),
+            ).fetchall()
+            if not rows:
+                return batch_ids
+            lines = [
+                json.dumps({
+                    "custom_id": row["custom_id"],
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": completion_request(row["prompt"]),
+                }, ensure_ascii=False)
+                for row in rows
+            ]
+            payload = ("\n".join(lines) + "\n").encode("utf-8")
+            # openai 1.3.0 no trae el recurso batches: se usan files.create y las llamadas genéricas del cliente
+            input_file = client.files.create(file=("summaries.jsonl", payload), purpose="batch")
+            batch = client.post("/batches", cast_to=Dict[str, Any], body={
+                "input_file_id": input_file.id,
+                "endpoint": "/v1/chat/completions",
+                "completion_window": "24h",
+            })
+            now = time.time()
+            with write_transaction():
+                conn.execute(
+                    "INSERT INTO summary_batches (batch_id, status, input_file_id, request_count, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (batch["id"], batch.get("status", "validating"), input_file.id, len(rows), now, now),
+                )
+                conn.executemany(
+                    "UPDATE summary_batch_requests SET batch_id = ? WHERE custom_id = ?",
+                    [(batch["id"], row["custom_id"]) for row in rows],
+                )
+            log_print(f"📦 Batch de resúmenes {batch['id']} enviado ({len(rows)} prompts, {len(payload) // 1024} KB)")
+            batch_ids.append(batch["id"])
+
+    def poll(self):
+        """Actualiza los batches en curso y procesa los que terminaron."""
+        conn = _connection()
+        client = get_openai_client()
+        placeholders = ",".join("?" * len(TERMINAL_STATUSES))
+        rows = conn.execute(
+            f"SELECT batch_id FROM summary_batches WHERE status NOT IN ({placeholders}) ORDER BY created_at",
+            TERMINAL_STATUSES,
+        ).fetchall()
+        for row in rows:
+            batch = client.get(f"/batches/{row['batch_id']}", cast_to=Dict[str, Any])
+            status = batch.get("status", "unknown")
+            if status in TERMINAL_STATUSES:
+                results = {}
+                for file_id in (batch.get("output_file_id"), batch.get("error_file_id")):
+                    if file_id:
+                        for line in client.files.content(file_id).text.splitlines():
+                            if line.strip():
+                                data = json.loads(line)
+                                results[data["custom_id"]] = _parse_result(data)
+                self._apply_results(row["batch_id"], results)
+                log_print(f"📦 Batch de resúmenes {row['batch_id']} {status} ({len(results)} respuestas)")
+            with write_transaction():
+                conn.execute(
+                    "UPDATE summary_batches SET status = ?, updated_at = ? WHERE batch_id = ?",
+                    (status, time.time(), row["batch_id"]),
+                )
+
+    def _apply_results(self, batch_id: str, results: Dict[str, Optional[dict]]):
+        """Guarda las respuestas del batch; los prompts sin respuesta válida vuelven a la cola."""
+        conn = _connection()
+        requests = conn.execute(
+            "SELECT custom_id, video_id, attempts FROM summary_batch_requests WHERE batch_id = ?", (batch_id,)
+        ).fetchall()
+        done, retry, failed_videos = [], [], set()
+        for request in requests:
+            body = results.get(request["custom_id"])
+            if body is not None:
+                usage = body.get("usage") or {}
+                record_usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
+                done.append((body["choices"][0]["message"]["content"].strip(), request["custom_id"]))
+            elif request["attempts"] + 1 < MAX_ATTEMPTS:
+                RETRIES.inc(operation="summary_batch")
+                retry.append((request["custom_id"],))
+            else:
+                failed_videos.add(request["video_id"])
+        with write_transaction():
+            conn.executemany("UPDATE summary_batch_requests SET result = ?, batch_id = NULL WHERE custom_id = ?", done)
+            conn.executemany(
+                "UPDATE summary_batch_requests SET batch_id = NULL, attempts = attempts + 1 WHERE custom_id = ?", retry
+            )
+        if retry:
+            log_print(f"  ⚠️ {len(retry)} prompts del batch {batch_id} fallaron; se reenvían en el próximo batch")
+        video_ids = {request["video_id"] for request in requests}
+        for video_id in sorted(video_ids):
+            self._advance_video(video_id, failed=video_id in failed_videos)
+
+    def _advance_video(self, video_id: str, failed: bool = False):
+        """Guarda el resumen del video si ya está completo, o encola su reduce cuando terminaron los chunks."""
+        conn = _connection()
+        row = conn.execute("SELECT data, chunks FROM summary_batch_videos WHERE video_id = ?", (video_id,)).fetchone()
+        if row is None:
+            return
+        video = VideoSummary(**json.loads(row["data"]))
+        requests = {
+            (r["kind"], r["part"]): r["result"]
+            for r in conn.execute(
+                "SELECT kind, part, result FROM summary_batch_requests WHERE video_id = ?", (video_id,)
+            ).fetchall()
+        }
+        if failed:
+            log_print(f"    ✗ Error en el resumen (batch) - {video_id}")
+            self._finish_video(video, ERROR_SUMMARY)
+            return
+        final = requests.get(("summary", 0)) or requests.get(("reduce", 0))
+        if final:
+            self._finish_video(video, final)
+            return
+        partials = [requests.get(("chunk", part)) for part in range(1, row["chunks"] + 1)]
+        if row["chunks"] and all(partials) and ("reduce", 0) not in requests:
+            prompt = build_reduce_prompt(partials, video.title, video.channel_name)
+            with write_transaction():
+                conn.execute(
+                    "INSERT INTO summary_batch_requests (custom_id, video_id, kind, part, prompt) VALUES (?, ?, 'reduce', 0, ?)",
+                    (f"{video_id}:reduce:0", video_id, prompt),
+                )
+
+    def _finish_video(self, video: VideoSummary, summary: str):
+        """Guarda el resumen del video y el de los videos encolados con el mismo transcript."""
+        conn = _connection()
+        row = conn.execute("SELECT fingerprint FROM summary_batch_videos WHERE video_id = ?", (video.video_id,)).fetchone()
+        fingerprint = row["fingerprint"]
+        videos = [video]
+        if fingerprint:
+            if summary != ERROR_SUMMARY:
+                save_fingerprint_summary(fingerprint, summary, PROMPT_VERSION, MODEL)
+            videos += [
+                VideoSummary(**json.loads(other["data"]))
+                for other in conn.execute(
+                    "SELECT data FROM summary_batch_videos WHERE fingerprint = ? AND video_id != ? "
+                    "AND video_id NOT IN (SELECT video_id FROM summary_batch_requests)",
+                    (fingerprint, video.video_id),
+                ).fetchall()
+            ]
+        for finished in videos:
+            cached = get_cached_summary(finished.video_id)
+            # Si mientras tanto un refresh en vivo ya lo resumió, se conserva ese resumen
+            if not (cached and cached.summary):
+                finished.summary = summary
+                finished.generated_at = datetime.now().isoformat()
+                save_summary(finished)
+                if summary != ERROR_SUMMARY:
+                    log_print(f"    ✓ Resumen generado (batch) - {finished.video_id}")
+        with write_transaction():
+            conn.execute("DELETE FROM summary_batch_requests WHERE video_id = ?", (video.video_id,))
+            conn.executemany(
+                "DELETE FROM summary_batch_videos WHERE video_id = ?", [(finished.video_id,) for finished in videos]
+            )
+
+    # --- Ciclo periódico en el servidor ---
+
+    def start_poller(self, interval_seconds: float = SUMMARY_BATCH_POLL_SECONDS):
+        if not OPENAI_API_KEY or interval_seconds <= 0 or self._poller is not None:
+            return
+        self._poller = asyncio.create_task(self._poll_loop(interval_seconds))
+
+    async def _poll_loop(self, interval_seconds: float):
+        while True:
+            try:
+                await asyncio.to_thread(self.run_cycle)
+            except Exception as e:
+                log_print(f"✗ Error en el ciclo de batches de resúmenes: {e}")
+            await asyncio.sleep(interval_seconds)
+
+    async def stop_poller(self):
+        if self._poller is not None:
+            self._poller.cancel()
+            try:
+                await self._poller
+            except asyncio.CancelledError:
+                pass
+            self._poller = None
+
+    def get_stats(self) -> dict:
+        conn = _connection()
+        batches = {
+            row["status"]: row["total"]
+            for row in conn.execute("SELECT status, COUNT(*) AS total FROM summary_batches GROUP BY status").fetchall()
+        }
+        requests = conn.execute(
+            "SELECT SUM(batch_id IS NULL AND result IS NULL) AS queued, SUM(batch_id IS NOT NULL) AS in_batch "
+            "FROM summary_batch_requests"
+        ).fetchone()
+        videos = conn.execute("SELECT COUNT(*) AS total FROM summary_batch_videos").fetchone()
+        return {
+            "videos_pending": videos["total"],
+            "requests_queued": requests["queued"] or 0,
+            "requests_in_batch": requests["in_batch"] or 0,
+            "batches": batches,
+        }
+
+batch_summarizer = BatchSummarizer()
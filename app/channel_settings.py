@@ -0,0 +1,120 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from app.config import (
+    CHANNEL_CONFIG_FILE,
+    MIN_VIDEO_DURATION_SECONDS,
+    MAX_VIDEOS_PER_CHANNEL,
+    TRANSCRIPT_LANGUAGES,
+    load_channel_registry,
+)
+from app.logs import log_print
+
+class ChannelSettings(BaseModel):
+    """Configuración de un canal; lo que no está en channel_config.json toma el valor global."""
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+    min_duration_seconds: int = Field(MIN_VIDEO_DURATION_SECONDS, ge=0)
+    max_videos: int = Field(MAX_VIDEOS_PER_CHANNEL, ge=1)
+    languages: List[str] = Field(default_factory=lambda: list(TRANSCRIPT_LANGUAGES), min_length=1)
+    enabled: bool = True
+
+DEFAULT_SETTINGS = ChannelSettings()
+
+def parse_channel_config(data: dict) -> Dict[str, ChannelSettings]:
+    """
+    Cada canal puede tener solo la duración mínima (formato anterior, un número) o un objeto con
+    min_duration_seconds, max_videos, languages y enabled. Las entradas inválidas se ignoran.
+    """
+    settings = {}
+    for channel_url, value in data.items():
+        try:
+            if isinstance(value, dict):
+                settings[channel_url] = ChannelSettings(**value)
+            else:
+                settings[channel_url] = ChannelSettings(min_duration_seconds=int(value))
+        except (ValidationError, TypeError, ValueError) as e:
+            log_print(f"Configuración inválida para {channel_url} en {CHANNEL_CONFIG_FILE}, se ignora: {e}")
+    return settings
+
+class ChannelSettingsRegistry:
+    """
+    Configuración por canal en memoria. get() es una lectura de dict, sin tocar el disco; el archivo
+    se vuelve a leer solo cuando cambia su mtime (reload_if_changed, que el pipeline llama al inicio
+    de cada refresh) y el dict nuevo reemplaza al anterior de una vez, así un refresh nunca ve una
+    mezcla de la configuración vieja y la nueva. Si el archivo no se puede leer (p. ej. a medio
+    escribir) se mantiene la configuración anterior y se reintenta en la próxima llamada.
+    """
+
+    def __init__(self, path: str = CHANNEL_CONFIG_FILE):
+        self.path = path
+        self._settings: Dict[str, ChannelSettings] = {}
+        self._signature = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        self.reloads = 0
+        self.last_error: Optional[str] = None
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self) -> bool:
+        """Relee el archivo si cambió desde la última carga. Devuelve True si se aplicó una configuración nueva."""
+        signature = self._file_signature()
+        if self._loaded and signature == self._signature:
+            return False
+        with self._lock:
+            if self._loaded and signature == self._signature:
+                return False
+            settings = {}
+            if signature is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                    if not isinstance(data, dict):
+                        raise ValueError("se esperaba un objeto {url del canal: configuración}")
+                    settings = parse_channel_config(data)
+                except Exception as e:
+                    self.last_error = str(e)
+                    log_print(f"Error loading channel config from {self.path}: {e}; se mantiene la configuración anterior")
+                    self._loaded = True
+                    return False
+            self._settings = settings
+            self._signature = signature
+            self.last_error = None
+            if self._loaded:
+                log_print(f"Configuración por canal recargada desde {self.path} ({len(settings)} canales)")
+            self._loaded = True
+            self.reloads += 1
+            return True
+
+    def get(self, channel_url: str) -> ChannelSettings:
+        if not self._loaded:
+            self.reload_if_changed()
+        return self._settings.get(channel_url, DEFAULT_SETTINGS)
+
+    def enabled_channels(self, channel_urls: List[str]) -> List[str]:
+        return [channel_url for channel_url in channel_urls if self.get(channel_url).enabled]
+
+    def get_stats(self) -> dict:
+        settings = self._settings
+        return {
+            "file": self.path,
+            "channels": len(settings),
+            "disabled": sum(1 for channel in settings.values() if not channel.enabled),
+            "reloads": self.reloads,
+            "last_error": self.last_error,
+        }
+
+channel_settings = ChannelSettingsRegistry()
+
+def load_enabled_channels() -> List[str]:
+    """Canales del registro (ver load_channel_registry) sin los deshabilitados en channel_config.json."""
+    channel_settings.reload_if_changed()
+    return channel_settings.enabled_channels(load_channel_registry())
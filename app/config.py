@@ -1,13 +1,22 @@
 import os
 import json
+import logging
 from dotenv import load_dotenv
-from typing import Dict, Optional
+from typing import List
 
 load_dotenv()
 
+# app.logs importa esta configuración, así que acá se usa el logger directamente
+logger = logging.getLogger(__name__)
+
 YOUTUBE_API_KEY = os.getenv("YOUTUBE_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Bases de los upstreams; se cambian para apuntar a los servidores locales de bench/
+YOUTUBE_API_BASE_URL = os.getenv("YOUTUBE_API_BASE_URL", "https://www.googleapis.com/youtube/v3").rstrip("/")
+YOUTUBE_WEB_BASE_URL = os.getenv("YOUTUBE_WEB_BASE_URL", "https://www.youtube.com").rstrip("/")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
 YOUTUBE_CHANNEL_URLS = [
     "https://www.youtube.com/@RavaBursatil",
     "https://www.youtube.com/@Daniel_Pesalovo",
@@ -21,44 +30,122 @@ YOUTUBE_CHANNEL_URLS = [
 ]
 
 MAX_VIDEOS_PER_CHANNEL = 3
+# Descubrimiento de videos: "api" (playlist de uploads con la Data API) o "rss" (feed público de
+# uploads de youtube.com, sin cuota; la Data API se usa solo para la duración de los ids nuevos)
+DISCOVERY_BACKEND = os.getenv("DISCOVERY_BACKEND", "api").strip().lower()
+# Tiempo de vida del registro de canales (id, nombre y playlist de uploads) antes de revalidar
+CHANNEL_CACHE_TTL_SECONDS = int(os.getenv("CHANNEL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
 # Duración mínima global (default: 120 segundos = 2 minutos para filtrar solo Shorts)
 MIN_VIDEO_DURATION_SECONDS = int(os.getenv("MIN_VIDEO_DURATION_SECONDS", "120"))
-DATA_DIR = "data"
+DATA_DIR = os.getenv("DATA_DIR", "data")
+# Archivo JSON legado: se migra una sola vez a la base SQLite
 SUMMARIES_FILE = os.path.join(DATA_DIR, "summaries.json")
+SUMMARIES_DB_FILE = os.path.join(DATA_DIR, "summaries.db")
+# Configuración por canal (duración mínima, máximo de videos, idiomas de transcript, habilitado);
+# se recarga sola cuando cambia el archivo (ver app.channel_settings)
 CHANNEL_CONFIG_FILE = os.path.join(DATA_DIR, "channel_config.json")
+# Registro de canales: lista JSON de URLs; si no existe se usan los YOUTUBE_CHANNEL_URLS de arriba
+CHANNELS_FILE = os.path.join(DATA_DIR, "channels.json")
 
+# Idiomas de transcript preferidos, en orden, para los canales sin "languages" en channel_config.json
+TRANSCRIPT_LANGUAGES = [
+    language.strip() for language in os.getenv("TRANSCRIPT_LANGUAGES", "es,es-419,es-ES,es-MX,es-AR").split(",") if language.strip()
+]
 # Control de peticiones de transcript
 TRANSCRIPT_MAX_RETRIES = int(os.getenv("TRANSCRIPT_MAX_RETRIES", "3"))
 TRANSCRIPT_RETRY_BACKOFF_SECONDS = float(os.getenv("TRANSCRIPT_RETRY_BACKOFF_SECONDS", "2.5"))
 TRANSCRIPT_REQUEST_DELAY_SECONDS = float(os.getenv("TRANSCRIPT_REQUEST_DELAY_SECONDS", "0.5"))
+# Limitador adaptativo de transcripts (peticiones por segundo): arranca en 1/TRANSCRIPT_REQUEST_DELAY_SECONDS,
+# sube TRANSCRIPT_RATE_INCREASE por cada éxito y se multiplica por TRANSCRIPT_RATE_DECREASE ante un 429
+TRANSCRIPT_RATE_MIN = float(os.getenv("TRANSCRIPT_RATE_MIN", "0.2"))
+TRANSCRIPT_RATE_MAX = float(os.getenv("TRANSCRIPT_RATE_MAX", "10"))
+TRANSCRIPT_RATE_INCREASE = float(os.getenv("TRANSCRIPT_RATE_INCREASE", "0.05"))
+TRANSCRIPT_RATE_DECREASE = float(os.getenv("TRANSCRIPT_RATE_DECREASE", "0.5"))
+# Tamaño máximo (comprimido) del cache local de transcripts; se desalojan los menos usados
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+# Entradas máximas del cache de resúmenes por huella del transcript; se desalojan las menos usadas
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv("SUMMARY_CACHE_MAX_ENTRIES", "50000"))
 
-# Configuración por canal: mapea URL del canal a duración mínima en segundos
-# Si no se especifica, se usa MIN_VIDEO_DURATION_SECONDS global
-CHANNEL_MIN_DURATION: Dict[str, int] = {}
+# Pools HTTP compartidos por upstream (YouTube Data API, youtube.com y OpenAI)
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.getenv("HTTP_CONNECT_TIMEOUT_SECONDS", "5"))
+HTTP_READ_TIMEOUT_SECONDS = float(os.getenv("HTTP_READ_TIMEOUT_SECONDS", "20"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "10"))
+OPENAI_READ_TIMEOUT_SECONDS = float(os.getenv("OPENAI_READ_TIMEOUT_SECONDS", "60"))
+OPENAI_POOL_MAXSIZE = int(os.getenv("OPENAI_POOL_MAXSIZE", "8"))
+# Circuit breaker por upstream: después de CIRCUIT_BREAKER_FAILURES fallas seguidas (errores de
+# conexión, timeouts o 5xx) las llamadas se rechazan al instante durante CIRCUIT_BREAKER_RESET_SECONDS;
+# después pasa una sola llamada de prueba y, si sale bien, el circuito se cierra
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+CIRCUIT_BREAKER_RESET_SECONDS = float(os.getenv("CIRCUIT_BREAKER_RESET_SECONDS", "30"))
+# Circuit breaker por canal: un canal que falla en CHANNEL_BREAKER_FAILURES refreshes seguidos se
+# saltea (se sigue mostrando lo cacheado) durante CHANNEL_BREAKER_RESET_SECONDS
+CHANNEL_BREAKER_FAILURES = int(os.getenv("CHANNEL_BREAKER_FAILURES", "3"))
+CHANNEL_BREAKER_RESET_SECONDS = float(os.getenv("CHANNEL_BREAKER_RESET_SECONDS", "3600"))
+# Hedging de GETs a youtube.com (no a la Data API, que cobra cuota por petición): si una petición
+# tarda más que el percentil HTTP_HEDGE_PERCENTILE de las últimas, se manda una segunda igual y se
+# usa la primera que responde (0 = desactivado). Se necesitan HTTP_HEDGE_MIN_SAMPLES latencias
+# medidas antes de empezar
+HTTP_HEDGE_PERCENTILE = float(os.getenv("HTTP_HEDGE_PERCENTILE", "0"))
+HTTP_HEDGE_MIN_SAMPLES = int(os.getenv("HTTP_HEDGE_MIN_SAMPLES", "20"))
 
-def load_channel_config() -> Dict[str, int]:
-    """Carga configuración por canal desde archivo JSON si existe."""
-    config = {}
-    if os.path.exists(CHANNEL_CONFIG_FILE):
-        try:
-            with open(CHANNEL_CONFIG_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    # Convertir valores a int
-                    config = {k: int(v) for k, v in data.items() if isinstance(v, (int, str))}
-        except Exception as e:
-            print(f"Error loading channel config from {CHANNEL_CONFIG_FILE}: {e}")
-    return config
+# Resumen map-reduce de transcripts largos: tamaño de cada chunk (tokens aproximados),
+# cantidad máxima de chunks por video y llamadas de chunks en vuelo en todo el proceso
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_MAX_CHUNKS = int(os.getenv("SUMMARY_MAX_CHUNKS", "12"))
+SUMMARY_CHUNK_CONCURRENCY = int(os.getenv("SUMMARY_CHUNK_CONCURRENCY", "4"))
+# Modo batch (POST /refresh?mode=batch): los prompts pendientes se envían a la Batch API de OpenAI
+# (más barata, responde en hasta 24 h); cada SUMMARY_BATCH_POLL_SECONDS se consulta su estado y se
+# envían los prompts nuevos, hasta SUMMARY_BATCH_MAX_REQUESTS por batch
+SUMMARY_BATCH_POLL_SECONDS = float(os.getenv("SUMMARY_BATCH_POLL_SECONDS", "60"))
+SUMMARY_BATCH_MAX_REQUESTS = int(os.getenv("SUMMARY_BATCH_MAX_REQUESTS", "10000"))
 
-def get_min_duration_for_channel(channel_url: str) -> int:
-    """Obtiene la duración mínima configurada para un canal específico."""
-    # Cargar configuración desde archivo
-    channel_config = load_channel_config()
-    # Combinar con configuración hardcodeada (tiene prioridad)
-    all_config = {**channel_config, **CHANNEL_MIN_DURATION}
-    # Retornar valor por canal o global
-    return all_config.get(channel_url, MIN_VIDEO_DURATION_SECONDS)
+# Concurrencia del refresh: máximo de tareas en vuelo por etapa
+REFRESH_CHANNEL_CONCURRENCY = int(os.getenv("REFRESH_CHANNEL_CONCURRENCY", "4"))
+REFRESH_TRANSCRIPT_CONCURRENCY = int(os.getenv("REFRESH_TRANSCRIPT_CONCURRENCY", "2"))
+REFRESH_SUMMARY_CONCURRENCY = int(os.getenv("REFRESH_SUMMARY_CONCURRENCY", "4"))
 
-# Cargar configuración inicial
-CHANNEL_MIN_DURATION.update(load_channel_config())
+# Jobs de refresh en segundo plano: intervalo del refresh automático (0 = desactivado)
+# y cantidad de jobs terminados que se conservan para consultar su estado
+REFRESH_INTERVAL_MINUTES = float(os.getenv("REFRESH_INTERVAL_MINUTES", "0"))
+REFRESH_JOB_HISTORY = int(os.getenv("REFRESH_JOB_HISTORY", "20"))
+# Lease del refresh compartido por todos los workers: si el worker que corre el refresh
+# muere, otro puede tomarlo cuando pasan estos segundos sin renovación
+REFRESH_LEASE_TTL_SECONDS = float(os.getenv("REFRESH_LEASE_TTL_SECONDS", "120"))
+# Tiempo máximo de un refresh (0 = sin límite): al vencer no se empiezan canales ni videos nuevos;
+# lo que quedó sin procesar conserva lo cacheado y se completa en el próximo refresh
+REFRESH_DEADLINE_SECONDS = float(os.getenv("REFRESH_DEADLINE_SECONDS", "0"))
 
+# Refresh por shards en procesos separados (0 = todo en el proceso del servidor). Cada shard de
+# REFRESH_SHARD_SIZE canales corre en un proceso con sus propios pools HTTP y una fracción del
+# límite de transcripts; si falla o supera el timeout se reintenta solo ese shard
+REFRESH_PROCESSES = int(os.getenv("REFRESH_PROCESSES", "0"))
+REFRESH_SHARD_SIZE = int(os.getenv("REFRESH_SHARD_SIZE", "50"))
+REFRESH_SHARD_TIMEOUT_SECONDS = float(os.getenv("REFRESH_SHARD_TIMEOUT_SECONDS", "1800"))
+REFRESH_SHARD_RETRIES = int(os.getenv("REFRESH_SHARD_RETRIES", "2"))
+
+# Logs: se escriben desde un thread aparte (el refresh solo encola el registro). LOG_FORMAT json
+# emite una línea JSON por registro con el id del refresh; text es el formato legible de siempre.
+# LOG_QUEUE_SIZE limita los registros en espera (si la salida no da abasto se descartan y se cuentan)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Las líneas por video descartado ([FILTRADO]) son de nivel DEBUG; con LOG_LEVEL=DEBUG se escribe
+# esta fracción de ellas (1 = todas, 0 = ninguna)
+LOG_FILTERED_SAMPLE_RATE = float(os.getenv("LOG_FILTERED_SAMPLE_RATE", "1"))
+
+def load_channel_registry() -> List[str]:
+    """
+    Canales a refrescar: la lista de CHANNELS_FILE si existe (se lee en cada refresh, así
+    agregar canales no requiere reiniciar), o YOUTUBE_CHANNEL_URLS.
+    """
+    if os.path.exists(CHANNELS_FILE):
+        try:
+            with open(CHANNELS_FILE, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                urls = [url.strip() for url in data if isinstance(url, str) and url.strip()]
+                return list(dict.fromkeys(urls))
+            logger.error(f"Error loading channel registry from {CHANNELS_FILE}: se esperaba una lista de URLs")
+        except Exception as e:
+            logger.error(f"Error loading channel registry from {CHANNELS_FILE}: {e}")
+    return list(YOUTUBE_CHANNEL_URLS)
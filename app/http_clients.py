@@ -0,0 +1,229 @@
+import time
+import threading
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI
+from app.config import (
+    OPENAI_API_KEY,
+    HTTP_CONNECT_TIMEOUT_SECONDS,
+    HTTP_READ_TIMEOUT_SECONDS,
+    HTTP_POOL_MAXSIZE,
+    OPENAI_READ_TIMEOUT_SECONDS,
+    OPENAI_POOL_MAXSIZE,
+    OPENAI_BASE_URL,
+    YOUTUBE_WEB_BASE_URL,
+)
+from app.metrics import UPSTREAM_SECONDS, UPSTREAM_REQUESTS, RATE_LIMITED, HEDGED_REQUESTS
+from app.resilience import upstream_breakers, LatencyTracker, hedged_call
+
+YOUTUBE_WEB_ORIGIN = "https://www.youtube.com"
+BROWSER_HEADERS = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
+
+def _record_response(upstream: str, status) -> bool:
+    """Registra la respuesta en las métricas del upstream; devuelve si cuenta como error."""
+    UPSTREAM_REQUESTS.inc(upstream=upstream, status=str(status))
+    if status == 429:
+        RATE_LIMITED.inc(upstream=upstream)
+    return status == "error" or status >= 500
+
+class _UsageCounter:
+    """Contadores de uso de un pool (peticiones, errores, en vuelo y pico en vuelo)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def start(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def finish(self, failed: bool):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+            }
+
+class PooledSession(requests.Session):
+    """
+    requests.Session con keep-alive, un máximo de conexiones por host (las peticiones esperan
+    si el pool está lleno) y timeouts de conexión/lectura por defecto.
+    Con base_url, las URLs que empiezan con origin se redirigen a esa base (lo usan los
+    benchmarks para apuntar youtube-transcript-api, que tiene las URLs fijas, a un servidor local).
+    Cada petición pasa por el circuit breaker del upstream (CircuitOpen si está abierto) y, con
+    hedge y HTTP_HEDGE_PERCENTILE, un GET que tarda más que ese percentil se duplica y gana el
+    primero. Solo para upstreams sin cuota: una petición duplicada a la Data API cuesta dos veces.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        pool_maxsize: int = HTTP_POOL_MAXSIZE,
+        headers: dict = None,
+        origin: str = None,
+        base_url: str = None,
+        hedge: bool = False,
+    ):
+        super().__init__()
+        self.name = name
+        self.rebase = (origin, base_url) if origin and base_url and origin != base_url else None
+        self.pool_maxsize = pool_maxsize
+        self.usage = _UsageCounter()
+        self.breaker = upstream_breakers[name]
+        self.latency = LatencyTracker() if hedge else None
+        self._hedge_lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, pool_block=True)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+        if headers:
+            self.headers.update(headers)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT_SECONDS, HTTP_READ_TIMEOUT_SECONDS))
+        if self.rebase and url.startswith(self.rebase[0]):
+            url = self.rebase[1] + url[len(self.rebase[0]):]
+        self.breaker.before_call()
+        delay = None
+        if self.latency is not None and method.upper() == "GET" and not kwargs.get("stream"):
+            delay = self.latency.threshold()
+        if delay is None:
+            return self._send(method, url, **kwargs)
+        response, hedged, backup_won = hedged_call(lambda: self._send(method, url, **kwargs), delay)
+        if hedged:
+            with self._hedge_lock:
+                self.hedged += 1
+                self.hedge_wins += backup_won
+            HEDGED_REQUESTS.inc(upstream=self.name, result="won" if backup_won else "lost")
+        return response
+
+    def _send(self, method, url, **kwargs):
+        self.usage.start()
+        status = "error"
+        started = time.perf_counter()
+        try:
+            with UPSTREAM_SECONDS.time(upstream=self.name):
+                response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            failed = _record_response(self.name, status)
+            self.usage.finish(failed)
+            if failed:
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+                if self.latency is not None:
+                    self.latency.observe(time.perf_counter() - started)
+
+    def get_stats(self) -> dict:
+        stats = self.usage.snapshot()
+        stats["pool_maxsize"] = self.pool_maxsize
+        stats["hedged"] = self.hedged
+        stats["hedge_wins"] = self.hedge_wins
+        hosts = {}
+        pools = self.adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts[pool.host] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+            }
+        stats["hosts"] = hosts
+        return stats
+
+class _CountingTransport(httpx.HTTPTransport):
+    """Transporte httpx que registra el uso del pool del cliente de OpenAI."""
+
+    def __init__(self, usage: _UsageCounter, **kwargs):
+        super().__init__(**kwargs)
+        self.usage = usage
+
+    def handle_request(self, request):
+        self.usage.start()
+        status = "error"
+        try:
+            with UPSTREAM_SECONDS.time(upstream="openai"):
+                response = super().handle_request(request)
+            status = response.status_code
+            return response
+        finally:
+            self.usage.finish(_record_response("openai", status))
+
+_lock = threading.Lock()
+_youtube_api_session = None
+_youtube_web_session = None
+_openai_client = None
+_openai_usage = _UsageCounter()
+
+def get_youtube_api_session() -> PooledSession:
+    """Session compartida para la YouTube Data API (googleapis.com)."""
+    global _youtube_api_session
+    if _youtube_api_session is None:
+        with _lock:
+            if _youtube_api_session is None:
+                _youtube_api_session = PooledSession("youtube_api")
+    return _youtube_api_session
+
+def get_youtube_web_session() -> PooledSession:
+    """Session compartida para youtube.com (scraping de canales y transcripts)."""
+    global _youtube_web_session
+    if _youtube_web_session is None:
+        with _lock:
+            if _youtube_web_session is None:
+                _youtube_web_session = PooledSession(
+                    "youtube_web",
+                    headers=BROWSER_HEADERS,
+                    origin=YOUTUBE_WEB_ORIGIN,
+                    base_url=YOUTUBE_WEB_BASE_URL,
+                    hedge=True,
+                )
+    return _youtube_web_session
+
+def get_openai_client() -> OpenAI:
+    """Cliente de OpenAI compartido por todo el proceso, con pool de conexiones y timeouts."""
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                http_client = httpx.Client(
+                    transport=_CountingTransport(
+                        _openai_usage,
+                        limits=httpx.Limits(
+                            max_connections=OPENAI_POOL_MAXSIZE,
+                            max_keepalive_connections=OPENAI_POOL_MAXSIZE,
+                        ),
+                    ),
+                    timeout=httpx.Timeout(OPENAI_READ_TIMEOUT_SECONDS, connect=HTTP_CONNECT_TIMEOUT_SECONDS),
+                )
+                _openai_client = OpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=http_client)
+    return _openai_client
+
+def get_pool_stats() -> dict:
+    """Uso de los pools HTTP de cada upstream, para dimensionarlos."""
+    stats = {}
+    for session in (_youtube_api_session, _youtube_web_session):
+        if session is not None:
+            stats[session.name] = session.get_stats()
+    openai_stats = _openai_usage.snapshot()
+    openai_stats["pool_maxsize"] = OPENAI_POOL_MAXSIZE
+    stats["openai"] = openai_stats
+    return stats
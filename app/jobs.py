@@ -0,0 +1,265 @@
+import os
+import uuid
+import socket
+import asyncio
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from app.config import (
+    REFRESH_INTERVAL_MINUTES,
+    REFRESH_JOB_HISTORY,
+    REFRESH_LEASE_TTL_SECONDS,
+)
+from app.models import VideoSummary
+from app.channel_settings import load_enabled_channels
+from app.pipeline import RefreshProgress, run_refresh, group_by_channel
+from app.storage import (
+    acquire_lease,
+    renew_lease,
+    release_lease,
+    get_lease,
+    save_job_snapshot,
+    get_job_snapshot,
+)
+from app.logs import log_print, refresh_id
+
+REFRESH_LEASE = "refresh"
+
+# Un solo thread escribe los snapshots de los jobs, así se guardan en orden y sin bloquear el event loop
+_snapshot_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-snapshots")
+
+def _save_snapshot(data: dict):
+    try:
+        save_job_snapshot(data, REFRESH_JOB_HISTORY)
+    except Exception as e:
+        log_print(f"✗ No se pudo guardar el estado del job {data['job_id']}: {e}")
+
+class RefreshLeaseHeld(Exception):
+    """Otro worker (u otra instancia) tiene el lease del refresh."""
+
+    def __init__(self, lease: dict):
+        self.lease = lease
+        self.job_id = (lease.get("data") or {}).get("job_id")
+        super().__init__(f"Refresh {self.job_id} en curso en {lease['owner']}")
+
+class RefreshJob(RefreshProgress):
+    """Un refresh en segundo plano con su progreso por canal y por video."""
+
+    def __init__(self, channel_urls: List[str], trigger: str, summary_mode: str = "live"):
+        self.id = uuid.uuid4().hex[:12]
+        self.trigger = trigger
+        self.summary_mode = summary_mode
+        self.status = "running"
+        self.error: Optional[str] = None
+        self.created_at = datetime.now().isoformat()
+        self.finished_at: Optional[str] = None
+        self.channels: Dict[str, dict] = {
+            url: {"status": "pending", "videos_found": 0, "videos_done": 0, "error": None}
+            for url in channel_urls
+        }
+        self.videos: Dict[str, dict] = {}
+        self.result: Optional[list] = None
+        self.task: Optional[asyncio.Task] = None
+        self.lease_owner = f"{socket.gethostname()}:{os.getpid()}:{self.id}"
+        # Eventos para los clientes que siguen el job en streaming (SSE)
+        self.events: List[Tuple[str, dict]] = []
+        self._changed = asyncio.Event()
+
+    def _emit(self, event: str, data: dict):
+        self.events.append((event, data))
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def stream_events(self, start: int = 0):
+        """Genera (índice, evento, datos) desde start; termina con el evento done."""
+        index = start
+        while True:
+            changed = self._changed
+            while index < len(self.events):
+                event, data = self.events[index]
+                yield index, event, data
+                index += 1
+                if event == "done":
+                    return
+            await changed.wait()
+
+    def channel_started(self, channel_url: str):
+        self.channels[channel_url]["status"] = "discovering"
+
+    def channel_videos(self, channel_url: str, videos: List[VideoSummary]):
+        self.channels[channel_url]["status"] = "processing"
+        self.channels[channel_url]["videos_found"] = len(videos)
+        if videos:
+            self._emit("channel", {
+                "channel_name": videos[0].channel_name,
+                "channel_url": channel_url,
+                "videos_found": len(videos),
+            })
+        for video in videos:
+            self.videos[video.video_id] = {
+                "channel_url": channel_url,
+                "title": video.title,
+                "status": "pending",
+            }
+
+    def channel_finished(self, channel_url: str, error: Optional[str] = None):
+        self.channels[channel_url]["status"] = "failed" if error else "done"
+        self.channels[channel_url]["error"] = error
+        self.persist()
+
+    def video_status(self, video: VideoSummary, status: str):
+        self.videos[video.video_id]["status"] = status
+
+    def video_finished(self, video: VideoSummary, status: str):
+        self.videos[video.video_id]["status"] = status
+        self.channels[video.channel_url]["videos_done"] += 1
+        self._emit("video", video.dict())
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.status = status
+        self.error = error
+        self.finished_at = datetime.now().isoformat()
+        self._emit("done", {"job_id": self.id, "status": status, "error": error})
+        self.persist()
+
+    def persist(self):
+        """Guarda el estado del job en la base para que cualquier worker pueda responder GET /jobs/{id}."""
+        _snapshot_writer.submit(_save_snapshot, self.to_dict())
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "trigger": self.trigger,
+            "summary_mode": self.summary_mode,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "channels_total": len(self.channels),
+            "channels_done": sum(1 for c in self.channels.values() if c["status"] in ("done", "failed")),
+            "videos_total": len(self.videos),
+            "videos_done": sum(c["videos_done"] for c in self.channels.values()),
+            "channels": self.channels,
+            "videos": self.videos,
+            "result": self.result,
+        }
+
+class JobManager:
+    """
+    Ejecuta un solo refresh a la vez: si ya hay uno corriendo, las nuevas solicitudes se unen a él.
+    Con varios workers, el refresh además necesita el lease "refresh" de la base (en el directorio
+    de datos), así solo corre uno en todo el despliegue. Guarda los últimos REFRESH_JOB_HISTORY
+    jobs para poder consultar su estado.
+    """
+
+    def __init__(self, history: int = REFRESH_JOB_HISTORY):
+        self.history = history
+        self.jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+        self.current: Optional[RefreshJob] = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    async def start_refresh(
+        self,
+        trigger: str = "manual",
+        channel_urls: Optional[List[str]] = None,
+        summary_mode: str = "live",
+    ) -> Tuple[RefreshJob, bool]:
+        """
+        Devuelve (job, creado). Si hay un refresh corriendo en este worker devuelve ese job
+        (cualquiera sea su summary_mode); si corre en otro worker lanza RefreshLeaseHeld con el id de ese job.
+        """
+        if self.current is not None and self.current.status == "running":
+            return self.current, False
+        job = RefreshJob(channel_urls or await asyncio.to_thread(load_enabled_channels), trigger, summary_mode)
+        acquired = await asyncio.to_thread(
+            acquire_lease, REFRESH_LEASE, job.lease_owner, REFRESH_LEASE_TTL_SECONDS, {"job_id": job.id}
+        )
+        if not acquired:
+            lease = await asyncio.to_thread(get_lease, REFRESH_LEASE)
+            if self.current is not None and self.current.status == "running":
+                return self.current, False
+            raise RefreshLeaseHeld(lease or {"owner": "desconocido", "data": None})
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.history:
+            self.jobs.popitem(last=False)
+        self.current = job
+        job.persist()
+        job.task = asyncio.create_task(self._run(job))
+        return job, True
+
+    async def _keep_lease(self, job: RefreshJob, refresh: asyncio.Task, lease_lost: asyncio.Event):
+        while True:
+            await asyncio.sleep(REFRESH_LEASE_TTL_SECONDS / 3)
+            if not await asyncio.to_thread(renew_lease, REFRESH_LEASE, job.lease_owner, REFRESH_LEASE_TTL_SECONDS):
+                # Otro worker puede tomar el lease y lanzar su refresh: este se corta para no correr dos a la vez
+                log_print(f"⚠️ REFRESH {job.id} perdió el lease; se cancela", level=logging.WARNING)
+                lease_lost.set()
+                refresh.cancel()
+                return
+
+    async def _run(self, job: RefreshJob):
+        refresh_id.set(job.id)
+        log_print(f"🔄 INICIANDO REFRESH {job.id} ({job.trigger}, resúmenes {job.summary_mode}) - Buscando videos largos (EXCLUYENDO Shorts)")
+        refresh = asyncio.create_task(run_refresh(list(job.channels), progress=job, summary_mode=job.summary_mode))
+        lease_lost = asyncio.Event()
+        heartbeat = asyncio.create_task(self._keep_lease(job, refresh, lease_lost))
+        try:
+            videos = await refresh
+            job.result = group_by_channel(videos)
+            job.finish("completed")
+            log_print(f"✅ REFRESH {job.id} COMPLETADO - Total videos procesados: {len(videos)}")
+        except asyncio.CancelledError:
+            if not lease_lost.is_set():
+                refresh.cancel()
+                raise
+            # Lo ya resumido quedó guardado; el refresh que siga lo toma del cache
+            job.finish("failed", "Se perdió el lease del refresh")
+        except Exception as e:
+            job.finish("failed", str(e))
+            log_print(f"✗ REFRESH {job.id} FALLÓ: {e}", level=logging.ERROR, exc_info=True)
+        finally:
+            heartbeat.cancel()
+            await asyncio.to_thread(release_lease, REFRESH_LEASE, job.lease_owner)
+
+    def get(self, job_id: str) -> Optional[RefreshJob]:
+        """Job corriendo o reciente de este worker."""
+        return self.jobs.get(job_id)
+
+    async def get_status(self, job_id: str) -> Optional[dict]:
+        """Estado del job; si lo corre (o corrió) otro worker se lee el snapshot guardado."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return await asyncio.to_thread(get_job_snapshot, job_id)
+
+    def start_scheduler(self, interval_minutes: float = REFRESH_INTERVAL_MINUTES):
+        """Lanza refreshes periódicos para mantener los resúmenes al día (0 = desactivado)."""
+        if interval_minutes <= 0 or self._scheduler is not None:
+            return
+        self._scheduler = asyncio.create_task(self._schedule(interval_minutes))
+        log_print(f"⏰ Refresh automático cada {interval_minutes} minutos")
+
+    async def _schedule(self, interval_minutes: float):
+        while True:
+            try:
+                job, created = await self.start_refresh(trigger="scheduler")
+                if job.task is not None:
+                    await asyncio.shield(job.task)
+            except RefreshLeaseHeld as e:
+                log_print(f"⏰ Refresh automático omitido: {e}")
+            except Exception as e:
+                log_print(f"⏰ Error en el refresh automático: {e}")
+            await asyncio.sleep(interval_minutes * 60)
+
+    async def stop_scheduler(self):
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+
+job_manager = JobManager()
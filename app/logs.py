@@ -0,0 +1,120 @@
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Optional
+from app.config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE
+
+# Id del refresh en curso: lo fija el job (o run_refresh) y lo heredan las tareas y los threads
+# de asyncio.to_thread, así cada línea del refresh lleva el mismo refresh_id
+refresh_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("refresh_id", default=None)
+
+logger = logging.getLogger("pots")
+
+_stats_lock = threading.Lock()
+_stats = {"dropped": 0, "sampled_out": 0}
+_listener = None
+
+def _count(key: str):
+    with _stats_lock:
+        _stats[key] += 1
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro: hora, nivel, módulo, mensaje, refresh_id y los campos extra de log_print."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.module if record.name == logger.name else record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "refresh_id", None):
+            entry["refresh_id"] = record.refresh_id
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola el registro sin formatearlo (eso lo hace el thread del listener). En el thread que
+    loguea solo se resuelve el mensaje, el traceback si hay y el refresh_id del contexto.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if not hasattr(record, "refresh_id"):
+            record.refresh_id = refresh_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _count("dropped")
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Con la cola llena put_nowait fallaría; el listener sigue vaciándola, así que se espera
+        self.queue.put(self._sentinel)
+
+def configure_logging():
+    """
+    Manda todos los logs (también los de librerías que propagan al root) a una cola que vacía un
+    thread aparte hacia stdout. Se llama al importar el módulo; llamarla de nuevo no hace nada.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+    log_queue = queue.Queue(maxsize=max(0, LOG_QUEUE_SIZE))
+    root = logging.getLogger()
+    root.handlers = [_QueueHandler(log_queue)]
+    root.setLevel(LOG_LEVEL)
+    _listener = _QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    # Al salir se escribe lo que quedó en la cola
+    atexit.register(_listener.stop)
+
+def log_print(*args, level: int = logging.INFO, sample_rate: float = 1.0, exc_info: bool = False, **fields):
+    """
+    Loguea los argumentos como un print (separados por espacios). No escribe nada: encola el registro
+    y vuelve. fields se agregan como campos del JSON (p. ej. video_id=...); con sample_rate < 1 solo
+    se escribe esa fracción de las llamadas. Con exc_info, el traceback de la excepción en curso va
+    en el campo exc.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample_rate < 1 and random.random() >= sample_rate:
+        _count("sampled_out")
+        return
+    message = " ".join(str(arg) for arg in args)
+    logger.log(level, message, exc_info=exc_info, extra={"fields": fields} if fields else None, stacklevel=2)
+
+def get_stats() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "level": LOG_LEVEL,
+        "format": LOG_FORMAT,
+        "queued": _listener.queue.qsize() if _listener else 0,
+        "queue_size": LOG_QUEUE_SIZE,
+    })
+    return stats
+
+configure_logging()
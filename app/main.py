@@ -1,33 +1,37 @@
-import sys
+import json
+import asyncio
 import logging
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from datetime import datetime
-from app.config import YOUTUBE_CHANNEL_URLS, YOUTUBE_API_KEY
-from app.youtube_client import get_latest_videos
-from app.transcript_client import get_video_transcript
-from app.summarizer import summarize_transcript
-from app.storage import get_cached_summary, save_summary, get_all_summaries
-
-# Configurar logging para que se vea en uvicorn
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout)
-    ]
-)
-logger = logging.getLogger(__name__)
-
-def log_print(*args, **kwargs):
-    """Print que fuerza el flush para ver logs en tiempo real."""
-    message = ' '.join(str(arg) for arg in args)
-    logger.info(message)
-    print(*args, **kwargs)
-    sys.stdout.flush()
-
-app = FastAPI()
+from app.config import YOUTUBE_API_KEY
+from app.jobs import job_manager, RefreshLeaseHeld
+from app.batch_summarizer import batch_summarizer
+from app.summaries_view import summaries_view, InvalidCursor
+from app.search import search, InvalidQuery
+from app.youtube_client import video_details_batcher
+from app.http_clients import get_pool_stats
+from app import transcript_cache, summary_cache, resilience, logs
+from app.logs import configure_logging, log_print
+from app.channel_settings import channel_settings
+from app.transcript_client import transcript_limiter
+from app.metrics import registry, GAUGES
+
+# Logs asíncronos (JSON o texto, ver LOG_FORMAT); también los de las librerías que propagan al root
+configure_logging()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if YOUTUBE_API_KEY:
+        job_manager.start_scheduler()
+    batch_summarizer.start_poller()
+    yield
+    await job_manager.stop_scheduler()
+    await batch_summarizer.stop_poller()
+
+app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 
 @app.get("/", response_class=HTMLResponse)
@@ -37,26 +41,122 @@ async def read_root():
         html_content = f.read()
     return HTMLResponse(content=html_content)
 
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match con comparación débil: lista de ETags separados por comas, o "*"."""
+    def opaque(tag: str) -> str:
+        tag = tag.strip()
+        return tag[2:] if tag.startswith("W/") else tag
+    candidates = [tag.strip() for tag in if_none_match.split(",") if tag.strip()]
+    return "*" in candidates or opaque(etag) in {opaque(tag) for tag in candidates}
+
+def _accepts_gzip(accept_encoding: str) -> bool:
+    """Si Accept-Encoding acepta gzip (explícito o por "*"), respetando q=0 como rechazo."""
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    return qualities.get("gzip", qualities.get("*", 0.0)) > 0
+
 @app.get("/summaries")
-async def get_summaries():
-    """Get all cached summaries."""
-    summaries = get_all_summaries()
-    summaries_dict = {}
-    for summary in summaries:
-        channel_url = summary.channel_url
-        if channel_url not in summaries_dict:
-            summaries_dict[channel_url] = {
-                "channel_name": summary.channel_name,
-                "channel_url": channel_url,
-                "videos": []
-            }
-        summaries_dict[channel_url]["videos"].append(summary.dict())
-    result = [{"channel_name": v["channel_name"], "channel_url": v["channel_url"], "videos": v["videos"]} for v in summaries_dict.values()]
-    return JSONResponse(content=result)
+async def get_summaries(
+    request: Request,
+    channel: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+):
+    """
+    Cached summaries grouped by channel, newest first. Optional filters by channel URL and
+    published_at range; with limit only the newest N per channel are returned and each channel
+    carries a next_cursor to fetch the following page.
+    """
+    try:
+        view = await asyncio.to_thread(summaries_view.get, channel, since, until, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail={"error": "invalid_cursor", "message": str(e)})
+    headers = {"ETag": view.etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if _etag_matches(request.headers.get("if-none-match", ""), view.etag):
+        return Response(status_code=304, headers=headers)
+    if _accepts_gzip(request.headers.get("accept-encoding", "")):
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=view.gzipped, media_type="application/json", headers=headers)
+    return Response(content=view.body, media_type="application/json", headers=headers)
+
+@app.get("/search")
+async def search_videos(
+    q: str = Query(..., min_length=1, max_length=200),
+    channel: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Full-text search over titles, summaries and cached transcripts, best matches first.
+    Each result carries an HTML snippet with the matched terms in <mark>; next_offset fetches the following page.
+    """
+    try:
+        results = await asyncio.to_thread(search, q, channel, limit, offset)
+    except InvalidQuery as e:
+        raise HTTPException(status_code=400, detail={"error": "invalid_query", "message": str(e)})
+    return JSONResponse(content=results)
+
+@app.get("/stats")
+async def get_stats():
+    """Operational counters for the refresh pipeline."""
+    return JSONResponse(content={
+        "video_details_batching": video_details_batcher.get_stats(),
+        "http_pools": get_pool_stats(),
+        "transcript_cache": transcript_cache.get_stats(),
+        "transcript_tracks": transcript_cache.get_track_stats(),
+        "summary_cache": summary_cache.get_stats(),
+        "transcript_rate_limiter": transcript_limiter.get_stats(),
+        "summaries_view": summaries_view.get_stats(),
+        "summary_batches": batch_summarizer.get_stats(),
+        "channel_settings": channel_settings.get_stats(),
+        "circuit_breakers": resilience.get_stats(),
+        "logging": logs.get_stats(),
+    })
+
+def collect_component_gauges():
+    """Copia a gauges los valores instantáneos que ya exponen los componentes."""
+    limiter = transcript_limiter.get_stats()
+    GAUGES.set(limiter["rate_per_second"], component="transcript_rate_limiter", field="rate_per_second")
+    cache = transcript_cache.get_stats()
+    for field in ("entries", "blobs", "raw_bytes", "compressed_bytes"):
+        GAUGES.set(cache[field], component="transcript_cache", field=field)
+    GAUGES.set(summary_cache.get_stats()["entries"], component="summary_cache", field="entries")
+    for upstream, pool in get_pool_stats().items():
+        GAUGES.set(pool["in_flight"], component=f"http_pool_{upstream}", field="in_flight")
+        GAUGES.set(pool["peak_in_flight"], component=f"http_pool_{upstream}", field="peak_in_flight")
+    # 0 = cerrado, 1 = half_open, 2 = abierto
+    for upstream, breaker in resilience.upstream_breakers.items():
+        state = breaker.get_stats()["state"]
+        GAUGES.set(("closed", "half_open", "open").index(state), component=f"circuit_breaker_{upstream}", field="state")
+
+registry.add_collector(collect_component_gauges)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of latencies, cache hit ratios, retries, quota and token usage."""
+    content = await asyncio.to_thread(registry.render)
+    return PlainTextResponse(content=content, media_type="text/plain; version=0.0.4")
 
 @app.post("/refresh")
-async def refresh_summaries():
-    """Refresh summaries by fetching latest videos and generating summaries."""
+async def refresh_summaries(mode: str = Query("live", pattern="^(live|batch)$")):
+    """
+    Start (or join) a background refresh job and return its id right away.
+    mode=batch queues new summaries for the OpenAI Batch API instead of summarizing them live.
+    """
     # Validación temprana: verificar que YOUTUBE_API_KEY esté configurada
     if not YOUTUBE_API_KEY:
         error_msg = (
@@ -67,10 +167,7 @@ async def refresh_summaries():
             "3. Obtén tu API key en: https://console.cloud.google.com/apis/credentials\n\n"
             "Sin la API key, no es posible obtener videos de YouTube."
         )
-        log_print("\n" + "="*80)
-        log_print(error_msg)
-        log_print("="*80 + "\n")
-        logger.error(error_msg)
+        log_print(error_msg, level=logging.ERROR)
         raise HTTPException(
             status_code=400,
             detail={
@@ -80,67 +177,42 @@ async def refresh_summaries():
             }
         )
     
-    logger.info("="*80)
-    logger.info("🔄 INICIANDO REFRESH - Buscando videos largos (EXCLUYENDO Shorts)")
-    logger.info("="*80)
-    log_print("\n" + "="*80)
-    log_print("🔄 INICIANDO REFRESH - Buscando videos largos (EXCLUYENDO Shorts)")
-    log_print("="*80)
-    all_videos = []
-    for channel_url in YOUTUBE_CHANNEL_URLS:
-        try:
-            log_print(f"\nProcesando canal: {channel_url}")
-            videos = get_latest_videos(channel_url)
-            log_print(f"  Videos encontrados: {len(videos)}")
-            for video in videos:
-                cached = get_cached_summary(video.video_id)
-                if cached and cached.summary:
-                    video.summary = cached.summary
-                    video.has_transcript = cached.has_transcript
-                    video.generated_at = cached.generated_at
-                    log_print(f"  [CACHE] Video ya procesado: {video.title[:60]}...")
-                else:
-                    log_print(f"  Procesando video: {video.title[:60]}... (ID: {video.video_id})")
-                    transcript = get_video_transcript(video.video_id)
-                    if transcript:
-                        log_print(f"    ✓ Transcript obtenido ({len(transcript)} caracteres)")
-                        video.has_transcript = True
-                        try:
-                            summary_text = summarize_transcript(transcript, video.title, video.channel_name)
-                            if summary_text and not summary_text.startswith("Error"):
-                                video.summary = summary_text
-                                log_print(f"    ✓ Resumen generado exitosamente")
-                            else:
-                                video.summary = "Hubo un error generando el resumen."
-                                log_print(f"    ✗ Error en el resumen")
-                        except Exception as e:
-                            log_print(f"    ✗ Error generating summary: {e}")
-                            video.summary = "Hubo un error generando el resumen."
-                        video.generated_at = datetime.now().isoformat()
-                    else:
-                        log_print(f"    ✗ No se pudo obtener transcript para {video.video_id}")
-                        video.has_transcript = False
-                        video.summary = "No hay transcripción disponible para este video."
-                    save_summary(video)
-                all_videos.append(video)
-        except Exception as e:
-            log_print(f"Error processing channel {channel_url}: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
-    summaries_dict = {}
-    for video in all_videos:
-        channel_url = video.channel_url
-        if channel_url not in summaries_dict:
-            summaries_dict[channel_url] = {
-                "channel_name": video.channel_name,
-                "channel_url": channel_url,
-                "videos": []
-            }
-        summaries_dict[channel_url]["videos"].append(video.dict())
-    result = [{"channel_name": v["channel_name"], "channel_url": v["channel_url"], "videos": v["videos"]} for v in summaries_dict.values()]
-    log_print("="*80)
-    log_print(f"✅ REFRESH COMPLETADO - Total videos procesados: {len(all_videos)}")
-    log_print("="*80 + "\n")
-    return JSONResponse(content=result)
+    try:
+        job, created = await job_manager.start_refresh(summary_mode=mode)
+    except RefreshLeaseHeld as e:
+        # El refresh corre en otro worker: se devuelve su job, que se consulta con GET /jobs/{job_id}
+        log_print(f"{e}; la solicitud se une a ese job")
+        return JSONResponse(status_code=202, content={"job_id": e.job_id, "status": "running", "joined": True})
+    if not created:
+        log_print(f"Refresh {job.id} ya en curso; la solicitud se une a ese job")
+    return JSONResponse(status_code=202, content={"job_id": job.id, "status": job.status, "joined": not created})
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Progress of a background refresh job, whichever worker is running it."""
+    status = await job_manager.get_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail={"error": "Job no encontrado", "message": f"No existe el job {job_id}"})
+    return JSONResponse(content=status)
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream a refresh job as Server-Sent Events: each VideoSummary as soon as it is ready, then done.
+    Only the worker running the job can stream it; elsewhere this is a 404 and the client polls GET /jobs/{job_id}.
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail={"error": "Job no encontrado", "message": f"No existe el job {job_id}"})
+    last_event_id = request.headers.get("last-event-id")
+    start = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+    async def event_source():
+        async for index, event, data in job.stream_events(start):
+            yield f"id: {index}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,206 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Buckets de latencia (segundos): desde consultas a SQLite hasta resúmenes largos de OpenAI
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name}: se esperaban las etiquetas {self.labelnames}, llegaron {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # Por combinación de etiquetas: [conteos por bucket (no acumulados), suma, cantidad]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Mide la duración del bloque (también si termina con una excepción)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ("le",), key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Registry:
+    """Conjunto de métricas del proceso, expuesto en formato de texto de Prometheus."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Función que actualiza gauges justo antes de cada scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self._collectors:
+            collector()
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "pots_stage_duration_seconds",
+    "Duración de cada etapa del refresh.",
+    ["stage"],
+))
+UPSTREAM_SECONDS = registry.register(Histogram(
+    "pots_upstream_request_duration_seconds",
+    "Latencia de las peticiones HTTP por upstream.",
+    ["upstream"],
+))
+UPSTREAM_REQUESTS = registry.register(Counter(
+    "pots_upstream_requests_total",
+    "Peticiones HTTP por upstream y código de estado.",
+    ["upstream", "status"],
+))
+RATE_LIMITED = registry.register(Counter(
+    "pots_rate_limited_total",
+    "Respuestas 429 (o equivalentes) recibidas por upstream.",
+    ["upstream"],
+))
+RETRIES = registry.register(Counter(
+    "pots_retries_total",
+    "Reintentos por operación.",
+    ["operation"],
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "pots_cache_requests_total",
+    "Consultas a los caches locales por resultado (hit/miss).",
+    ["cache", "result"],
+))
+YOUTUBE_QUOTA_UNITS = registry.register(Counter(
+    "pots_youtube_quota_units_total",
+    "Unidades de cuota de la YouTube Data API consumidas por endpoint.",
+    ["endpoint"],
+))
+OPENAI_TOKENS = registry.register(Counter(
+    "pots_openai_tokens_total",
+    "Tokens de OpenAI usados por modelo y tipo.",
+    ["model", "kind"],
+))
+REFRESH_VIDEOS = registry.register(Counter(
+    "pots_refresh_videos_total",
+    "Videos procesados por el refresh según su resultado.",
+    ["status"],
+))
+CIRCUIT_BREAKER_EVENTS = registry.register(Counter(
+    "pots_circuit_breaker_events_total",
+    "Aperturas de circuit breakers y llamadas rechazadas por un circuito abierto.",
+    ["breaker", "event"],
+))
+HEDGED_REQUESTS = registry.register(Counter(
+    "pots_hedged_requests_total",
+    "Peticiones duplicadas por hedging y cuántas veces ganó la duplicada.",
+    ["upstream", "result"],
+))
+GAUGES = registry.register(Gauge(
+    "pots_component_value",
+    "Valores instantáneos de los componentes (tasa del limitador, tamaño de caches).",
+    ["component", "field"],
+))
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
@@ -0,0 +1,276 @@
+import time
+import uuid
+import asyncio
+import logging
+from datetime import datetime
+from typing import List, Optional
+from app.config import (
+    OPENAI_API_KEY,
+    YOUTUBE_API_KEY,
+    REFRESH_PROCESSES,
+    REFRESH_SHARD_SIZE,
+    REFRESH_CHANNEL_CONCURRENCY,
+    REFRESH_TRANSCRIPT_CONCURRENCY,
+    REFRESH_SUMMARY_CONCURRENCY,
+    REFRESH_DEADLINE_SECONDS,
+)
+from app.models import VideoSummary
+from app.channel_settings import channel_settings, load_enabled_channels
+from app.youtube_client import discover_uploads, select_latest_videos, video_details_batcher
+from app.transcript_client import get_video_transcript
+from app.summarizer import summarize_transcript, cached_summary
+from app.batch_summarizer import batch_summarizer
+from app.storage import get_cached_summary, save_summary
+from app.resilience import CircuitOpen, channel_circuit_open, record_channel_result
+from app.metrics import REFRESH_VIDEOS, record_cache
+from app.logs import log_print, refresh_id
+
+class RefreshProgress:
+    """Receptor de eventos de progreso del pipeline; por defecto no hace nada."""
+
+    def channel_started(self, channel_url: str):
+        pass
+
+    def channel_videos(self, channel_url: str, videos: List[VideoSummary]):
+        pass
+
+    def channel_finished(self, channel_url: str, error: Optional[str] = None):
+        pass
+
+    def video_status(self, video: VideoSummary, status: str):
+        pass
+
+    def video_finished(self, video: VideoSummary, status: str):
+        pass
+
+class RefreshPipeline:
+    """
+    Pipeline de refresh en etapas: descubrimiento de canales, metadata de videos (en lotes
+    compartidos entre canales), obtención de transcripts y resúmenes. Cada etapa tiene su propio
+    límite de concurrencia y las llamadas bloqueantes corren en threads para no bloquear el event
+    loop. El orden de los resultados es el mismo que el del recorrido secuencial.
+    Con summary_mode="batch" los transcripts nuevos no se resumen en vivo: sus prompts se encolan
+    para la Batch API de OpenAI (ver app.batch_summarizer) y el video queda con estado "batched".
+    Los canales con el circuito abierto (ver app.resilience) se saltean, y un video cuyo upstream
+    tiene el circuito abierto ("circuit_open") o que llega a una etapa después del deadline
+    ("deadline") no se guarda: conserva lo cacheado y se procesa en el próximo refresh.
+    """
+
+    def __init__(
+        self,
+        channel_concurrency: int = REFRESH_CHANNEL_CONCURRENCY,
+        transcript_concurrency: int = REFRESH_TRANSCRIPT_CONCURRENCY,
+        summary_concurrency: int = REFRESH_SUMMARY_CONCURRENCY,
+        progress: Optional[RefreshProgress] = None,
+        summary_mode: str = "live",
+        deadline: Optional[float] = None,
+    ):
+        self.progress = progress or RefreshProgress()
+        # Hora límite del refresh (time.time()); None = sin límite
+        self.deadline = deadline
+        # Canales salteados en el descubrimiento y el motivo
+        self.skipped = {}
+        # Sin API key no hay batch que enviar: el camino en vivo devuelve el error de siempre
+        self.summary_mode = summary_mode if OPENAI_API_KEY else "live"
+        self.channel_limit = asyncio.Semaphore(max(1, channel_concurrency))
+        self.transcript_limit = asyncio.Semaphore(max(1, transcript_concurrency))
+        self.summary_limit = asyncio.Semaphore(max(1, summary_concurrency))
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    async def run(self, channel_urls: List[str]) -> List[VideoSummary]:
+        """Procesa todos los canales y devuelve los videos en el orden de los canales."""
+        # La configuración por canal se revisa una vez por refresh; durante el refresh no cambia
+        await asyncio.to_thread(channel_settings.reload_if_changed)
+        # 1) Descubrimiento de candidatos por canal
+        discoveries = await asyncio.gather(*(self.discover_channel(url) for url in channel_urls))
+        # 2) Metadata de todos los canales en lotes compartidos de videos.list
+        ids_by_channel = {d["channel_url"]: d["video_ids"] for d in discoveries if d and d["video_ids"]}
+        metadata = await asyncio.to_thread(video_details_batcher.fetch_metadata, ids_by_channel) if ids_by_channel else {}
+        # 3) Filtrado, transcripts y resúmenes por canal
+        for channel_url, discovery in zip(channel_urls, discoveries):
+            if not discovery or not discovery["video_ids"]:
+                self.progress.channel_finished(
+                    channel_url, None if discovery else self.skipped.get(channel_url, "No se pudo descubrir el canal")
+                )
+        per_channel = await asyncio.gather(
+            *(self.process_channel(d, metadata) for d in discoveries if d and d["video_ids"])
+        )
+        return [video for videos in per_channel for video in videos]
+
+    async def discover_channel(self, channel_url: str) -> Optional[dict]:
+        try:
+            async with self.channel_limit:
+                if self.expired():
+                    self.skipped[channel_url] = "Tiempo límite del refresh alcanzado"
+                    return None
+                retry_in = await asyncio.to_thread(channel_circuit_open, channel_url)
+                if retry_in is not None:
+                    self.skipped[channel_url] = f"Canal salteado por fallas repetidas (reintento en {retry_in:.0f}s)"
+                    log_print(f"{self.skipped[channel_url]}: {channel_url}")
+                    return None
+                self.progress.channel_started(channel_url)
+                log_print(f"Procesando canal: {channel_url}")
+                discovery = await asyncio.to_thread(discover_uploads, channel_url)
+        except CircuitOpen as e:
+            # El upstream está caído: no cuenta como falla del canal
+            self.skipped[channel_url] = str(e)
+            log_print(f"Canal salteado {channel_url}: {e}")
+            return None
+        except Exception as e:
+            log_print(f"Error processing channel {channel_url}: {e}", level=logging.ERROR, exc_info=True)
+            discovery = None
+        # Sin YOUTUBE_API_KEY no se descubre ningún canal y no es culpa de los canales
+        if discovery is not None or YOUTUBE_API_KEY:
+            await asyncio.to_thread(
+                record_channel_result, channel_url, None if discovery else "No se pudo descubrir el canal"
+            )
+        return discovery
+
+    async def process_channel(self, discovery: dict, metadata: dict) -> List[VideoSummary]:
+        channel_url = discovery["channel_url"]
+        try:
+            videos = await asyncio.to_thread(select_latest_videos, discovery, metadata)
+            log_print(f"  Videos encontrados: {len(videos)} ({channel_url})")
+            self.progress.channel_videos(channel_url, videos)
+            processed = list(await asyncio.gather(*(self.process_video(video) for video in videos)))
+            self.progress.channel_finished(channel_url)
+            return processed
+        except Exception as e:
+            log_print(f"Error processing channel {channel_url}: {e}", level=logging.ERROR, exc_info=True)
+            await asyncio.to_thread(record_channel_result, channel_url, str(e))
+            self.progress.channel_finished(channel_url, str(e))
+            return []
+
+    async def process_video(self, video: VideoSummary) -> VideoSummary:
+        cached = await asyncio.to_thread(get_cached_summary, video.video_id)
+        record_cache("summary", bool(cached and cached.summary))
+        if cached and cached.summary:
+            video.summary = cached.summary
+            video.has_transcript = cached.has_transcript
+            video.generated_at = cached.generated_at
+            log_print(f"  [CACHE] Video ya procesado: {video.title[:60]}...")
+            self.progress.video_finished(video, "cached")
+            REFRESH_VIDEOS.inc(status="cached")
+            return video
+
+        if self.summary_mode == "batch" and await asyncio.to_thread(batch_summarizer.is_queued, video.video_id):
+            log_print(f"  [BATCH] Resumen ya encolado: {video.title[:60]}...")
+            self.progress.video_finished(video, "batched")
+            REFRESH_VIDEOS.inc(status="batched")
+            return video
+
+        log_print(
+            f"  Procesando video: {video.title[:60]}... (ID: {video.video_id})",
+            video_id=video.video_id,
+            channel_url=video.channel_url,
+        )
+        async with self.transcript_limit:
+            if self.expired():
+                return self.skip_video(video, "deadline")
+            self.progress.video_status(video, "transcript")
+            try:
+                transcript = await asyncio.to_thread(
+                    get_video_transcript, video.video_id, channel_settings.get(video.channel_url).languages, video.channel_url
+                )
+            except CircuitOpen as e:
+                return self.skip_video(video, "circuit_open", str(e))
+        if transcript:
+            log_print(f"    ✓ Transcript obtenido ({len(transcript)} caracteres) - {video.video_id}")
+            video.has_transcript = True
+            status = "summarized"
+            summary_text = None
+            if self.summary_mode == "batch":
+                # Un transcript idéntico ya resumido no se manda al batch
+                summary_text = await asyncio.to_thread(cached_summary, transcript)
+                if not summary_text:
+                    requests = await asyncio.to_thread(batch_summarizer.enqueue, video, transcript)
+                    log_print(f"    ✓ Resumen encolado para la Batch API ({requests} prompts) - {video.video_id}")
+                    # Se guarda cuando llega el resultado del batch
+                    self.progress.video_finished(video, "batched")
+                    REFRESH_VIDEOS.inc(status="batched")
+                    return video
+            try:
+                if summary_text is None:
+                    async with self.summary_limit:
+                        if self.expired():
+                            return self.skip_video(video, "deadline")
+                        self.progress.video_status(video, "summarizing")
+                        summary_text = await asyncio.to_thread(
+                            summarize_transcript, transcript, video.title, video.channel_name
+                        )
+                if summary_text and not summary_text.startswith("Error"):
+                    video.summary = summary_text
+                    log_print(f"    ✓ Resumen generado exitosamente - {video.video_id}")
+                else:
+                    video.summary = "Hubo un error generando el resumen."
+                    status = "summary_error"
+                    log_print(f"    ✗ Error en el resumen - {video.video_id}")
+            except CircuitOpen as e:
+                return self.skip_video(video, "circuit_open", str(e))
+            except Exception as e:
+                log_print(f"    ✗ Error generating summary: {e}")
+                video.summary = "Hubo un error generando el resumen."
+                status = "summary_error"
+            video.generated_at = datetime.now().isoformat()
+        else:
+            log_print(f"    ✗ No se pudo obtener transcript para {video.video_id}")
+            video.has_transcript = False
+            video.summary = "No hay transcripción disponible para este video."
+            status = "no_transcript"
+        await asyncio.to_thread(save_summary, video)
+        self.progress.video_finished(video, status)
+        REFRESH_VIDEOS.inc(status=status)
+        return video
+
+    def skip_video(self, video: VideoSummary, status: str, reason: str = "tiempo límite del refresh") -> VideoSummary:
+        """Termina el video sin guardar nada, así el próximo refresh lo vuelve a intentar."""
+        log_print(f"    ⏭ Video salteado ({reason}) - {video.video_id}")
+        self.progress.video_finished(video, status)
+        REFRESH_VIDEOS.inc(status=status)
+        return video
+
+async def run_refresh(
+    channel_urls: Optional[List[str]] = None,
+    progress: Optional[RefreshProgress] = None,
+    summary_mode: str = "live",
+) -> List[VideoSummary]:
+    """
+    Ejecuta el refresh completo con los límites de concurrencia configurados. Con REFRESH_PROCESSES > 0
+    y más de un shard de canales, el refresh se reparte en procesos (ver app.sharding).
+    En modo batch, al terminar se envían a la Batch API los prompts encolados.
+    Con REFRESH_DEADLINE_SECONDS, lo que no empezó antes del deadline queda para el próximo refresh.
+    """
+    if refresh_id.get() is None:
+        # Refresh sin job (p. ej. los benchmarks): el id vale para la tarea actual y lo que lance
+        refresh_id.set(uuid.uuid4().hex[:12])
+    if channel_urls is None:
+        channel_urls = await asyncio.to_thread(load_enabled_channels)
+    deadline = time.time() + REFRESH_DEADLINE_SECONDS if REFRESH_DEADLINE_SECONDS > 0 else None
+    if REFRESH_PROCESSES > 0 and len(channel_urls) > REFRESH_SHARD_SIZE:
+        from app.sharding import ShardedRefresh
+        videos = await ShardedRefresh(progress=progress, summary_mode=summary_mode, deadline=deadline).run(channel_urls)
+    else:
+        videos = await RefreshPipeline(progress=progress, summary_mode=summary_mode, deadline=deadline).run(channel_urls)
+    if summary_mode == "batch" and OPENAI_API_KEY:
+        try:
+            await asyncio.to_thread(batch_summarizer.run_cycle)
+        except Exception as e:
+            # Lo que quedó en la cola se envía en el próximo ciclo periódico
+            log_print(f"✗ No se pudo enviar el batch de resúmenes: {e}")
+    return videos
+
+def group_by_channel(videos: List[VideoSummary]) -> List[dict]:
+    """Agrupa los videos por canal respetando el orden de aparición."""
+    summaries_dict = {}
+    for video in videos:
+        channel_url = video.channel_url
+        if channel_url not in summaries_dict:
+            summaries_dict[channel_url] = {
+                "channel_name": video.channel_name,
+                "channel_url": channel_url,
+                "videos": []
+            }
+        summaries_dict[channel_url]["videos"].append(video.dict())
+    return list(summaries_dict.values())
@@ -0,0 +1,89 @@
+import time
+import random
+import threading
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket compartido por todos los threads del proceso, con adaptación AIMD:
+    cada éxito suma increase_step peticiones/s (hasta max_rate) y cada throttle (429)
+    multiplica la tasa por decrease_factor (hasta min_rate) y vacía el bucket.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_rate: float,
+        min_rate: float,
+        max_rate: float,
+        increase_step: float = 0.05,
+        decrease_factor: float = 0.5,
+        burst: float = 1.0,
+    ):
+        self.name = name
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+        self.successes = 0
+        self.throttles = 0
+        self.total_wait_seconds = 0.0
+        self.last_throttle_at = None
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+    def acquire(self):
+        """Bloquea hasta que haya un token disponible."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+                self.total_wait_seconds += wait
+            time.sleep(wait)
+
+    def scale(self, factor: float):
+        """Reparte la tasa: un proceso que recibe una fracción de la cuota global escala mínimo, máximo y tasa actual."""
+        with self._lock:
+            self.min_rate *= factor
+            self.max_rate *= factor
+            self.rate *= factor
+
+    def on_success(self):
+        with self._lock:
+            self.successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self._tokens = 0
+            self.last_throttle_at = time.time()
+
+    @staticmethod
+    def backoff_delay(attempt: int, base_seconds: float, cap_seconds: float = 60.0) -> float:
+        """Backoff exponencial con jitter completo: uniforme entre 0 y base * 2^(intento-1)."""
+        return random.uniform(0, min(cap_seconds, base_seconds * (2 ** (attempt - 1))))
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_second": round(self.rate, 3),
+                "min_rate": self.min_rate,
+                "max_rate": self.max_rate,
+                "successes": self.successes,
+                "throttles": self.throttles,
+                "total_wait_seconds": round(self.total_wait_seconds, 3),
+                "last_throttle_at": self.last_throttle_at,
+            }
@@ -0,0 +1,228 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from typing import Callable, Optional, Tuple
+from app.config import (
+    CIRCUIT_BREAKER_FAILURES,
+    CIRCUIT_BREAKER_RESET_SECONDS,
+    CHANNEL_BREAKER_FAILURES,
+    CHANNEL_BREAKER_RESET_SECONDS,
+    HTTP_HEDGE_PERCENTILE,
+    HTTP_HEDGE_MIN_SAMPLES,
+)
+from app.storage import get_connection, write_transaction
+from app.metrics import CIRCUIT_BREAKER_EVENTS
+
+class CircuitOpen(RuntimeError):
+    """La llamada se rechazó sin intentarla porque el circuito del upstream está abierto."""
+
+class CircuitBreaker:
+    """
+    Circuit breaker de un upstream (en memoria, por proceso). Cerrado: todo pasa. Después de
+    failure_threshold fallas seguidas se abre y rechaza las llamadas con CircuitOpen, sin esperar
+    timeouts. Pasados reset_seconds deja pasar una sola llamada de prueba (half_open): si sale bien
+    se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_BREAKER_FAILURES, reset_seconds: float = CIRCUIT_BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    def before_call(self):
+        """Lanza CircuitOpen si la llamada no puede pasar."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_seconds - (time.monotonic() - self.opened_at))
+        CIRCUIT_BREAKER_EVENTS.inc(breaker=self.name, event="rejected")
+        raise CircuitOpen(f"circuito de {self.name} abierto (reintento en {retry_in:.0f}s)")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_ignored(self):
+        """La llamada falló por algo que no indica una caída del upstream: no cambia el estado."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                opened = True
+            else:
+                opened = False
+        if opened:
+            CIRCUIT_BREAKER_EVENTS.inc(breaker=self.name, event="opened")
+
+    @contextmanager
+    def call(self, is_failure: Callable[[Exception], bool] = lambda error: True):
+        """
+        Envuelve una llamada. Las excepciones para las que is_failure da True cuentan como falla;
+        las demás (p. ej. un 429 o un 400) se relanzan sin afectar al circuito.
+        """
+        self.before_call()
+        try:
+            yield
+        except Exception as e:
+            if is_failure(e):
+                self.record_failure()
+            else:
+                self.record_ignored()
+            raise
+        self.record_success()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+upstream_breakers = {name: CircuitBreaker(name) for name in ("youtube_api", "youtube_web", "openai")}
+
+class LatencyTracker:
+    """Latencias recientes de un upstream, para decidir cuándo una petición ya tarda demasiado."""
+
+    def __init__(self, percentile: float = HTTP_HEDGE_PERCENTILE, min_samples: int = HTTP_HEDGE_MIN_SAMPLES, window: int = 500):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> Optional[float]:
+        """Latencia del percentil configurado, o None si el hedging está desactivado o faltan muestras."""
+        if self.percentile <= 0:
+            return None
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))]
+
+# Threads de las peticiones con hedging (la original y la duplicada)
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="hedge")
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+def hedged_call(call: Callable, delay: float) -> Tuple[object, bool, bool]:
+    """
+    Corre call; si no terminó en delay segundos lanza una segunda copia y devuelve la primera que
+    termina bien. Devuelve (resultado, si se duplicó, si ganó la copia). La respuesta que pierde se
+    cierra al llegar para devolver su conexión al pool. Solo para peticiones idempotentes.
+    """
+    primary = _hedge_executor.submit(call)
+    try:
+        return primary.result(timeout=delay), False, False
+    except FutureTimeout:
+        pass
+    backup = _hedge_executor.submit(call)
+    pending = {primary, backup}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        succeeded = [future for future in done if future.exception() is None]
+        if succeeded or not pending:
+            winner = succeeded[0] if succeeded else primary
+            for loser in (done | pending) - {winner}:
+                loser.add_done_callback(_close_response)
+            return winner.result(), True, winner is backup
+
+# Circuit breaker por canal: persistido en la base para que valga entre refreshes, workers y shards
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_breakers (
+    channel_url TEXT PRIMARY KEY,
+    failures INTEGER NOT NULL,
+    open_until REAL NOT NULL,
+    last_error TEXT,
+    updated_at REAL NOT NULL
+);
+"""
+
+_schema_ready = False
+
+def _connection():
+    global _schema_ready
+    conn = get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+def channel_circuit_open(channel_url: str) -> Optional[float]:
+    """Segundos que faltan para volver a intentar el canal, o None si el canal se puede procesar."""
+    row = _connection().execute(
+        "SELECT open_until FROM channel_breakers WHERE channel_url = ?", (channel_url,)
+    ).fetchone()
+    if row is None:
+        return None
+    remaining = row["open_until"] - time.time()
+    if remaining <= 0:
+        return None
+    CIRCUIT_BREAKER_EVENTS.inc(breaker="channel", event="rejected")
+    return remaining
+
+def record_channel_result(channel_url: str, error: Optional[str] = None):
+    """Un canal que se procesó bien se olvida; uno que falló suma una falla y abre su circuito al llegar al umbral."""
+    conn = _connection()
+    with write_transaction():
+        if error is None:
+            conn.execute("DELETE FROM channel_breakers WHERE channel_url = ?", (channel_url,))
+            return
+        row = conn.execute("SELECT failures FROM channel_breakers WHERE channel_url = ?", (channel_url,)).fetchone()
+        failures = (row["failures"] if row else 0) + 1
+        now = time.time()
+        open_until = now + CHANNEL_BREAKER_RESET_SECONDS if failures >= CHANNEL_BREAKER_FAILURES else 0
+        conn.execute(
+            "INSERT OR REPLACE INTO channel_breakers (channel_url, failures, open_until, last_error, updated_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (channel_url, failures, open_until, error, now),
+        )
+    if open_until:
+        CIRCUIT_BREAKER_EVENTS.inc(breaker="channel", event="opened")
+
+def get_stats() -> dict:
+    now = time.time()
+    channels = {
+        row["channel_url"]: {
+            "failures": row["failures"],
+            "open_for_seconds": round(max(0.0, row["open_until"] - now)),
+            "last_error": row["last_error"],
+        }
+        for row in _connection().execute("SELECT * FROM channel_breakers ORDER BY channel_url").fetchall()
+    }
+    return {
+        "upstreams": {name: breaker.get_stats() for name, breaker in upstream_breakers.items()},
+        "channels": channels,
+    }
@@ -0,0 +1,152 @@
+import re
+import html
+import unicodedata
+from typing import List, Optional
+from app.storage import SUMMARY_FIELDS
+from app.transcript_cache import search_connection, peek_transcript
+from app.metrics import STAGE_SECONDS
+
+# Pesos de bm25 por columna de summaries_fts (title, summary, channel_name); las coincidencias
+# en el transcript suman con menos peso que las del título o el resumen
+COLUMN_WEIGHTS = (4.0, 2.0, 1.0)
+TRANSCRIPT_WEIGHT = 0.5
+SNIPPET_TOKENS = 24
+SNIPPET_CHARS = 160
+# Marcadores del snippet de FTS5: se cambian por <mark> después de escapar el texto
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+# Ranking de todas las coincidencias (solo bm25, que sale del índice); los snippets se calculan
+# después y únicamente para la página pedida
+_RANKED_SQL = f"""
+WITH matches AS (
+    SELECT rowid AS id, bm25(summaries_fts, {", ".join(str(weight) for weight in COLUMN_WEIGHTS)}) AS score, 'summary' AS source
+    FROM summaries_fts WHERE summaries_fts MATCH :query
+    UNION ALL
+    SELECT s.rowid, :transcript_weight * bm25(transcripts_fts), 'transcript'
+    FROM transcripts_fts
+    JOIN transcript_search ts ON ts.rowid = transcripts_fts.rowid
+    JOIN summaries s ON s.video_id = ts.video_id
+    WHERE transcripts_fts MATCH :query
+),
+ranked AS (
+    SELECT id, SUM(score) AS score, GROUP_CONCAT(source) AS sources FROM matches GROUP BY id
+)
+SELECT {{columns}}
+FROM ranked r JOIN summaries s ON s.rowid = r.id
+WHERE :channel_url IS NULL OR s.channel_url = :channel_url
+"""
+_PAGE_SQL = _RANKED_SQL.format(
+    columns="s.rowid, s.*, r.score, r.sources, COUNT(*) OVER () AS total"
+) + "ORDER BY r.score, s.published_at DESC LIMIT :limit OFFSET :offset"
+_COUNT_SQL = _RANKED_SQL.format(columns="COUNT(*) AS total")
+_SNIPPETS_SQL = f"""
+SELECT rowid, snippet(summaries_fts, 1, '{_MARK_START}', '{_MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet
+FROM summaries_fts WHERE summaries_fts MATCH ? AND rowid IN ({{placeholders}})
+"""
+
+class InvalidQuery(ValueError):
+    pass
+
+def parse_terms(query: str) -> List[str]:
+    """Palabras y frases entre comillas de la búsqueda."""
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', query):
+        text = " ".join(re.findall(r"\w+", phrase or word))
+        if text:
+            terms.append(text)
+    return terms
+
+def build_match_query(query: str) -> str:
+    """
+    Consulta FTS5 equivalente: todos los términos (AND), las frases entre comillas como frase y la
+    última palabra como prefijo, para que la búsqueda funcione mientras se escribe.
+    """
+    terms = parse_terms(query)
+    if not terms:
+        raise InvalidQuery(f"Búsqueda inválida: {query!r}")
+    parts = [f'"{term}"' for term in terms]
+    if not query.rstrip().endswith('"') and len(terms[-1]) >= 3:
+        parts[-1] += "*"
+    return " ".join(parts)
+
+def _fold(text: str) -> str:
+    # Minúsculas y sin tildes, carácter por carácter para que las posiciones coincidan con el original
+    return "".join(unicodedata.normalize("NFD", ch.lower())[0] for ch in text)
+
+def _mark(text: str) -> str:
+    return html.escape(text).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+def transcript_snippet(text: str, terms: List[str]) -> Optional[str]:
+    """Fragmento del transcript alrededor de la primera coincidencia, con los términos marcados."""
+    folded = _fold(text)
+    patterns = [r"\W+".join(re.escape(_fold(word)) for word in term.split()) for term in terms]
+    regex = re.compile(r"\b(?:" + "|".join(patterns) + ")")
+    first = regex.search(folded)
+    if first is None:
+        return None
+    start = max(0, first.start() - SNIPPET_CHARS // 3)
+    if start:
+        start = text.rfind(" ", 0, start) + 1
+    end = min(len(text), start + SNIPPET_CHARS)
+    if end < len(text) and text.rfind(" ", first.end(), end) > 0:
+        end = text.rfind(" ", first.end(), end)
+    pieces = ["…" if start else ""]
+    cursor = start
+    for match in regex.finditer(folded, start, end):
+        pieces.append(html.escape(text[cursor:match.start()]))
+        pieces.append(f"<mark>{html.escape(text[match.start():match.end()])}</mark>")
+        cursor = match.end()
+    pieces.append(html.escape(text[cursor:end]))
+    pieces.append("…" if end < len(text) else "")
+    return "".join(pieces)
+
+@STAGE_SECONDS.time(stage="search")
+def search(query: str, channel_url: Optional[str] = None, limit: int = 20, offset: int = 0) -> dict:
+    """
+    Búsqueda de texto completo en títulos, resúmenes y transcripts cacheados, mejores coincidencias
+    primero. Cada resultado trae un snippet HTML con los términos en <mark>: del resumen si coincide
+    ahí, si no del transcript.
+    """
+    match_query = build_match_query(query)
+    conn = search_connection()
+    params = {
+        "query": match_query,
+        "transcript_weight": TRANSCRIPT_WEIGHT,
+        "channel_url": channel_url,
+        "limit": limit,
+        "offset": offset,
+    }
+    rows = conn.execute(_PAGE_SQL, params).fetchall()
+    snippets = {}
+    if rows:
+        snippets = dict(conn.execute(
+            _SNIPPETS_SQL.format(placeholders=",".join("?" * len(rows))),
+            [match_query] + [row["rowid"] for row in rows],
+        ).fetchall())
+
+    terms = parse_terms(query)
+    results = []
+    for row in rows:
+        data = {field: row[field] for field in SUMMARY_FIELDS}
+        data["has_transcript"] = bool(data["has_transcript"])
+        sources = row["sources"].split(",")
+        snippet = snippets.get(row["rowid"]) or ""
+        if _MARK_START not in snippet and "transcript" in sources:
+            # Coincide solo en el transcript (o solo en el título): el fragmento sale del transcript
+            transcript = peek_transcript(row["video_id"])
+            snippet = (transcript and transcript_snippet(transcript, terms)) or _mark(snippet)
+        else:
+            snippet = _mark(snippet)
+        data["snippet"] = snippet
+        data["matched_in"] = sorted(set(sources))
+        data["score"] = round(-row["score"], 3)
+        results.append(data)
+
+    if rows:
+        total = rows[0]["total"]
+    else:
+        total = conn.execute(_COUNT_SQL, params).fetchone()["total"] if offset else 0
+    response = {"query": query, "total": total, "limit": limit, "offset": offset, "results": results}
+    if offset + len(results) < total:
+        response["next_offset"] = offset + len(results)
+    return response
@@ -0,0 +1,169 @@
+import time
+import asyncio
+import multiprocessing
+from typing import Dict, List, Optional
+from app.config import (
+    REFRESH_PROCESSES,
+    REFRESH_SHARD_SIZE,
+    REFRESH_SHARD_TIMEOUT_SECONDS,
+    REFRESH_SHARD_RETRIES,
+)
+from app.models import VideoSummary
+from app.pipeline import RefreshPipeline, RefreshProgress
+from app.metrics import RETRIES
+from app.logs import log_print, refresh_id
+
+# spawn: cada proceso arranca limpio, con sus propios pools HTTP y conexiones a SQLite
+_mp_context = multiprocessing.get_context("spawn")
+
+class _ShardCollector(RefreshProgress):
+    """Junta, dentro del proceso del shard, el resultado de cada canal para devolverlo al servidor."""
+
+    def __init__(self, channel_urls: List[str]):
+        self.channels: Dict[str, dict] = {url: {"videos": [], "error": None, "discovered": False} for url in channel_urls}
+
+    def channel_videos(self, channel_url: str, videos: List[VideoSummary]):
+        self.channels[channel_url]["discovered"] = True
+
+    def channel_finished(self, channel_url: str, error: Optional[str] = None):
+        self.channels[channel_url]["error"] = error
+
+    def video_finished(self, video: VideoSummary, status: str):
+        self.channels[video.channel_url]["videos"].append((video.dict(), status))
+
+def _shard_worker(
+    conn, channel_urls: List[str], rate_share: float, summary_mode: str, deadline: Optional[float], job_refresh_id: Optional[str]
+):
+    """Punto de entrada del proceso de un shard: corre el pipeline y envía el resultado por el pipe."""
+    try:
+        # Los logs del shard llevan el mismo refresh_id que los del servidor
+        refresh_id.set(job_refresh_id)
+        from app.transcript_client import transcript_limiter
+
+        transcript_limiter.scale(rate_share)
+        collector = _ShardCollector(channel_urls)
+        # Cada resumen se guarda apenas está listo: si el shard se reintenta, lo ya hecho sale del cache
+        asyncio.run(RefreshPipeline(progress=collector, summary_mode=summary_mode, deadline=deadline).run(channel_urls))
+        conn.send({"channels": collector.channels})
+    except BaseException as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+def _run_shard_process(
+    channel_urls: List[str],
+    rate_share: float,
+    timeout: float,
+    summary_mode: str,
+    deadline: Optional[float] = None,
+    job_refresh_id: Optional[str] = None,
+) -> dict:
+    """Corre un shard en un proceso nuevo; lo termina si no responde en timeout segundos."""
+    receiver, sender = _mp_context.Pipe(duplex=False)
+    process = _mp_context.Process(
+        target=_shard_worker, args=(sender, channel_urls, rate_share, summary_mode, deadline, job_refresh_id), daemon=True
+    )
+    process.start()
+    sender.close()
+    try:
+        if not receiver.poll(timeout):
+            raise TimeoutError(f"el shard no terminó en {timeout:.0f}s")
+        try:
+            result = receiver.recv()
+        except EOFError:
+            raise RuntimeError(f"el proceso del shard terminó sin resultado (exit code {process.exitcode})")
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.terminate()
+        process.join(5)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+def split_shards(channel_urls: List[str], shard_size: int) -> List[List[str]]:
+    shard_size = max(1, shard_size)
+    return [channel_urls[i:i + shard_size] for i in range(0, len(channel_urls), shard_size)]
+
+class ShardedRefresh:
+    """
+    Refresh de registros grandes: los canales se dividen en shards de shard_size y cada shard
+    corre en su propio proceso (hasta processes a la vez). Cada proceso recibe 1/processes del
+    límite de transcripts, así entre todos respetan la tasa global. Los resúmenes se guardan en la
+    base compartida a medida que se generan y el resultado de cada shard se vuelca al progreso del
+    job cuando termina. Un shard que falla o supera el timeout se reintenta solo. Los shards que
+    recién consiguen proceso después del deadline del refresh no se lanzan.
+    """
+
+    def __init__(
+        self,
+        processes: int = REFRESH_PROCESSES,
+        shard_size: int = REFRESH_SHARD_SIZE,
+        timeout: float = REFRESH_SHARD_TIMEOUT_SECONDS,
+        retries: int = REFRESH_SHARD_RETRIES,
+        progress: Optional[RefreshProgress] = None,
+        summary_mode: str = "live",
+        deadline: Optional[float] = None,
+    ):
+        self.processes = max(1, processes)
+        self.shard_size = shard_size
+        self.timeout = timeout
+        self.retries = retries
+        self.progress = progress or RefreshProgress()
+        self.summary_mode = summary_mode
+        self.deadline = deadline
+        self.slots = asyncio.Semaphore(self.processes)
+
+    async def run(self, channel_urls: List[str]) -> List[VideoSummary]:
+        shards = split_shards(channel_urls, self.shard_size)
+        log_print(f"  Refresh en {len(shards)} shards de hasta {self.shard_size} canales ({self.processes} procesos)")
+        per_shard = await asyncio.gather(*(self.run_shard(i, shard) for i, shard in enumerate(shards, start=1)))
+        return [video for videos in per_shard for video in videos]
+
+    async def run_shard(self, index: int, channel_urls: List[str]) -> List[VideoSummary]:
+        async with self.slots:
+            for channel_url in channel_urls:
+                self.progress.channel_started(channel_url)
+            attempts = self.retries + 1
+            for attempt in range(1, attempts + 1):
+                if self.deadline is not None and time.time() >= self.deadline:
+                    log_print(f"  ⏭ Shard {index} salteado: tiempo límite del refresh alcanzado")
+                    for channel_url in channel_urls:
+                        self.progress.channel_finished(channel_url, "Tiempo límite del refresh alcanzado")
+                    return []
+                try:
+                    result = await asyncio.to_thread(
+                        _run_shard_process,
+                        channel_urls,
+                        1 / self.processes,
+                        self.timeout,
+                        self.summary_mode,
+                        self.deadline,
+                        refresh_id.get(),
+                    )
+                    break
+                except Exception as e:
+                    reason = str(e) or type(e).__name__
+                    if attempt < attempts:
+                        RETRIES.inc(operation="refresh_shard")
+                        log_print(f"  ⚠️ Shard {index} falló ({reason}); reintentando (intento {attempt + 1}/{attempts})")
+                        continue
+                    log_print(f"  ✗ Shard {index} falló después de {attempts} intentos: {reason}")
+                    for channel_url in channel_urls:
+                        self.progress.channel_finished(channel_url, f"Shard {index} falló: {reason}")
+                    return []
+        log_print(f"  ✓ Shard {index} terminado ({len(channel_urls)} canales)")
+        return self.merge(result)
+
+    def merge(self, result: dict) -> List[VideoSummary]:
+        """Vuelca el resultado de un shard al progreso del job, en el orden de sus canales."""
+        videos = []
+        for channel_url, channel in result["channels"].items():
+            channel_videos = [(VideoSummary(**data), status) for data, status in channel["videos"]]
+            if channel["discovered"]:
+                self.progress.channel_videos(channel_url, [video for video, _ in channel_videos])
+            for video, status in channel_videos:
+                self.progress.video_finished(video, status)
+                videos.append(video)
+            self.progress.channel_finished(channel_url, channel["error"])
+        return videos
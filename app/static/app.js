@@ -1,8 +1,16 @@
 let summariesData = [];
+// Videos por canal que se piden en cada página de /summaries
+const PAGE_SIZE = 5;
+// Resultados por página de /search y espera antes de buscar mientras se escribe
+const SEARCH_PAGE_SIZE = 20;
+const SEARCH_DEBOUNCE_MS = 250;
+// Búsqueda activa: mientras haya una, el refresh no pisa los resultados
+let searchQuery = '';
+let searchTimer = null;
 
 async function loadSummaries() {
     try {
-        const response = await fetch('/summaries');
+        const response = await fetch(`/summaries?limit=${PAGE_SIZE}`);
         const data = await response.json();
         summariesData = data;
         renderSummaries();
@@ -31,9 +39,11 @@ async function refreshSummaries() {
             alert(errorMessage);
             return;
         }
-        const data = await response.json();
-        summariesData = data;
-        renderSummaries();
+        const job = await response.json();
+        const finishedJob = await streamJob(job.job_id, loading);
+        if (finishedJob.status !== 'completed') {
+            throw new Error(finishedJob.error || 'El refresh falló');
+        }
     } catch (error) {
         console.error('Error refreshing summaries:', error);
         content.innerHTML = '<div class="empty-state error-state"><h2>❌ Error</h2><p>Error al actualizar los resúmenes. Verifica la consola para más detalles.</p></div>';
@@ -41,6 +51,94 @@ async function refreshSummaries() {
     } finally {
         refreshBtn.disabled = false;
         loading.classList.add('hidden');
+        loading.textContent = 'Actualizando...';
+    }
+}
+
+function streamJob(jobId, loading) {
+    // Inserta cada resumen en su canal apenas llega; si el stream falla se consulta el job por polling
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/jobs/${jobId}/events`);
+        let received = 0;
+        source.addEventListener('channel', event => {
+            const channel = JSON.parse(event.data);
+            ensureChannel(channel.channel_url, channel.channel_name);
+        });
+        source.addEventListener('video', event => {
+            const video = JSON.parse(event.data);
+            received += 1;
+            loading.textContent = `Actualizando... (${received} videos listos)`;
+            upsertVideo(video);
+        });
+        source.addEventListener('done', event => {
+            source.close();
+            resolve(JSON.parse(event.data));
+        });
+        source.onerror = () => {
+            source.close();
+            waitForJob(jobId, loading).then(finishedJob => {
+                if (finishedJob.result) {
+                    finishedJob.result.forEach(channel => channel.videos.forEach(upsertVideo));
+                }
+                resolve(finishedJob);
+            }, reject);
+        };
+    });
+}
+
+async function loadMoreVideos(channelUrl) {
+    const channel = summariesData.find(c => c.channel_url === channelUrl);
+    if (!channel || !channel.next_cursor) {
+        return;
+    }
+    const params = new URLSearchParams({ channel: channelUrl, limit: PAGE_SIZE, cursor: channel.next_cursor });
+    try {
+        const response = await fetch(`/summaries?${params}`);
+        const data = await response.json();
+        const page = data[0];
+        channel.next_cursor = page ? page.next_cursor : undefined;
+        if (page) {
+            page.videos.forEach(video => {
+                if (!channel.videos.some(v => v.video_id === video.video_id)) {
+                    channel.videos.push(video);
+                }
+            });
+        }
+        renderChannel(channel);
+    } catch (error) {
+        console.error('Error loading more videos:', error);
+    }
+}
+
+function ensureChannel(channelUrl, channelName) {
+    let channel = summariesData.find(c => c.channel_url === channelUrl);
+    if (!channel) {
+        channel = { channel_name: channelName, channel_url: channelUrl, videos: [] };
+        summariesData.push(channel);
+    }
+    return channel;
+}
+
+function upsertVideo(video) {
+    const channel = ensureChannel(video.channel_url, video.channel_name);
+    channel.videos = channel.videos.filter(v => v.video_id !== video.video_id);
+    channel.videos.push(video);
+    channel.videos.sort((a, b) => (b.published_at || '').localeCompare(a.published_at || ''));
+    renderChannel(channel);
+}
+
+async function waitForJob(jobId, loading) {
+    while (true) {
+        const response = await fetch(`/jobs/${jobId}`);
+        if (!response.ok) {
+            throw new Error(`No se pudo consultar el job ${jobId}`);
+        }
+        const job = await response.json();
+        if (job.status !== 'running') {
+            return job;
+        }
+        loading.textContent = `Actualizando... (${job.channels_done}/${job.channels_total} canales, ${job.videos_done}/${job.videos_total} videos)`;
+        await new Promise(resolve => setTimeout(resolve, 2000));
     }
 }
 
@@ -50,40 +148,159 @@ function formatDate(dateString) {
 }
 
 function renderSummaries() {
+    if (searchQuery) {
+        return;
+    }
     const content = document.getElementById('content');
     if (summariesData.length === 0) {
         content.innerHTML = '<div class="empty-state"><p>No hay resúmenes disponibles. Haz click en "Refresh" para obtener los últimos videos.</p></div>';
         return;
     }
+    content.innerHTML = summariesData.map(channelHtml).join('');
+}
+
+function renderChannel(channel) {
+    if (searchQuery) {
+        return;
+    }
+    const content = document.getElementById('content');
+    const existing = Array.from(content.querySelectorAll('.channel-section'))
+        .find(section => section.dataset.channelUrl === channel.channel_url);
+    if (existing) {
+        existing.outerHTML = channelHtml(channel);
+    } else if (content.querySelector('.channel-section')) {
+        content.insertAdjacentHTML('beforeend', channelHtml(channel));
+    } else {
+        renderSummaries();
+    }
+}
+
+function channelHtml(channel) {
     let html = '';
-    summariesData.forEach(channel => {
-        html += `<div class="channel-section">`;
-        html += `<div class="channel-header">`;
-        html += `<div class="channel-name">${channel.channel_name}</div>`;
-        html += `<a href="${channel.channel_url}" target="_blank" class="channel-url">${channel.channel_url}</a>`;
-        html += `</div>`;
-        channel.videos.forEach(video => {
-            html += `<div class="video-item">`;
-            html += `<div class="video-title"><a href="${video.video_url}" target="_blank">${video.title}</a></div>`;
-            html += `<div class="video-meta">Publicado: ${formatDate(video.published_at)}</div>`;
-            html += `<div class="video-summary">`;
-            if (video.has_transcript) {
-                if (video.summary && !video.summary.includes("Hubo un error") && !video.summary.includes("No hay transcripción")) {
-                    html += `<p>${video.summary}</p>`;
-                } else {
-                    html += `<p class="error-summary">Hubo un error generando el resumen.</p>`;
-                }
+    html += `<div class="channel-section" data-channel-url="${channel.channel_url}">`;
+    html += `<div class="channel-header">`;
+    html += `<div class="channel-name">${channel.channel_name}</div>`;
+    html += `<a href="${channel.channel_url}" target="_blank" class="channel-url">${channel.channel_url}</a>`;
+    html += `</div>`;
+    channel.videos.forEach(video => {
+        html += `<div class="video-item">`;
+        html += `<div class="video-title"><a href="${video.video_url}" target="_blank">${video.title}</a></div>`;
+        html += `<div class="video-meta">Publicado: ${formatDate(video.published_at)}</div>`;
+        html += `<div class="video-summary">`;
+        if (video.has_transcript) {
+            if (video.summary && !video.summary.includes("Hubo un error") && !video.summary.includes("No hay transcripción")) {
+                html += `<p>${video.summary}</p>`;
             } else {
-                html += `<p class="no-transcript">No hay transcripción disponible para este video.</p>`;
+                html += `<p class="error-summary">Hubo un error generando el resumen.</p>`;
             }
-            html += `</div>`;
-            html += `</div>`;
-        });
+        } else {
+            html += `<p class="no-transcript">No hay transcripción disponible para este video.</p>`;
+        }
+        html += `</div>`;
         html += `</div>`;
     });
-    content.innerHTML = html;
+    if (channel.next_cursor) {
+        html += `<button class="load-more-btn" data-channel-url="${channel.channel_url}">Ver más</button>`;
+    }
+    html += `</div>`;
+    return html;
+}
+
+// Texto que viene del usuario (o de YouTube) antes de meterlo en innerHTML
+function escapeHtml(text) {
+    return String(text)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+async function searchSummaries(query, offset = 0) {
+    const content = document.getElementById('content');
+    try {
+        const response = await fetch(`/search?q=${encodeURIComponent(query)}&limit=${SEARCH_PAGE_SIZE}&offset=${offset}`);
+        const data = await response.json();
+        if (query !== searchQuery) {
+            return;
+        }
+        if (!response.ok) {
+            content.innerHTML = `<div class="empty-state"><p>${escapeHtml(data.detail?.message || 'Búsqueda inválida')}</p></div>`;
+            return;
+        }
+        if (offset === 0) {
+            content.innerHTML = searchResultsHtml(data);
+        } else {
+            const results = content.querySelector('.search-results');
+            results.querySelector('.search-more-btn')?.remove();
+            results.insertAdjacentHTML('beforeend', data.results.map(searchResultHtml).join('') + searchMoreHtml(data));
+        }
+    } catch (error) {
+        console.error('Error searching summaries:', error);
+        content.innerHTML = '<div class="empty-state"><p>Error al buscar</p></div>';
+    }
+}
+
+function onSearchInput(event) {
+    clearTimeout(searchTimer);
+    const query = event.target.value.trim();
+    searchTimer = setTimeout(() => {
+        searchQuery = query;
+        if (query) {
+            searchSummaries(query);
+        } else {
+            renderSummaries();
+        }
+    }, SEARCH_DEBOUNCE_MS);
+}
+
+function searchResultsHtml(data) {
+    if (data.total === 0) {
+        return `<div class="empty-state"><p>No hay resultados para "${escapeHtml(data.query)}".</p></div>`;
+    }
+    let html = `<div class="channel-section search-results">`;
+    html += `<div class="channel-header"><div class="channel-name">${data.total} resultados</div></div>`;
+    html += data.results.map(searchResultHtml).join('');
+    html += searchMoreHtml(data);
+    html += `</div>`;
+    return html;
+}
+
+function searchResultHtml(video) {
+    let html = `<div class="video-item">`;
+    html += `<div class="video-title"><a href="${video.video_url}" target="_blank">${escapeHtml(video.title)}</a></div>`;
+    html += `<div class="video-meta">${escapeHtml(video.channel_name)} · Publicado: ${formatDate(video.published_at)}`;
+    video.matched_in.forEach(source => {
+        html += ` <span class="match-badge">${source === 'transcript' ? 'transcript' : 'resumen'}</span>`;
+    });
+    html += `</div>`;
+    // El snippet viene escapado del servidor, con los términos en <mark>
+    html += `<div class="video-summary"><p>${video.snippet}</p></div>`;
+    html += `</div>`;
+    return html;
+}
+
+function searchMoreHtml(data) {
+    if (data.next_offset === undefined) {
+        return '';
+    }
+    return `<button class="load-more-btn search-more-btn" data-offset="${data.next_offset}">Ver más resultados</button>`;
 }
 
 document.getElementById('refreshBtn').addEventListener('click', refreshSummaries);
+document.getElementById('searchInput').addEventListener('input', onSearchInput);
+document.getElementById('content').addEventListener('click', event => {
+    const searchMore = event.target.closest('.search-more-btn');
+    if (searchMore) {
+        searchMore.disabled = true;
+        searchSummaries(searchQuery, Number(searchMore.dataset.offset));
+        return;
+    }
+    const button = event.target.closest('.load-more-btn');
+    if (button) {
+        button.disabled = true;
+        loadMoreVideos(button.dataset.channelUrl);
+    }
+});
 loadSummaries();
 
@@ -1,63 +1,465 @@
 import json
 import os
+import sqlite3
+import time
+import threading
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Dict, Optional
-from app.config import DATA_DIR, SUMMARIES_FILE
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.config import DATA_DIR, SUMMARIES_FILE, SUMMARIES_DB_FILE
 from app.models import VideoSummary
+from app.metrics import STAGE_SECONDS
+from app.logs import log_print
+
+SUMMARY_FIELDS = (
+    "video_id",
+    "title",
+    "channel_name",
+    "channel_url",
+    "published_at",
+    "video_url",
+    "summary",
+    "has_transcript",
+    "generated_at",
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    video_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    channel_name TEXT NOT NULL,
+    channel_url TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    video_url TEXT NOT NULL,
+    summary TEXT,
+    has_transcript INTEGER NOT NULL DEFAULT 0,
+    generated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_summaries_channel_url ON summaries(channel_url);
+CREATE INDEX IF NOT EXISTS idx_summaries_published_at ON summaries(published_at);
+CREATE TABLE IF NOT EXISTS channels (
+    channel_url TEXT PRIMARY KEY,
+    channel_id TEXT NOT NULL,
+    channel_name TEXT NOT NULL,
+    uploads_playlist_id TEXT NOT NULL,
+    resolved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_watermarks (
+    channel_url TEXT PRIMARY KEY,
+    uploads_playlist_id TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    last_video_id TEXT NOT NULL,
+    video_ids TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS video_metadata (
+    video_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    published_at TEXT NOT NULL,
+    duration_seconds REAL NOT NULL,
+    min_duration_seconds INTEGER,
+    accepted INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    data TEXT,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refresh_jobs (
+    job_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Índice de búsqueda (FTS5) de títulos, resúmenes y canales. Es external content sobre summaries:
+# no duplica el texto y los triggers lo actualizan en la misma transacción que cada escritura
+SEARCH_SCHEMA = (
+    """
+    CREATE VIRTUAL TABLE summaries_fts USING fts5(
+        title, summary, channel_name,
+        content='summaries', content_rowid='rowid',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER summaries_fts_insert AFTER INSERT ON summaries BEGIN
+        INSERT INTO summaries_fts (rowid, title, summary, channel_name)
+        VALUES (new.rowid, new.title, new.summary, new.channel_name);
+    END
+    """,
+    """
+    CREATE TRIGGER summaries_fts_delete AFTER DELETE ON summaries BEGIN
+        INSERT INTO summaries_fts (summaries_fts, rowid, title, summary, channel_name)
+        VALUES ('delete', old.rowid, old.title, old.summary, old.channel_name);
+    END
+    """,
+    """
+    CREATE TRIGGER summaries_fts_update AFTER UPDATE OF title, summary, channel_name ON summaries BEGIN
+        INSERT INTO summaries_fts (summaries_fts, rowid, title, summary, channel_name)
+        VALUES ('delete', old.rowid, old.title, old.summary, old.channel_name);
+        INSERT INTO summaries_fts (rowid, title, summary, channel_name)
+        VALUES (new.rowid, new.title, new.summary, new.channel_name);
+    END
+    """,
+)
+
+_UPSERT_SQL = f"""
+INSERT INTO summaries ({", ".join(SUMMARY_FIELDS)})
+VALUES ({", ".join("?" for _ in SUMMARY_FIELDS)})
+ON CONFLICT(video_id) DO UPDATE SET
+    {", ".join(f"{field} = excluded.{field}" for field in SUMMARY_FIELDS[1:])}
+"""
+
+# Versión de la tabla summaries: se incrementa en la misma transacción que cada escritura
+_BUMP_VERSION_SQL = """
+INSERT INTO meta (key, value) VALUES ('summaries_version', 1)
+ON CONFLICT(key) DO UPDATE SET value = value + 1
+"""
+
+# Una conexión por thread (el refresh guarda desde threads del pipeline). Con varios workers
+# de uvicorn cada proceso abre las suyas: las lecturas corren en paralelo (WAL) y las
+# escrituras se serializan con el lock de escritura de SQLite (BEGIN IMMEDIATE).
+_local = threading.local()
+_init_lock = threading.Lock()
+_write_lock = threading.Lock()
+
+# Resolución de last_access en los caches con LRU (transcripts y resúmenes): un hit solo escribe
+# si el último acceso registrado tiene más de esto, así las lecturas no toman el lock de escritura
+LAST_ACCESS_RESOLUTION_SECONDS = 3600
+_initialized = False
 
 def ensure_data_dir():
     """Create data directory if it doesn't exist."""
     if not os.path.exists(DATA_DIR):
         os.makedirs(DATA_DIR)
 
-def load_summaries() -> Dict[str, dict]:
-    """Load summaries from JSON file."""
+def _open_connection() -> sqlite3.Connection:
+    conn = sqlite3.connect(SUMMARIES_DB_FILE, timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to the summaries database, initializing it on first use."""
+    global _initialized
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid():
+        return conn
     ensure_data_dir()
-    if not os.path.exists(SUMMARIES_FILE):
-        return {}
+    conn = _open_connection()
+    _local.conn = conn
+    _local.pid = os.getpid()
+    if not _initialized:
+        with _init_lock:
+            if not _initialized:
+                _drop_outdated_tables(conn)
+                conn.executescript(SCHEMA)
+                _create_search_index(conn)
+                migrate_json_summaries(conn)
+                _initialized = True
+    return conn
+
+@contextmanager
+def _immediate(conn: sqlite3.Connection):
+    # Toma el lock de escritura al empezar: otro proceso escribiendo hace esperar (hasta el
+    # timeout de la conexión) en vez de fallar a mitad de la transacción
+    conn.execute("BEGIN IMMEDIATE")
     try:
-        with open(SUMMARIES_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading summaries: {e}")
-        return {}
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+@contextmanager
+def write_transaction():
+    """
+    Write transaction on this thread's connection. Writers in this process queue on a lock
+    and writers in other worker processes wait on SQLite's write lock, so there is a
+    single writer at a time across the whole deployment.
+    """
+    conn = get_connection()
+    with _write_lock, _immediate(conn):
+        yield conn
+
+def _drop_outdated_tables(conn: sqlite3.Connection):
+    """Drop cache tables whose schema changed; they are rebuilt on the next refresh."""
+    with _immediate(conn):
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(upload_watermarks)")}
+        if columns and "last_modified" not in columns:
+            conn.execute("DROP TABLE upload_watermarks")
+
+def _create_search_index(conn: sqlite3.Connection):
+    """Create the summaries full-text index and fill it from the existing rows (only the first time)."""
+    with _immediate(conn):
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'summaries_fts'").fetchone():
+            return
+        for statement in SEARCH_SCHEMA:
+            conn.execute(statement)
+        conn.execute("INSERT INTO summaries_fts (summaries_fts) VALUES ('rebuild')")
+
+def _summary_row(data: dict) -> tuple:
+    return (
+        data["video_id"],
+        data["title"],
+        data["channel_name"],
+        data["channel_url"],
+        data["published_at"],
+        data["video_url"],
+        data.get("summary"),
+        1 if data.get("has_transcript") else 0,
+        data.get("generated_at") or datetime.now().isoformat(),
+    )
+
+def _row_to_summary(row: sqlite3.Row) -> VideoSummary:
+    data = dict(row)
+    data["has_transcript"] = bool(data["has_transcript"])
+    return VideoSummary(**data)
+
+def migrate_json_summaries(conn: sqlite3.Connection):
+    """
+    One-shot import of the legacy summaries.json into the database. Runs under the database
+    write lock so that only one of several starting workers imports and renames the file.
+    """
+    if not os.path.exists(SUMMARIES_FILE):
+        return
+    with _immediate(conn):
+        if not os.path.exists(SUMMARIES_FILE):
+            return
+        try:
+            with open(SUMMARIES_FILE, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            log_print(f"Error loading legacy summaries from {SUMMARIES_FILE}: {e}")
+            return
+        rows = [_summary_row(data) for data in legacy.values()]
+        conn.executemany(_UPSERT_SQL, rows)
+        conn.execute(_BUMP_VERSION_SQL)
+        os.replace(SUMMARIES_FILE, SUMMARIES_FILE + ".migrated")
+    log_print(f"Migrated {len(rows)} summaries from {SUMMARIES_FILE} to {SUMMARIES_DB_FILE}")
+
+def load_summaries() -> Dict[str, dict]:
+    """Load all summaries as a dict keyed by video_id."""
+    return {summary.video_id: summary.dict() for summary in get_all_summaries()}
 
 def save_summaries(summaries: Dict[str, dict]):
-    """Save summaries to JSON file."""
-    ensure_data_dir()
-    try:
-        with open(SUMMARIES_FILE, "w", encoding="utf-8") as f:
-            json.dump(summaries, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"Error saving summaries: {e}")
+    """Upsert many summaries (dicts keyed by video_id) in a single transaction."""
+    with write_transaction() as conn:
+        conn.executemany(_UPSERT_SQL, [_summary_row(data) for data in summaries.values()])
+        conn.execute(_BUMP_VERSION_SQL)
+
+def save_summaries_batch(video_summaries: Iterable[VideoSummary]):
+    """Upsert many video summaries in a single transaction."""
+    with STAGE_SECONDS.time(stage="storage_write"), write_transaction() as conn:
+        conn.executemany(_UPSERT_SQL, [_summary_row(summary.dict()) for summary in video_summaries])
+        conn.execute(_BUMP_VERSION_SQL)
 
 def get_cached_summary(video_id: str) -> Optional[VideoSummary]:
     """Get cached summary for a video."""
-    summaries = load_summaries()
-    if video_id in summaries:
-        data = summaries[video_id]
-        return VideoSummary(**data)
-    return None
+    row = get_connection().execute(
+        "SELECT * FROM summaries WHERE video_id = ?", (video_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return _row_to_summary(row)
 
 def save_summary(video_summary: VideoSummary):
     """Save or update a video summary."""
-    summaries = load_summaries()
-    summaries[video_summary.video_id] = {
-        "video_id": video_summary.video_id,
-        "title": video_summary.title,
-        "channel_name": video_summary.channel_name,
-        "channel_url": video_summary.channel_url,
-        "published_at": video_summary.published_at,
-        "video_url": video_summary.video_url,
-        "summary": video_summary.summary,
-        "has_transcript": video_summary.has_transcript,
-        "generated_at": video_summary.generated_at or datetime.now().isoformat()
-    }
-    save_summaries(summaries)
-
-def get_all_summaries() -> list[VideoSummary]:
+    save_summaries_batch([video_summary])
+
+def get_all_summaries() -> List[VideoSummary]:
     """Get all cached summaries."""
-    summaries = load_summaries()
-    return [VideoSummary(**data) for data in summaries.values()]
+    rows = get_connection().execute("SELECT * FROM summaries ORDER BY rowid").fetchall()
+    return [_row_to_summary(row) for row in rows]
+
+def get_summaries_version() -> int:
+    """Counter bumped on every summaries write; lets readers cache derived views."""
+    row = get_connection().execute("SELECT value FROM meta WHERE key = 'summaries_version'").fetchone()
+    return row["value"] if row else 0
+
+@STAGE_SECONDS.time(stage="storage_read")
+def query_summaries(
+    channel_url: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    before: Optional[Tuple[str, str]] = None,
+    limit_per_channel: Optional[int] = None,
+) -> List[dict]:
+    """
+    Summaries as plain dicts, newest first within each channel and channels in order of first appearance.
+    since/until filter published_at (inclusive); before=(published_at, video_id) is the pagination
+    cursor; limit_per_channel keeps only the newest N rows of each channel.
+    """
+    conditions, params = [], []
+    if channel_url:
+        conditions.append("channel_url = ?")
+        params.append(channel_url)
+    if since:
+        conditions.append("published_at >= ?")
+        params.append(since)
+    if until:
+        conditions.append("published_at <= ?")
+        params.append(until)
+    if before:
+        conditions.append("(published_at < ? OR (published_at = ? AND video_id < ?))")
+        params.extend([before[0], before[0], before[1]])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    sql = f"""
+        SELECT * FROM (
+            SELECT *,
+                ROW_NUMBER() OVER (PARTITION BY channel_url ORDER BY published_at DESC, video_id DESC) AS position,
+                MIN(rowid) OVER (PARTITION BY channel_url) AS channel_order
+            FROM summaries {where}
+        )
+        {"WHERE position <= ?" if limit_per_channel else ""}
+        ORDER BY channel_order, position
+    """
+    if limit_per_channel:
+        params.append(limit_per_channel)
+    rows = get_connection().execute(sql, params).fetchall()
+    results = []
+    for row in rows:
+        data = {field: row[field] for field in SUMMARY_FIELDS}
+        data["has_transcript"] = bool(data["has_transcript"])
+        results.append(data)
+    return results
+
+def get_channel_record(channel_url: str) -> Optional[dict]:
+    """Get the cached resolution (id, name, uploads playlist) for a channel URL."""
+    row = get_connection().execute(
+        "SELECT * FROM channels WHERE channel_url = ?", (channel_url,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def save_channel_record(record: dict):
+    """Save or update a channel resolution record."""
+    with write_transaction() as conn:
+        conn.execute(
+            """
+            INSERT INTO channels (channel_url, channel_id, channel_name, uploads_playlist_id, resolved_at)
+            VALUES (:channel_url, :channel_id, :channel_name, :uploads_playlist_id, :resolved_at)
+            ON CONFLICT(channel_url) DO UPDATE SET
+                channel_id = excluded.channel_id,
+                channel_name = excluded.channel_name,
+                uploads_playlist_id = excluded.uploads_playlist_id,
+                resolved_at = excluded.resolved_at
+            """,
+            record,
+        )
+
+def get_upload_watermark(channel_url: str) -> Optional[dict]:
+    """Get the incremental discovery state (ETag, last seen video, accepted videos) for a channel."""
+    row = get_connection().execute(
+        "SELECT * FROM upload_watermarks WHERE channel_url = ?", (channel_url,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def save_upload_watermark(watermark: dict):
+    """Save or update the incremental discovery state for a channel."""
+    with write_transaction() as conn:
+        conn.execute(
+            """
+            INSERT OR REPLACE INTO upload_watermarks
+                (channel_url, uploads_playlist_id, etag, last_modified, last_video_id, video_ids, updated_at)
+            VALUES
+                (:channel_url, :uploads_playlist_id, :etag, :last_modified, :last_video_id, :video_ids, :updated_at)
+            """,
+            watermark,
+        )
+
+def get_video_metadata(video_ids: List[str]) -> Dict[str, dict]:
+    """Get cached metadata (title, publish date, duration, verdict) for the given video ids."""
+    conn = get_connection()
+    metadata = {}
+    # Lotes para no superar el límite de parámetros de SQLite
+    for i in range(0, len(video_ids), 500):
+        batch = video_ids[i:i + 500]
+        rows = conn.execute(
+            f"SELECT * FROM video_metadata WHERE video_id IN ({', '.join('?' for _ in batch)})", batch
+        ).fetchall()
+        for row in rows:
+            record = dict(row)
+            if record["accepted"] is not None:
+                record["accepted"] = bool(record["accepted"])
+            metadata[record["video_id"]] = record
+    return metadata
+
+def save_video_metadata(records: List[dict]):
+    """Save or update video metadata records in a single transaction."""
+    with write_transaction() as conn:
+        conn.executemany(
+            """
+            INSERT OR REPLACE INTO video_metadata
+                (video_id, title, published_at, duration_seconds, min_duration_seconds, accepted)
+            VALUES
+                (:video_id, :title, :published_at, :duration_seconds, :min_duration_seconds, :accepted)
+            """,
+            records,
+        )
+
+def acquire_lease(name: str, owner: str, ttl_seconds: float, data: Optional[dict] = None) -> bool:
+    """
+    Take the named lease for ttl_seconds unless another owner holds an unexpired one.
+    The lease lives in the database in the data directory, so it is shared by every
+    worker process; a crashed holder loses it once it expires.
+    """
+    now = time.time()
+    with write_transaction() as conn:
+        row = conn.execute("SELECT owner, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+        if row and row["owner"] != owner and row["expires_at"] > now:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO leases (name, owner, data, expires_at) VALUES (?, ?, ?, ?)",
+            (name, owner, json.dumps(data) if data is not None else None, now + ttl_seconds),
+        )
+    return True
+
+def renew_lease(name: str, owner: str, ttl_seconds: float) -> bool:
+    """Extend a lease we hold; returns False if it expired and someone else took it."""
+    with write_transaction() as conn:
+        cursor = conn.execute(
+            "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ?",
+            (time.time() + ttl_seconds, name, owner),
+        )
+    return cursor.rowcount == 1
+
+def release_lease(name: str, owner: str):
+    with write_transaction() as conn:
+        conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+def get_lease(name: str) -> Optional[dict]:
+    """Current unexpired holder of the lease, or None."""
+    row = get_connection().execute(
+        "SELECT * FROM leases WHERE name = ? AND expires_at > ?", (name, time.time())
+    ).fetchone()
+    if row is None:
+        return None
+    lease = dict(row)
+    lease["data"] = json.loads(lease["data"]) if lease["data"] else None
+    return lease
 
+def save_job_snapshot(job: dict, keep: int):
+    """Store a refresh job's state so any worker can answer GET /jobs/{job_id}; keeps the latest `keep` jobs."""
+    with write_transaction() as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO refresh_jobs (job_id, status, data, updated_at) VALUES (?, ?, ?, ?)",
+            (job["job_id"], job["status"], json.dumps(job), time.time()),
+        )
+        conn.execute(
+            "DELETE FROM refresh_jobs WHERE job_id NOT IN (SELECT job_id FROM refresh_jobs ORDER BY updated_at DESC LIMIT ?)",
+            (keep,),
+        )
 
+def get_job_snapshot(job_id: str) -> Optional[dict]:
+    row = get_connection().execute("SELECT data FROM refresh_jobs WHERE job_id = ?", (job_id,)).fetchone()
+    return json.loads(row["data"]) if row else None
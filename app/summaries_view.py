@@ -0,0 +1,109 @@
+import json
+import gzip
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+from app.storage import get_summaries_version, query_summaries
+
+# Cantidad de combinaciones de filtros distintas que se guardan ya serializadas
+VIEW_CACHE_SIZE = 64
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(published_at: str, video_id: str) -> str:
+    raw = json.dumps([published_at, video_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        published_at, video_id = json.loads(raw)
+        return str(published_at), str(video_id)
+    except Exception:
+        raise InvalidCursor(f"Cursor inválido: {cursor}")
+
+class RenderedView:
+    """Respuesta de /summaries ya serializada (y comprimida) para una versión de los datos."""
+
+    def __init__(self, version: int, key: tuple, body: bytes):
+        self.version = version
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+        self.etag = f'W/"{version}-{digest}"'
+        self.body = body
+        self.gzipped = gzip.compress(body, 6)
+
+class SummariesView:
+    """
+    Cache del payload agrupado por canal de /summaries. Cada entrada queda asociada a la
+    versión de la tabla summaries con la que se generó: se vuelve a calcular solo cuando
+    save_summary escribió algo nuevo, no en cada request.
+    """
+
+    def __init__(self, max_entries: int = VIEW_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._views: "OrderedDict[tuple, RenderedView]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.renders = 0
+
+    def get(
+        self,
+        channel_url: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        limit: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> RenderedView:
+        key = (channel_url, since, until, limit, cursor)
+        before = decode_cursor(cursor) if cursor else None
+        version = get_summaries_version()
+        with self._lock:
+            view = self._views.get(key)
+            if view is not None and view.version == version:
+                self._views.move_to_end(key)
+                self.hits += 1
+                return view
+
+        body = self._render(channel_url, since, until, limit, before)
+        view = RenderedView(version, key, body)
+        with self._lock:
+            self.renders += 1
+            self._views[key] = view
+            self._views.move_to_end(key)
+            while len(self._views) > self.max_entries:
+                self._views.popitem(last=False)
+        return view
+
+    def _render(self, channel_url, since, until, limit, before) -> bytes:
+        # Se pide un video de más por canal para saber si hay otra página
+        rows = query_summaries(
+            channel_url=channel_url,
+            since=since,
+            until=until,
+            before=before,
+            limit_per_channel=limit + 1 if limit else None,
+        )
+        channels = {}
+        for row in rows:
+            channel = channels.setdefault(row["channel_url"], {
+                "channel_name": row["channel_name"],
+                "channel_url": row["channel_url"],
+                "videos": [],
+            })
+            channel["videos"].append(row)
+        if limit:
+            for channel in channels.values():
+                if len(channel["videos"]) > limit:
+                    channel["videos"] = channel["videos"][:limit]
+                    last = channel["videos"][-1]
+                    channel["next_cursor"] = encode_cursor(last["published_at"], last["video_id"])
+        return json.dumps(list(channels.values()), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._views), "hits": self.hits, "renders": self.renders}
+
+summaries_view = SummariesView()
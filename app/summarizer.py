@@ -1,15 +1,114 @@
-from openai import OpenAI
-from app.config import OPENAI_API_KEY
+import re
+import json
+import math
+import hashlib
+import threading
+import contextvars
+import unicodedata
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from openai import APIConnectionError, APIStatusError
+from app.config import (
+    OPENAI_API_KEY,
+    SUMMARY_CHUNK_TOKENS,
+    SUMMARY_MAX_CHUNKS,
+    SUMMARY_CHUNK_CONCURRENCY,
+)
+from app.http_clients import get_openai_client
+from app.summary_cache import get_summary as get_fingerprint_summary, save_summary as save_fingerprint_summary
+from app.metrics import STAGE_SECONDS, OPENAI_TOKENS
+from app.resilience import CircuitOpen, upstream_breakers
 
-def summarize_transcript(text: str, video_title: str, channel_name: str) -> str:
-    """Generate a summary of the transcript using OpenAI."""
-    if not OPENAI_API_KEY:
-        return "Error: OPENAI_API_KEY no configurada"
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    max_chunk_length = 12000
-    if len(text) > max_chunk_length:
-        text = text[:max_chunk_length] + "..."
-    prompt = f"""Eres un analista económico y financiero. Resumes el contenido de videos de YouTube sobre realidad económica y mercados.
+MODEL = "gpt-4o-mini"
+MAX_TOKENS = 300
+TEMPERATURE = 0.7
+SYSTEM_PROMPT = "Eres un analista económico y financiero experto en resumir contenido de videos sobre economía y mercados financieros."
+# Versión del prompt: forma parte de la huella de cada resumen. El texto de las plantillas ya entra
+# en la huella (ver _template_digests); subirla sirve para invalidar los resúmenes por otro motivo
+PROMPT_VERSION = "1"
+# Aproximación de tokens por caracteres para textos en español (sin depender de un tokenizer)
+CHARS_PER_TOKEN = 4
+
+# Límite global de llamadas de chunks en vuelo, compartido entre todos los videos que se resumen a la vez
+_chunk_slots = threading.BoundedSemaphore(max(1, SUMMARY_CHUNK_CONCURRENCY))
+# Resúmenes en curso por huella: [lock, cantidad de threads que lo usan]
+_inflight_lock = threading.Lock()
+_inflight: Dict[str, list] = {}
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def normalize_transcript(text: str) -> str:
+    """Texto para la huella: Unicode NFKC, minúsculas y espacios colapsados."""
+    return " ".join(unicodedata.normalize("NFKC", text).lower().split())
+
+def summary_fingerprint(text: str) -> str:
+    """
+    Huella de la entrada de un resumen: transcript normalizado, versión y plantillas del prompt, modelo
+    y parámetros. No incluye el título ni el canal, así un video re-subido con otro título reutiliza el
+    resumen. Los parámetros y plantillas de los chunks solo cuentan si el transcript se resume por
+    partes: cambiarlos no invalida los resúmenes de transcripts que entran en una sola llamada.
+    """
+    params = {
+        "prompt_version": PROMPT_VERSION,
+        "system_prompt": SYSTEM_PROMPT,
+        "model": MODEL,
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+    templates = _template_digests()
+    params["template"] = templates["single"]
+    if needs_chunking(text):
+        params.update({
+            "chunk_tokens": SUMMARY_CHUNK_TOKENS,
+            "max_chunks": SUMMARY_MAX_CHUNKS,
+            "chunk_template": templates["chunk"],
+            "reduce_template": templates["reduce"],
+        })
+    params = json.dumps(params, sort_keys=True)
+    digest = hashlib.sha256(params.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(normalize_transcript(text).encode("utf-8"))
+    return digest.hexdigest()
+
+def split_transcript(text: str, max_tokens: int) -> List[str]:
+    """
+    Divide el transcript en chunks de hasta max_tokens (aproximados), cortando en fin de oración.
+    Los transcripts generados automáticamente suelen no tener puntuación: en ese caso se corta por palabras.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces = []
+    for sentence in re.split(r"(?<=[.!?…])\s+", text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        words = sentence.split()
+        current = []
+        current_len = 0
+        for word in words:
+            if current and current_len + len(word) + 1 > max_chars:
+                pieces.append(" ".join(current))
+                current, current_len = [], 0
+            current.append(word)
+            current_len += len(word) + 1
+        if current:
+            pieces.append(" ".join(current))
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) + 1 > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def build_prompt(text: str, video_title: str, channel_name: str) -> str:
+    return f"""Eres un analista económico y financiero. Resumes el contenido de videos de YouTube sobre realidad económica y mercados.
 
 Video: {video_title}
 Canal: {channel_name}
@@ -27,19 +126,171 @@ Estilo: frases cortas, claras, sin opinión personal.
 Longitud: máximo 6-8 líneas.
 
 Resumen:"""
+
+def build_chunk_prompt(text: str, video_title: str, channel_name: str, index: int, total: int) -> str:
+    return f"""Eres un analista económico y financiero. Resumes una parte de la transcripción de un video de YouTube sobre realidad económica y mercados.
+
+Video: {video_title}
+Canal: {channel_name}
+Parte {index} de {total}
+
+Transcripción (parte {index}):
+{text}
+
+Objetivo: listar en español, en frases cortas, los datos, cifras, mensajes clave, riesgos y oportunidades
+mencionados en esta parte. Sin opinión personal. Máximo 8 líneas.
+
+Notas:"""
+
+def build_reduce_prompt(partial_summaries: List[str], video_title: str, channel_name: str) -> str:
+    notes = "\n\n".join(f"Parte {i}:\n{summary}" for i, summary in enumerate(partial_summaries, start=1))
+    return f"""Eres un analista económico y financiero. Resumes el contenido de videos de YouTube sobre realidad económica y mercados.
+
+Video: {video_title}
+Canal: {channel_name}
+
+Notas de cada parte del video, en orden:
+{notes}
+
+Objetivo: dar un resumen breve y claro, en español, de lo que se dijo en todo el video, destacando:
+- Contexto económico principal
+- Mensajes clave del expositor
+- Impacto potencial en Argentina y/o mercados financieros
+- Riesgos y oportunidades mencionadas (si aplica)
+
+Estilo: frases cortas, claras, sin opinión personal.
+Longitud: máximo 6-8 líneas.
+
+Resumen:"""
+
+_template_digests_cache: Optional[Dict[str, str]] = None
+
+def _template_digests() -> Dict[str, str]:
+    """
+    Hash de cada plantilla de prompt renderizada con marcadores en lugar del transcript, el título
+    y el canal: editar el texto de una plantilla cambia la huella de los resúmenes que la usan.
+    """
+    global _template_digests_cache
+    if _template_digests_cache is None:
+        rendered = {
+            "single": build_prompt("{text}", "{video_title}", "{channel_name}"),
+            "chunk": build_chunk_prompt("{text}", "{video_title}", "{channel_name}", 1, 2),
+            "reduce": build_reduce_prompt(["{summary}", "{summary}"], "{video_title}", "{channel_name}"),
+        }
+        _template_digests_cache = {
+            name: hashlib.sha256(prompt.encode("utf-8")).hexdigest() for name, prompt in rendered.items()
+        }
+    return _template_digests_cache
+
+def completion_request(prompt: str) -> dict:
+    """Parámetros de chat.completions para un prompt (los mismos en vivo y en el modo batch)."""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        "max_tokens": MAX_TOKENS,
+        "temperature": TEMPERATURE,
+    }
+
+def record_usage(prompt_tokens: int, completion_tokens: int):
+    OPENAI_TOKENS.inc(prompt_tokens, model=MODEL, kind="prompt")
+    OPENAI_TOKENS.inc(completion_tokens, model=MODEL, kind="completion")
+
+def needs_chunking(text: str) -> bool:
+    """Si el transcript supera SUMMARY_CHUNK_TOKENS y se resume por partes (map-reduce)."""
+    return estimate_tokens(text) > SUMMARY_CHUNK_TOKENS
+
+def chunk_prompts(text: str, video_title: str, channel_name: str) -> Optional[List[str]]:
+    """
+    Prompts de los chunks (map) de un transcript largo, o None si el transcript entra en una sola llamada.
+    Si el video es muy largo se agrandan los chunks para no superar SUMMARY_MAX_CHUNKS.
+    """
+    if not needs_chunking(text):
+        return None
+    total_tokens = estimate_tokens(text)
+    chunk_tokens = max(SUMMARY_CHUNK_TOKENS, math.ceil(total_tokens / SUMMARY_MAX_CHUNKS))
+    chunks = split_transcript(text, chunk_tokens)
+    return [
+        build_chunk_prompt(chunk, video_title, channel_name, i, len(chunks))
+        for i, chunk in enumerate(chunks, start=1)
+    ]
+
+def _is_openai_outage(error: Exception) -> bool:
+    """Errores de conexión, timeouts (APITimeoutError hereda de APIConnectionError) y 5xx; no 429 ni 4xx."""
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+def _complete(prompt: str) -> str:
+    # Con el circuito de OpenAI abierto falla al instante (CircuitOpen) en vez de esperar el timeout
+    with upstream_breakers["openai"].call(is_failure=_is_openai_outage):
+        response = get_openai_client().chat.completions.create(**completion_request(prompt))
+    if response.usage:
+        record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response.choices[0].message.content.strip()
+
+def _summarize_chunk(prompt: str) -> str:
+    with _chunk_slots:
+        return _complete(prompt)
+
+@contextmanager
+def _single_flight(fingerprint: str):
+    """Serializa los resúmenes de una misma huella: el segundo espera al primero y sale del cache."""
+    with _inflight_lock:
+        entry = _inflight.setdefault(fingerprint, [threading.Lock(), 0])
+        entry[1] += 1
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "Eres un analista económico y financiero experto en resumir contenido de videos sobre economía y mercados financieros."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300,
-            temperature=0.7
-        )
-        summary = response.choices[0].message.content.strip()
+        with entry[0]:
+            yield
+    finally:
+        with _inflight_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _inflight[fingerprint]
+
+def cached_summary(text: str) -> Optional[str]:
+    """Resumen ya generado para un transcript idéntico (con el prompt y el modelo actuales), si existe."""
+    return get_fingerprint_summary(summary_fingerprint(text))
+
+def summarize_transcript(text: str, video_title: str, channel_name: str) -> str:
+    """
+    Generate a summary of the transcript using OpenAI.
+    Summaries are cached by fingerprint (see summary_fingerprint): an identical transcript
+    reuses the stored summary instead of paying for another call.
+    """
+    if not OPENAI_API_KEY:
+        return "Error: OPENAI_API_KEY no configurada"
+    fingerprint = summary_fingerprint(text)
+    with _single_flight(fingerprint):
+        summary = get_fingerprint_summary(fingerprint)
+        if summary:
+            return summary
+        summary = _summarize(text, video_title, channel_name)
+        if not summary.startswith("Error"):
+            save_fingerprint_summary(fingerprint, summary, PROMPT_VERSION, MODEL)
         return summary
-    except Exception as e:
-        return f"Error al generar resumen: {str(e)}"
 
+@STAGE_SECONDS.time(stage="summary")
+def _summarize(text: str, video_title: str, channel_name: str) -> str:
+    """
+    Transcripts longer than SUMMARY_CHUNK_TOKENS are split on sentence boundaries,
+    each chunk is summarized concurrently (map) and the partial notes are merged
+    into the final 6-8 line summary (reduce).
+    """
+    try:
+        prompts = chunk_prompts(text, video_title, channel_name)
+        if prompts is None:
+            return _complete(build_prompt(text, video_title, channel_name))
 
+        with ThreadPoolExecutor(max_workers=min(len(prompts), max(1, SUMMARY_CHUNK_CONCURRENCY))) as executor:
+            # Cada parte corre con una copia del contexto, así sus logs llevan el refresh_id del video
+            context = contextvars.copy_context()
+            partial_summaries = list(executor.map(lambda prompt: context.copy().run(_summarize_chunk, prompt), prompts))
+        return _complete(build_reduce_prompt(partial_summaries, video_title, channel_name))
+    except CircuitOpen:
+        # No es un resumen con error que se guarda: el video queda para el próximo refresh
+        raise
+    except Exception as e:
+        return f"Error al generar resumen: {str(e)}"
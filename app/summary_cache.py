@@ -0,0 +1,95 @@
+import time
+import threading
+from typing import Optional
+from app.config import SUMMARY_CACHE_MAX_ENTRIES
+from app.storage import get_connection, write_transaction, LAST_ACCESS_RESOLUTION_SECONDS
+from app.metrics import record_cache
+
+# Resúmenes por huella de la entrada (transcript normalizado + versión del prompt + modelo + parámetros):
+# un video re-subido o un clip con el mismo transcript reutiliza el resumen sin llamar a OpenAI
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summary_fingerprints (
+    fingerprint TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summary_fingerprints_last_access ON summary_fingerprints(last_access);
+"""
+
+_schema_ready = False
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+def _connection():
+    global _schema_ready
+    conn = get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _schema_ready = True
+    return conn
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+def get_summary(fingerprint: str) -> Optional[str]:
+    conn = _connection()
+    row = conn.execute(
+        "SELECT summary, last_access FROM summary_fingerprints WHERE fingerprint = ?", (fingerprint,)
+    ).fetchone()
+    record_cache("summary_fingerprint", row is not None)
+    if row is None:
+        _count("misses")
+        return None
+    now = time.time()
+    if now - row["last_access"] > LAST_ACCESS_RESOLUTION_SECONDS:
+        with write_transaction():
+            conn.execute("UPDATE summary_fingerprints SET last_access = ? WHERE fingerprint = ?", (now, fingerprint))
+    _count("hits")
+    return row["summary"]
+
+def save_summary(fingerprint: str, summary: str, prompt_version: str, model: str):
+    now = time.time()
+    conn = _connection()
+    with write_transaction():
+        conn.execute(
+            "INSERT OR REPLACE INTO summary_fingerprints (fingerprint, summary, prompt_version, model, created_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (fingerprint, summary, prompt_version, model, now, now),
+        )
+    _count("stored")
+    evict(SUMMARY_CACHE_MAX_ENTRIES)
+
+def evict(max_entries: int):
+    """Elimina las entradas menos usadas recientemente por encima de max_entries."""
+    conn = _connection()
+    total = conn.execute("SELECT COUNT(*) FROM summary_fingerprints").fetchone()[0]
+    if total <= max_entries:
+        return
+    with write_transaction():
+        cursor = conn.execute(
+            "DELETE FROM summary_fingerprints WHERE fingerprint IN "
+            "(SELECT fingerprint FROM summary_fingerprints ORDER BY last_access LIMIT ?)",
+            (total - max_entries,),
+        )
+    _count("evicted", cursor.rowcount)
+
+def get_stats() -> dict:
+    conn = _connection()
+    by_version = {
+        f"{row['model']}/{row['prompt_version']}": row["total"]
+        for row in conn.execute(
+            "SELECT model, prompt_version, COUNT(*) AS total FROM summary_fingerprints GROUP BY model, prompt_version"
+        ).fetchall()
+    }
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "entries": sum(by_version.values()),
+        "entries_by_version": by_version,
+        "max_entries": SUMMARY_CACHE_MAX_ENTRIES,
+    })
+    return stats
@@ -0,0 +1,252 @@
+import time
+import zlib
+import hashlib
+import threading
+from typing import Optional
+from app.config import TRANSCRIPT_CACHE_MAX_BYTES
+from app.storage import get_connection, write_transaction, LAST_ACCESS_RESOLUTION_SECONDS
+from app.metrics import record_cache
+
+# Caminos de obtención del transcript (en el orden en que los prueba transcript_client)
+SOURCE_MANUAL_ES = "manual_es"
+SOURCE_GENERATED_ES = "generated_es"
+SOURCE_TRANSLATED_EN = "translated_en"
+SOURCE_TRANSLATED_ANY = "translated_any"
+SOURCE_ORDER = (SOURCE_MANUAL_ES, SOURCE_GENERATED_ES, SOURCE_TRANSLATED_EN, SOURCE_TRANSLATED_ANY)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transcript_blobs (
+    content_hash TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    raw_size INTEGER NOT NULL,
+    compressed_size INTEGER NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_transcript_blobs_last_access ON transcript_blobs(last_access);
+CREATE TABLE IF NOT EXISTS transcripts (
+    video_id TEXT NOT NULL,
+    language_code TEXT NOT NULL,
+    source TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (video_id, language_code)
+);
+CREATE INDEX IF NOT EXISTS idx_transcripts_content_hash ON transcripts(content_hash);
+CREATE TABLE IF NOT EXISTS channel_transcript_tracks (
+    channel_url TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    track_language TEXT NOT NULL,
+    learned_hits INTEGER NOT NULL DEFAULT 0,
+    stale INTEGER NOT NULL DEFAULT 0,
+    full_searches INTEGER NOT NULL DEFAULT 0,
+    lookups_saved INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Índice de búsqueda de transcripts: FTS5 sin contenido (solo el índice, el texto ya está comprimido
+# en transcript_blobs). Se indexa el primer transcript guardado de cada video; la entrada queda aunque
+# el blob se desaloje del cache, así el video se sigue encontrando por lo que se dijo
+_SEARCH_SCHEMA = (
+    "CREATE TABLE transcript_search (rowid INTEGER PRIMARY KEY, video_id TEXT NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE transcripts_fts USING fts5(text, content='', tokenize='unicode61 remove_diacritics 2')",
+)
+
+_schema_ready = False
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0, "evicted_blobs": 0}
+
+def _connection():
+    global _schema_ready
+    conn = get_connection()
+    if not _schema_ready:
+        conn.executescript(_SCHEMA)
+        _create_search_index(conn)
+        _schema_ready = True
+    return conn
+
+def _index_transcript(conn, video_id: str, text: str):
+    cursor = conn.execute("INSERT OR IGNORE INTO transcript_search (video_id) VALUES (?)", (video_id,))
+    if cursor.rowcount:
+        conn.execute("INSERT INTO transcripts_fts (rowid, text) VALUES (?, ?)", (cursor.lastrowid, text))
+
+def _create_search_index(conn):
+    """Crea el índice de búsqueda e indexa los transcripts ya cacheados (solo la primera vez)."""
+    with write_transaction():
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transcripts_fts'").fetchone():
+            return
+        for statement in _SEARCH_SCHEMA:
+            conn.execute(statement)
+        rows = conn.execute(
+            """
+            SELECT t.video_id, b.data FROM transcripts t JOIN transcript_blobs b ON b.content_hash = t.content_hash
+            ORDER BY t.fetched_at
+            """
+        ).fetchall()
+        for row in rows:
+            _index_transcript(conn, row["video_id"], zlib.decompress(row["data"]).decode("utf-8"))
+
+def search_connection():
+    """Conexión con las tablas del cache y el índice de transcripts ya creados (la usa app.search)."""
+    return _connection()
+
+def _count(key: str, amount: int = 1):
+    with _stats_lock:
+        _stats[key] += amount
+
+def get_cached_transcript(video_id: str) -> Optional[dict]:
+    """
+    Devuelve el transcript cacheado más reciente del video como
+    {"text", "language_code", "source"}, o None si no está en cache.
+    """
+    conn = _connection()
+    row = conn.execute(
+        """
+        SELECT t.language_code, t.source, t.content_hash, b.data, b.last_access
+        FROM transcripts t JOIN transcript_blobs b ON b.content_hash = t.content_hash
+        WHERE t.video_id = ?
+        ORDER BY t.fetched_at DESC LIMIT 1
+        """,
+        (video_id,),
+    ).fetchone()
+    if row is None:
+        _count("misses")
+        record_cache("transcript", False)
+        return None
+    now = time.time()
+    if now - row["last_access"] > LAST_ACCESS_RESOLUTION_SECONDS:
+        with write_transaction():
+            conn.execute(
+                "UPDATE transcript_blobs SET last_access = ? WHERE content_hash = ?",
+                (now, row["content_hash"]),
+            )
+    _count("hits")
+    record_cache("transcript", True)
+    return {
+        "text": zlib.decompress(row["data"]).decode("utf-8"),
+        "language_code": row["language_code"],
+        "source": row["source"],
+    }
+
+def peek_transcript(video_id: str) -> Optional[str]:
+    """Texto del transcript cacheado, sin contarlo como uso del cache (para los snippets de búsqueda)."""
+    row = _connection().execute(
+        """
+        SELECT b.data FROM transcripts t JOIN transcript_blobs b ON b.content_hash = t.content_hash
+        WHERE t.video_id = ? ORDER BY t.fetched_at DESC LIMIT 1
+        """,
+        (video_id,),
+    ).fetchone()
+    return zlib.decompress(row["data"]).decode("utf-8") if row else None
+
+def save_transcript(video_id: str, language_code: str, source: str, text: str):
+    """Guarda el transcript comprimido, direccionado por el hash de su contenido."""
+    raw = text.encode("utf-8")
+    content_hash = hashlib.sha256(raw).hexdigest()
+    data = zlib.compress(raw, 6)
+    now = time.time()
+    conn = _connection()
+    with write_transaction():
+        conn.execute(
+            """
+            INSERT INTO transcript_blobs (content_hash, data, raw_size, compressed_size, last_access)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(content_hash) DO UPDATE SET last_access = excluded.last_access
+            """,
+            (content_hash, data, len(raw), len(data), now),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO transcripts (video_id, language_code, source, content_hash, fetched_at) VALUES (?, ?, ?, ?, ?)",
+            (video_id, language_code, source, content_hash, now),
+        )
+        _index_transcript(conn, video_id, text)
+    _count("stored")
+    evict(TRANSCRIPT_CACHE_MAX_BYTES)
+
+def evict(max_bytes: int):
+    """Elimina los blobs menos usados recientemente hasta que el cache entre en max_bytes."""
+    conn = _connection()
+    total = conn.execute("SELECT COALESCE(SUM(compressed_size), 0) FROM transcript_blobs").fetchone()[0]
+    if total <= max_bytes:
+        return
+    evicted = []
+    for row in conn.execute("SELECT content_hash, compressed_size FROM transcript_blobs ORDER BY last_access").fetchall():
+        if total <= max_bytes:
+            break
+        evicted.append((row["content_hash"],))
+        total -= row["compressed_size"]
+    with write_transaction():
+        conn.executemany("DELETE FROM transcripts WHERE content_hash = ?", evicted)
+        conn.executemany("DELETE FROM transcript_blobs WHERE content_hash = ?", evicted)
+    _count("evicted_blobs", len(evicted))
+
+def get_channel_track(channel_url: str) -> Optional[dict]:
+    """Camino (source e idioma de la pista original) con el que se obtuvo el último transcript del canal."""
+    row = _connection().execute(
+        "SELECT source, track_language FROM channel_transcript_tracks WHERE channel_url = ?", (channel_url,)
+    ).fetchone()
+    return dict(row) if row else None
+
+def record_channel_track(channel_url: str, source: str, track_language: str, outcome: str, lookups_saved: int = 0):
+    """
+    Guarda el camino que funcionó para el canal y cuenta el resultado: "hit" (el camino aprendido
+    sirvió), "stale" (ya no existía y hubo que buscar de nuevo) o "search" (canal sin camino aprendido).
+    """
+    conn = _connection()
+    with write_transaction():
+        conn.execute(
+            """
+            INSERT INTO channel_transcript_tracks
+                (channel_url, source, track_language, learned_hits, stale, full_searches, lookups_saved, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(channel_url) DO UPDATE SET
+                source = excluded.source,
+                track_language = excluded.track_language,
+                learned_hits = learned_hits + excluded.learned_hits,
+                stale = stale + excluded.stale,
+                full_searches = full_searches + excluded.full_searches,
+                lookups_saved = lookups_saved + excluded.lookups_saved,
+                updated_at = excluded.updated_at
+            """,
+            (
+                channel_url, source, track_language,
+                int(outcome == "hit"), int(outcome == "stale"), int(outcome != "hit"),
+                lookups_saved, time.time(),
+            ),
+        )
+
+def get_track_stats() -> dict:
+    rows = _connection().execute("SELECT * FROM channel_transcript_tracks ORDER BY channel_url").fetchall()
+    channels = {
+        row["channel_url"]: {
+            "source": row["source"],
+            "track_language": row["track_language"],
+            "learned_hits": row["learned_hits"],
+            "stale": row["stale"],
+            "full_searches": row["full_searches"],
+            "lookups_saved": row["lookups_saved"],
+        }
+        for row in rows
+    }
+    totals = {
+        field: sum(channel[field] for channel in channels.values())
+        for field in ("learned_hits", "stale", "full_searches", "lookups_saved")
+    }
+    return {"totals": totals, "channels": channels}
+
+def get_stats() -> dict:
+    conn = _connection()
+    row = conn.execute(
+        "SELECT COUNT(*) AS blobs, COALESCE(SUM(raw_size), 0) AS raw_bytes, COALESCE(SUM(compressed_size), 0) AS compressed_bytes FROM transcript_blobs"
+    ).fetchone()
+    entries = conn.execute("SELECT COUNT(*) FROM transcripts").fetchone()[0]
+    with _stats_lock:
+        stats = dict(_stats)
+    stats.update({
+        "entries": entries,
+        "blobs": row["blobs"],
+        "raw_bytes": row["raw_bytes"],
+        "compressed_bytes": row["compressed_bytes"],
+        "max_bytes": TRANSCRIPT_CACHE_MAX_BYTES,
+    })
+    return stats
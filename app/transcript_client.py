@@ -1,81 +1,174 @@
-import sys
 import time
-import logging
-from youtube_transcript_api import YouTubeTranscriptApi
-from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFound, VideoUnavailable
-from typing import Optional
+from youtube_transcript_api._transcripts import TranscriptListFetcher
+from youtube_transcript_api._errors import (
+    TranscriptsDisabled,
+    NoTranscriptFound,
+    VideoUnavailable,
+    TooManyRequests,
+    NotTranslatable,
+    TranslationLanguageNotAvailable,
+)
+from typing import List, Optional, Tuple
 
 from app.config import (
     TRANSCRIPT_MAX_RETRIES,
     TRANSCRIPT_RETRY_BACKOFF_SECONDS,
     TRANSCRIPT_REQUEST_DELAY_SECONDS,
+    TRANSCRIPT_RATE_MIN,
+    TRANSCRIPT_RATE_MAX,
+    TRANSCRIPT_RATE_INCREASE,
+    TRANSCRIPT_RATE_DECREASE,
+    TRANSCRIPT_LANGUAGES,
+)
+from app.rate_limiter import AdaptiveRateLimiter
+from app.metrics import STAGE_SECONDS, RETRIES
+from app.http_clients import get_youtube_web_session
+from app.resilience import CircuitOpen
+from app.transcript_cache import (
+    SOURCE_MANUAL_ES,
+    SOURCE_GENERATED_ES,
+    SOURCE_TRANSLATED_EN,
+    SOURCE_TRANSLATED_ANY,
+    SOURCE_ORDER,
+    get_cached_transcript,
+    save_transcript,
+    get_channel_track,
+    record_channel_track,
 )
+from app.logs import log_print
 
-logger = logging.getLogger(__name__)
+# Limitador compartido por todos los threads que piden transcripts a YouTube
+transcript_limiter = AdaptiveRateLimiter(
+    "transcripts",
+    initial_rate=1 / TRANSCRIPT_REQUEST_DELAY_SECONDS if TRANSCRIPT_REQUEST_DELAY_SECONDS > 0 else TRANSCRIPT_RATE_MAX,
+    min_rate=TRANSCRIPT_RATE_MIN,
+    max_rate=TRANSCRIPT_RATE_MAX,
+    increase_step=TRANSCRIPT_RATE_INCREASE,
+    decrease_factor=TRANSCRIPT_RATE_DECREASE,
+)
 
-def log_print(*args, **kwargs):
-    """Print que fuerza el flush para ver logs en tiempo real."""
-    message = ' '.join(str(arg) for arg in args)
-    logger.info(message)
-    print(*args, **kwargs)
-    sys.stdout.flush()
+def is_rate_limited(error: Exception) -> bool:
+    if isinstance(error, TooManyRequests):
+        return True
+    error_msg = str(error).lower()
+    return any(keyword in error_msg for keyword in ["too many requests", "429", "rate limit"])
 
-def get_video_transcript(video_id: str) -> Optional[str]:
+def learned_track(transcripts, track: dict, preferred_langs: List[str]) -> Optional[Tuple]:
+    """
+    Prueba directamente el camino aprendido del canal. Devuelve (transcript, source, idioma de la pista)
+    o None si el video no tiene esa pista. Un camino con traducción no se usa si el video tiene una
+    pista en los idiomas preferidos, así no se pierde un transcript mejor.
+    """
+    source, language = track["source"], track["track_language"]
+    try:
+        if source == SOURCE_MANUAL_ES and language in preferred_langs:
+            return transcripts.find_manually_created_transcript([language]), source, language
+        if source == SOURCE_GENERATED_ES and language in preferred_langs:
+            return transcripts.find_generated_transcript([language]), source, language
+        if source in (SOURCE_TRANSLATED_EN, SOURCE_TRANSLATED_ANY):
+            if any(t.language_code in preferred_langs for t in transcripts):
+                return None
+            return transcripts.find_transcript([language]).translate('es'), source, language
+    except (NoTranscriptFound, NotTranslatable, TranslationLanguageNotAvailable):
+        pass
+    return None
+
+def search_track(transcripts, video_id: str, preferred_langs: List[str]) -> Optional[Tuple]:
+    """Búsqueda completa de la pista: manual y generada en los idiomas preferidos, inglés traducido y cualquier idioma traducido."""
+    available_langs = [t.language_code for t in list(transcripts)]
+    log_print(
+        f"      Idiomas disponibles para {video_id}: {', '.join(available_langs) if available_langs else 'ninguno'}"
+    )
+
+    # 1) Intentar en los idiomas preferidos (por defecto variantes de español) - preferir manuales
+    try:
+        transcript_obj = transcripts.find_manually_created_transcript(preferred_langs)
+        log_print(f"      ✓ Transcript manual encontrado ({transcript_obj.language_code})")
+        return transcript_obj, SOURCE_MANUAL_ES, transcript_obj.language_code
+    except NoTranscriptFound:
+        pass
+    try:
+        # Si no hay manual, intentar generadas automáticamente
+        transcript_obj = transcripts.find_generated_transcript(preferred_langs)
+        log_print(f"      ✓ Transcript generado encontrado ({transcript_obj.language_code})")
+        return transcript_obj, SOURCE_GENERATED_ES, transcript_obj.language_code
+    except NoTranscriptFound:
+        pass
+    # 2) Probar en inglés y traducir a español
+    try:
+        en_transcript = transcripts.find_transcript(['en'])
+        log_print("      ✓ Transcript en inglés encontrado y traducido a español")
+        return en_transcript.translate('es'), SOURCE_TRANSLATED_EN, en_transcript.language_code
+    except NoTranscriptFound:
+        pass
+    # 3) Último intento: cualquier idioma disponible y traducir a español
+    try:
+        available = list(transcripts)
+        if available:
+            first_transcript = available[0]
+            transcript_obj = first_transcript.translate('es')
+            log_print(f"      ✓ Transcript en {first_transcript.language_code} encontrado y traducido a español")
+            return transcript_obj, SOURCE_TRANSLATED_ANY, first_transcript.language_code
+    except (NoTranscriptFound, Exception) as e:
+        log_print(f"      ✗ No se pudo obtener transcript (último intento falló: {e})")
+    return None
+
+@STAGE_SECONDS.time(stage="transcript_fetch")
+def get_video_transcript(
+    video_id: str,
+    languages: Optional[List[str]] = None,
+    channel_url: Optional[str] = None,
+) -> Optional[str]:
     """
     Devuelve el transcript como texto plano (una sola string),
     o None si realmente no hay forma de obtenerlo.
-    Intenta múltiples variantes de español y también inglés con traducción.
+    Intenta los idiomas preferidos del canal (por defecto TRANSCRIPT_LANGUAGES, variantes de español)
+    y también inglés con traducción.
+    Con channel_url, primero prueba la pista con la que se obtuvo el último transcript del canal
+    (casi siempre es la misma) y solo si el video no la tiene hace la búsqueda completa.
     Incluye reintentos con backoff ante errores transitorios (p. ej. 429).
+    Si el circuito de youtube.com está abierto lanza CircuitOpen en vez de devolver None.
+    Los transcripts obtenidos se guardan en el cache local, así que volver a resumir
+    un video no hace ninguna petición a YouTube.
     """
+    cached = get_cached_transcript(video_id)
+    if cached:
+        log_print(f"      [CACHE] Transcript de {video_id} ({cached['source']}, {cached['language_code']})")
+        return cached["text"]
+
     last_error = None
     for attempt in range(1, TRANSCRIPT_MAX_RETRIES + 1):
-        if TRANSCRIPT_REQUEST_DELAY_SECONDS > 0:
-            time.sleep(TRANSCRIPT_REQUEST_DELAY_SECONDS)
-
         try:
-            transcripts = YouTubeTranscriptApi.list_transcripts(video_id)
-            transcript_obj = None
-            available_langs = [t.language_code for t in list(transcripts)]
-            log_print(
-                f"      Idiomas disponibles para {video_id}: {', '.join(available_langs) if available_langs else 'ninguno'}"
-            )
-
-            # 1) Intentar en español (varias variantes) - preferir manuales
-            preferred_langs = ['es', 'es-419', 'es-ES', 'es-MX', 'es-AR']
-            try:
-                transcript_obj = transcripts.find_manually_created_transcript(preferred_langs)
-                log_print("      ✓ Transcript manual en español encontrado")
-            except NoTranscriptFound:
-                try:
-                    # Si no hay manual, intentar generadas automáticamente
-                    transcript_obj = transcripts.find_generated_transcript(preferred_langs)
-                    log_print("      ✓ Transcript generado en español encontrado")
-                except NoTranscriptFound:
-                    # 2) Probar en inglés y traducir a español
-                    try:
-                        en_transcript = transcripts.find_transcript(['en'])
-                        transcript_obj = en_transcript.translate('es')
-                        log_print("      ✓ Transcript en inglés encontrado y traducido a español")
-                    except NoTranscriptFound:
-                        # 3) Último intento: cualquier idioma disponible y traducir a español
-                        try:
-                            available = list(transcripts)
-                            if available:
-                                first_transcript = available[0]
-                                transcript_obj = first_transcript.translate('es')
-                                log_print(
-                                    f"      ✓ Transcript en {first_transcript.language_code} encontrado y traducido a español"
-                                )
-                        except (NoTranscriptFound, Exception) as e:
-                            log_print(f"      ✗ No se pudo obtener transcript (último intento falló: {e})")
-                            return None
-
-            if transcript_obj:
-                chunks = transcript_obj.fetch()
-                text = " ".join(chunk["text"] for chunk in chunks)
-                return text.strip() or None
+            transcript_limiter.acquire()
+            # Misma lógica que YouTubeTranscriptApi.list_transcripts, pero con la session compartida
+            transcripts = TranscriptListFetcher(get_youtube_web_session()).fetch(video_id)
+            transcript_limiter.on_success()
+            preferred_langs = languages or TRANSCRIPT_LANGUAGES
+            track = get_channel_track(channel_url) if channel_url else None
+            found = learned_track(transcripts, track, preferred_langs) if track else None
+            if found:
+                outcome = "hit"
+                log_print(f"      ✓ Transcript por la pista aprendida del canal ({found[1]}, {found[2]})")
+            else:
+                outcome = "stale" if track else "search"
+                if track:
+                    log_print(f"      Pista aprendida del canal ({track['source']}, {track['track_language']}) no disponible; búsqueda completa")
+                found = search_track(transcripts, video_id, preferred_langs)
+            if found is None:
+                return None
 
-            return None
+            transcript_obj, source, track_language = found
+            language_code = track_language if source in (SOURCE_MANUAL_ES, SOURCE_GENERATED_ES) else f"{track_language}->es"
+            transcript_limiter.acquire()
+            chunks = transcript_obj.fetch()
+            transcript_limiter.on_success()
+            text = " ".join(chunk["text"] for chunk in chunks).strip()
+            if text:
+                save_transcript(video_id, language_code, source, text)
+                if channel_url:
+                    lookups_saved = SOURCE_ORDER.index(source) if outcome == "hit" else 0
+                    record_channel_track(channel_url, source, track_language, outcome, lookups_saved)
+            return text or None
 
         except TranscriptsDisabled:
             log_print(f"      ✗ Transcripts deshabilitados para {video_id}")
@@ -86,15 +179,21 @@ def get_video_transcript(video_id: str) -> Optional[str]:
         except VideoUnavailable:
             log_print(f"      ✗ Video no disponible: {video_id}")
             return None
+        except CircuitOpen:
+            # Que YouTube no responda no significa que el video no tenga transcript: no se cachea nada
+            raise
         except Exception as e:
             last_error = e
             error_msg = str(e).lower()
-            if any(keyword in error_msg for keyword in ["too many requests", "429", "rate limit"]):
+            if is_rate_limited(e):
+                transcript_limiter.on_throttle()
                 if attempt < TRANSCRIPT_MAX_RETRIES:
-                    wait_time = TRANSCRIPT_RETRY_BACKOFF_SECONDS * attempt
+                    wait_time = transcript_limiter.backoff_delay(attempt, TRANSCRIPT_RETRY_BACKOFF_SECONDS)
                     log_print(
-                        f"      ⚠️ 429/Rate limit para {video_id}; reintentando en {wait_time}s (intento {attempt}/{TRANSCRIPT_MAX_RETRIES})"
+                        f"      ⚠️ 429/Rate limit para {video_id}; reintentando en {wait_time:.1f}s (intento {attempt}/{TRANSCRIPT_MAX_RETRIES}, "
+                        f"tasa {transcript_limiter.rate:.2f}/s)"
                     )
+                    RETRIES.inc(operation="transcript_fetch")
                     time.sleep(wait_time)
                     continue
                 log_print(f"      ✗ Demasiados intentos para {video_id} (429 Too Many Requests)")
@@ -1,21 +1,47 @@
-import sys
+import json
 import logging
-import requests
 import re
-from typing import List, Optional
-from urllib.parse import unquote
+import math
+import time
+import threading
+from typing import Dict, List, Optional
+from urllib.parse import unquote, urlparse
+from xml.etree import ElementTree
 import isodate
-from app.config import YOUTUBE_API_KEY, MAX_VIDEOS_PER_CHANNEL, MIN_VIDEO_DURATION_SECONDS, get_min_duration_for_channel
+import requests
+from app.config import (
+    YOUTUBE_API_KEY,
+    YOUTUBE_API_BASE_URL,
+    YOUTUBE_WEB_BASE_URL,
+    DISCOVERY_BACKEND,
+    MAX_VIDEOS_PER_CHANNEL,
+    MIN_VIDEO_DURATION_SECONDS,
+    CHANNEL_CACHE_TTL_SECONDS,
+    LOG_FILTERED_SAMPLE_RATE,
+)
+from app.channel_settings import channel_settings
 from app.models import VideoSummary
+from app.http_clients import get_youtube_api_session, get_youtube_web_session
+from app.metrics import STAGE_SECONDS, YOUTUBE_QUOTA_UNITS, CACHE_REQUESTS, record_cache
+from app.resilience import CircuitOpen
+from app.storage import (
+    get_channel_record,
+    save_channel_record,
+    get_upload_watermark,
+    save_upload_watermark,
+    get_video_metadata,
+    save_video_metadata,
+)
+from app.logs import log_print
 
-logger = logging.getLogger(__name__)
+# Costo en unidades de cuota de cada endpoint de la YouTube Data API que usamos
+QUOTA_COST = {"channels": 1, "playlistItems": 1, "videos": 1, "search": 100}
 
-def log_print(*args, **kwargs):
-    """Print que fuerza el flush para ver logs en tiempo real."""
-    message = ' '.join(str(arg) for arg in args)
-    logger.info(message)
-    print(*args, **kwargs)
-    sys.stdout.flush()
+def api_get(url: str, **kwargs):
+    """GET a la YouTube Data API con la session compartida, registrando la cuota consumida."""
+    endpoint = urlparse(url).path.rsplit("/", 1)[-1]
+    YOUTUBE_QUOTA_UNITS.inc(QUOTA_COST.get(endpoint, 1), endpoint=endpoint)
+    return get_youtube_api_session().get(url, **kwargs)
 
 def extract_channel_id_from_url(channel_url: str) -> Optional[str]:
     """Extract channel ID from various YouTube URL formats."""
@@ -25,27 +51,29 @@ def extract_channel_id_from_url(channel_url: str) -> Optional[str]:
     if "@" in channel_url:
         username = channel_url.split("@")[-1].split("/")[0].split("?")[0]
         try:
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-            response = requests.get(f"https://www.youtube.com/@{username}", allow_redirects=True, headers=headers, timeout=10)
+            response = get_youtube_web_session().get(f"https://www.youtube.com/@{username}", allow_redirects=True, timeout=10)
             matches = re.findall(r'"channelId":"([^"]+)"', response.text)
             if matches:
                 return matches[0]
             match = re.search(r'"externalId":"([^"]+)"', response.text)
             if match:
                 return match.group(1)
+        except CircuitOpen:
+            raise
         except Exception as e:
-            print(f"Error extracting channel ID from URL for @{username}: {e}")
+            log_print(f"Error extracting channel ID from URL for @{username}: {e}")
     match = re.search(r"c/([^/?]+)", channel_url)
     if match:
         channel_handle = match.group(1)
         try:
-            headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"}
-            response = requests.get(f"https://www.youtube.com/c/{channel_handle}", allow_redirects=True, headers=headers, timeout=10)
+            response = get_youtube_web_session().get(f"https://www.youtube.com/c/{channel_handle}", allow_redirects=True, timeout=10)
             matches = re.findall(r'"channelId":"([^"]+)"', response.text)
             if matches:
                 return matches[0]
+        except CircuitOpen:
+            raise
         except Exception as e:
-            print(f"Error extracting channel ID from URL for c/{channel_handle}: {e}")
+            log_print(f"Error extracting channel ID from URL for c/{channel_handle}: {e}")
     return None
 
 def get_channel_id(channel_url: str) -> Optional[str]:
@@ -60,71 +88,468 @@ def get_channel_id(channel_url: str) -> Optional[str]:
     if username_match:
         handle = username_match.group(1)
         try:
-            url = f"https://www.googleapis.com/youtube/v3/channels?part=id&forHandle={handle}&key={YOUTUBE_API_KEY}"
-            response = requests.get(url)
+            url = f"{YOUTUBE_API_BASE_URL}/channels?part=id&forHandle={handle}&key={YOUTUBE_API_KEY}"
+            response = api_get(url)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("items"):
                     return data["items"][0]["id"]
+        except CircuitOpen:
+            raise
         except Exception as e:
-            print(f"Error getting channel ID for handle {handle}: {e}")
+            log_print(f"Error getting channel ID for handle {handle}: {e}")
         try:
-            url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={handle}&type=channel&maxResults=1&key={YOUTUBE_API_KEY}"
-            response = requests.get(url)
+            url = f"{YOUTUBE_API_BASE_URL}/search?part=snippet&q={handle}&type=channel&maxResults=1&key={YOUTUBE_API_KEY}"
+            response = api_get(url)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("items"):
                     return data["items"][0]["id"]["channelId"]
+        except CircuitOpen:
+            raise
         except Exception as e:
-            print(f"Error searching channel for {handle}: {e}")
+            log_print(f"Error searching channel for {handle}: {e}")
     match = re.search(r"c/([^/?]+)", channel_url_decoded)
     if match:
         channel_handle = match.group(1)
         try:
-            url = f"https://www.googleapis.com/youtube/v3/search?part=snippet&q={channel_handle}&type=channel&maxResults=1&key={YOUTUBE_API_KEY}"
-            response = requests.get(url)
+            url = f"{YOUTUBE_API_BASE_URL}/search?part=snippet&q={channel_handle}&type=channel&maxResults=1&key={YOUTUBE_API_KEY}"
+            response = api_get(url)
             if response.status_code == 200:
                 data = response.json()
                 if data.get("items"):
                     return data["items"][0]["id"]["channelId"]
+        except CircuitOpen:
+            raise
         except Exception as e:
             pass
     return extract_channel_id_from_url(channel_url_decoded)
 
-def get_channel_name(channel_id: str) -> str:
-    """Get channel name from channel ID."""
-    if not YOUTUBE_API_KEY:
-        return "Unknown Channel"
+def fetch_channel_details(channel_url: str, channel_id: Optional[str] = None, handle: Optional[str] = None) -> Optional[dict]:
+    """
+    Obtiene id, nombre y playlist de uploads del canal con una sola llamada
+    channels?part=snippet,contentDetails (por id o por handle).
+    """
+    lookup = f"id={channel_id}" if channel_id else f"forHandle={handle}"
+    url = f"{YOUTUBE_API_BASE_URL}/channels?part=snippet,contentDetails&{lookup}&key={YOUTUBE_API_KEY}"
     try:
-        url = f"https://www.googleapis.com/youtube/v3/channels?part=snippet&id={channel_id}&key={YOUTUBE_API_KEY}"
-        response = requests.get(url)
-        if response.status_code == 200:
-            data = response.json()
-            if data.get("items"):
-                return data["items"][0]["snippet"]["title"]
+        response = api_get(url)
+        if response.status_code != 200:
+            error_data = response.json() if response.content else {}
+            error_msg = error_data.get("error", {}).get("message", "Unknown error")
+            log_print(f"Error fetching channel details for {channel_url} (status {response.status_code}): {error_msg}")
+            return None
+        data = response.json()
+    except CircuitOpen:
+        raise
     except Exception as e:
-        print(f"Error getting channel name: {e}")
-    return "Unknown Channel"
+        log_print(f"Error fetching channel details for {channel_url}: {e}")
+        return None
+    if not data.get("items"):
+        return None
+    item = data["items"][0]
+    return {
+        "channel_url": channel_url,
+        "channel_id": item["id"],
+        "channel_name": item["snippet"]["title"],
+        "uploads_playlist_id": item["contentDetails"]["relatedPlaylists"]["uploads"],
+        "resolved_at": time.time(),
+    }
 
-def get_latest_videos(channel_url: str, min_duration_seconds: int = None) -> List[VideoSummary]:
+@STAGE_SECONDS.time(stage="channel_resolution")
+def resolve_channel(channel_url: str) -> Optional[dict]:
     """
-    Get latest long videos from a YouTube channel, EXCLUYENDO Shorts y videos cortos.
-    Usa el playlist de uploads del canal para obtener videos de la pestaña "Videos" con paginación.
-    
-    Args:
-        channel_url: URL del canal de YouTube
-        min_duration_seconds: Duración mínima en segundos (default: desde config por canal o global)
+    Resuelve id, nombre y playlist de uploads de un canal usando el registro persistido.
+    Solo consulta la API cuando el registro no existe o venció CHANNEL_CACHE_TTL_SECONDS;
+    si la revalidación falla se sigue usando el registro anterior.
+    """
+    record = get_channel_record(channel_url)
+    fresh = bool(record) and time.time() - record["resolved_at"] < CHANNEL_CACHE_TTL_SECONDS
+    record_cache("channel", fresh)
+    if fresh:
+        return record
+    if record:
+        details = fetch_channel_details(channel_url, channel_id=record["channel_id"])
+    else:
+        channel_url_decoded = unquote(channel_url)
+        details = None
+        channel_id_match = re.search(r"channel/([a-zA-Z0-9_-]+)", channel_url_decoded)
+        username_match = re.search(r"@([^/?]+)", channel_url_decoded)
+        if channel_id_match:
+            details = fetch_channel_details(channel_url, channel_id=channel_id_match.group(1))
+        elif username_match:
+            details = fetch_channel_details(channel_url, handle=username_match.group(1))
+        if details is None:
+            # Handles sin forHandle y URLs /c/: búsqueda o scraping para obtener el id
+            channel_id = get_channel_id(channel_url)
+            if channel_id:
+                details = fetch_channel_details(channel_url, channel_id=channel_id)
+    if details is None:
+        if record:
+            log_print(f"  ⚠️ No se pudo revalidar {channel_url}; usando registro anterior")
+        return record
+    save_channel_record(details)
+    return details
+
+@STAGE_SECONDS.time(stage="playlist_paging")
+def fetch_upload_ids(
+    uploads_playlist_id: str,
+    stop_at_video_id: Optional[str] = None,
+    etag: Optional[str] = None,
+    max_candidates: int = MAX_VIDEOS_PER_CHANNEL * 10,
+) -> dict:
+    """
+    Recorre el playlist de uploads (más nuevo primero) con paginación, hasta juntar max_candidates ids.
+    Se detiene al llegar a stop_at_video_id (la marca de agua del refresh anterior) y envía
+    If-None-Match con el ETag guardado para que un playlist sin cambios cueste un 304 sin parseo.
+    """
+    result = {"video_ids": [], "etag": None, "not_modified": False, "reached_watermark": False}
+    next_page_token = None
+    max_pages = 10  # Límite de seguridad para evitar loops infinitos
+    page_count = 0
+
+    while len(result["video_ids"]) < max_candidates and page_count < max_pages:
+        page_count += 1
+        playlist_url = f"{YOUTUBE_API_BASE_URL}/playlistItems?part=contentDetails&playlistId={uploads_playlist_id}&maxResults=50&key={YOUTUBE_API_KEY}"
+        headers = {}
+        if next_page_token:
+            playlist_url += f"&pageToken={next_page_token}"
+        elif etag:
+            headers["If-None-Match"] = etag
+        playlist_response = api_get(playlist_url, headers=headers)
+        if playlist_response.status_code == 304:
+            result["not_modified"] = True
+            return result
+        if playlist_response.status_code != 200:
+            error_data = playlist_response.json() if playlist_response.content else {}
+            error_msg = error_data.get("error", {}).get("message", "Unknown error")
+            log_print(f"Error fetching playlist items (status {playlist_response.status_code}): {error_msg}")
+            break
+        playlist_data = playlist_response.json()
+        if page_count == 1:
+            result["etag"] = playlist_response.headers.get("ETag") or playlist_data.get("etag")
+        page_video_ids = [item["contentDetails"]["videoId"] for item in playlist_data.get("items", [])]
+        if stop_at_video_id and stop_at_video_id in page_video_ids:
+            page_video_ids = page_video_ids[:page_video_ids.index(stop_at_video_id)]
+            result["reached_watermark"] = True
+        result["video_ids"].extend(page_video_ids)
+        log_print(f"  Página {page_count}: {len(page_video_ids)} videos nuevos (total acumulado: {len(result['video_ids'])})")
+        if result["reached_watermark"]:
+            break
+        next_page_token = playlist_data.get("nextPageToken")
+        if not next_page_token:
+            break
+    return result
+
+@STAGE_SECONDS.time(stage="video_metadata")
+def fetch_video_metadata(video_ids: List[str]) -> Dict[str, dict]:
+    """
+    Obtiene título, fecha y duración de los videos con videos.list en lotes de 50 (límite de la API)
+    y los guarda en el cache de metadata. Los videos en vivo o programados no se cachean
+    porque su duración todavía no es definitiva. Un lote que falla se saltea (sus videos se vuelven
+    a pedir en el próximo refresh); con el circuito de la Data API abierto no se piden más lotes.
+    """
+    metadata = {}
+    batch_size = 50
+    for i in range(0, len(video_ids), batch_size):
+        batch_ids = video_ids[i:i + batch_size]
+        video_ids_str = ",".join(batch_ids)
+        details_url = f"{YOUTUBE_API_BASE_URL}/videos?part=snippet,contentDetails&id={video_ids_str}&key={YOUTUBE_API_KEY}"
+        try:
+            details_response = api_get(details_url)
+        except CircuitOpen as e:
+            log_print(f"Error fetching video details: {e}; se saltean {len(video_ids) - i} videos")
+            break
+        except requests.RequestException as e:
+            log_print(f"Error fetching video details for batch {i // batch_size + 1}: {e}")
+            continue
+        if details_response.status_code != 200:
+            log_print(f"Error fetching video details for batch {i // batch_size + 1}")
+            continue
+        details_data = details_response.json()
+        
+        for item in details_data.get("items", []):
+            snippet = item["snippet"]
+            content_details = item.get("contentDetails", {})
+            duration_iso = content_details.get("duration", "PT0S")
+            
+            # Parsear duración ISO 8601 usando isodate
+            try:
+                duration = isodate.parse_duration(duration_iso).total_seconds()
+            except Exception:
+                duration = 0
+            
+            metadata[item["id"]] = {
+                "video_id": item["id"],
+                "title": snippet["title"],
+                "published_at": snippet["publishedAt"],
+                "duration_seconds": duration,
+                "min_duration_seconds": None,
+                "accepted": None,
+                "cacheable": snippet.get("liveBroadcastContent", "none") == "none",
+            }
+    save_video_metadata([record for record in metadata.values() if record["cacheable"]])
+    return metadata
+
+class VideoDetailsBatcher:
+    """
+    Agrupa los ids candidatos de todos los canales de un refresh en lotes completos de 50
+    para videos.list (1 unidad de cuota por llamada) y lleva la cuenta de las llamadas ahorradas
+    frente a consultar cada canal por separado.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.last_refresh = {}
+        self.totals = {"calls_made": 0, "calls_saved": 0, "quota_units_saved": 0, "ids_fetched": 0, "ids_from_cache": 0}
+
+    def fetch_metadata(self, ids_by_channel: Dict[str, List[str]]) -> Dict[str, dict]:
+        """Metadata de los candidatos de todos los canales; solo consulta videos.list por ids nunca vistos."""
+        all_ids = list(dict.fromkeys(video_id for video_ids in ids_by_channel.values() for video_id in video_ids))
+        metadata = get_video_metadata(all_ids)
+        unknown_ids = [video_id for video_id in all_ids if video_id not in metadata]
+        CACHE_REQUESTS.inc(len(all_ids) - len(unknown_ids), cache="video_metadata", result="hit")
+        CACHE_REQUESTS.inc(len(unknown_ids), cache="video_metadata", result="miss")
+        if unknown_ids:
+            metadata.update(fetch_video_metadata(unknown_ids))
+
+        # Llamadas que habría hecho cada canal por su cuenta vs. las hechas en lotes compartidos
+        unknown_set = set(unknown_ids)
+        calls_per_channel = sum(
+            math.ceil(len([video_id for video_id in video_ids if video_id in unknown_set]) / 50)
+            for video_ids in ids_by_channel.values()
+        )
+        calls_made = math.ceil(len(unknown_ids) / 50)
+        stats = {
+            "channels": len(ids_by_channel),
+            "ids_fetched": len(unknown_ids),
+            "ids_from_cache": len(all_ids) - len(unknown_ids),
+            "calls_made": calls_made,
+            "calls_without_batching": calls_per_channel,
+            "calls_saved": calls_per_channel - calls_made,
+            "quota_units_saved": calls_per_channel - calls_made,
+        }
+        with self._lock:
+            self.last_refresh = stats
+            for key in self.totals:
+                self.totals[key] += stats[key]
+        if len(ids_by_channel) > 1:
+            log_print(
+                f"  videos.list: {calls_made} llamadas para {len(unknown_ids)} ids nuevos de {len(ids_by_channel)} canales "
+                f"({stats['calls_saved']} llamadas / unidades de cuota ahorradas, {stats['ids_from_cache']} ids en cache)"
+            )
+        return metadata
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"last_refresh": dict(self.last_refresh), "totals": dict(self.totals)}
+
+video_details_batcher = VideoDetailsBatcher()
+
+# Namespaces del feed Atom de uploads (feeds/videos.xml)
+_ATOM = "{http://www.w3.org/2005/Atom}"
+_YT = "{http://www.youtube.com/xml/schemas/2015}"
+
+def resolve_feed_channel(channel_url: str) -> Optional[dict]:
+    """
+    Id y nombre del canal para el backend rss, sin gastar cuota: del registro de canales si existe
+    (el id de un canal no cambia), si no de la URL o de la página del canal en youtube.com.
     """
+    record = get_channel_record(channel_url)
+    record_cache("channel", record is not None)
+    if record:
+        return record
+    channel_id = extract_channel_id_from_url(unquote(channel_url))
+    if not channel_id:
+        return None
+    # resolved_at = 0: si después se usa el backend api, revalida el registro con channels.list
+    return {
+        "channel_url": channel_url,
+        "channel_id": channel_id,
+        "channel_name": None,
+        "uploads_playlist_id": "UU" + channel_id[2:],
+        "resolved_at": 0,
+    }
+
+@STAGE_SECONDS.time(stage="uploads_feed")
+def fetch_feed_ids(
+    channel_id: str,
+    stop_at_video_id: Optional[str] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None,
+) -> dict:
+    """
+    Lee el feed público de uploads del canal (los últimos 15 videos, más nuevo primero) con
+    If-None-Match / If-Modified-Since, así un canal sin cambios cuesta un 304. El XML se parsea
+    en streaming con iterparse y se corta al llegar a stop_at_video_id. No consume cuota.
+    """
+    result = {
+        "video_ids": [], "channel_name": None, "etag": None, "last_modified": None,
+        "not_modified": False, "reached_watermark": False,
+    }
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    url = f"{YOUTUBE_WEB_BASE_URL}/feeds/videos.xml?channel_id={channel_id}"
+    with get_youtube_web_session().get(url, headers=headers, stream=True) as response:
+        if response.status_code == 304:
+            result["not_modified"] = True
+            return result
+        if response.status_code != 200:
+            log_print(f"Error fetching uploads feed for {channel_id} (status {response.status_code})")
+            return result
+        result["etag"] = response.headers.get("ETag")
+        result["last_modified"] = response.headers.get("Last-Modified")
+        response.raw.decode_content = True
+        in_entry = False
+        try:
+            for event, element in ElementTree.iterparse(response.raw, events=("start", "end")):
+                if element.tag == f"{_ATOM}entry":
+                    in_entry = event == "start"
+                    if not in_entry:
+                        element.clear()
+                elif event == "end" and element.tag == f"{_ATOM}title" and not in_entry and result["channel_name"] is None:
+                    result["channel_name"] = element.text
+                elif event == "end" and element.tag == f"{_YT}videoId":
+                    if element.text == stop_at_video_id:
+                        result["reached_watermark"] = True
+                        break
+                    result["video_ids"].append(element.text)
+        except ElementTree.ParseError as e:
+            log_print(f"Error parsing uploads feed for {channel_id}: {e}")
+            result["video_ids"], result["etag"], result["last_modified"] = [], None, None
+    return result
+
+def discover_feed_ids(channel: dict, max_candidates: int) -> List[str]:
+    """
+    Candidatos del canal desde el feed de uploads: los ids nuevos del feed más los candidatos
+    anteriores (el feed solo trae los últimos 15). Actualiza el nombre del canal si el feed trae otro.
+    """
+    channel_url = channel["channel_url"]
+    feed_id = f"feed:{channel['channel_id']}"
+    watermark = get_upload_watermark(channel_url)
+    if watermark and watermark["uploads_playlist_id"] != feed_id:
+        watermark = None
+    previous_ids = json.loads(watermark["video_ids"]) if watermark else []
+    feed = fetch_feed_ids(
+        channel["channel_id"],
+        stop_at_video_id=watermark["last_video_id"] if watermark else None,
+        etag=watermark["etag"] if watermark else None,
+        last_modified=watermark["last_modified"] if watermark else None,
+    )
+    if watermark and (watermark["etag"] or watermark["last_modified"]):
+        record_cache("uploads_feed", feed["not_modified"])
+    if feed["channel_name"] and feed["channel_name"] != channel["channel_name"]:
+        channel["channel_name"] = feed["channel_name"]
+        save_channel_record(channel)
+    if feed["not_modified"]:
+        log_print(f"  Feed sin cambios (304); reutilizando {len(previous_ids)} videos candidatos")
+        return previous_ids
+    new_video_ids = feed["video_ids"]
+    if not new_video_ids and not feed["reached_watermark"]:
+        # Si el feed falló se siguen usando los candidatos anteriores
+        return previous_ids
+    log_print(f"  Feed de uploads: {len(new_video_ids)} videos nuevos desde el último refresh")
+    video_ids = list(dict.fromkeys(new_video_ids + previous_ids))[:max_candidates]
+    if video_ids:
+        save_upload_watermark({
+            "channel_url": channel_url,
+            "uploads_playlist_id": feed_id,
+            "etag": feed["etag"],
+            "last_modified": feed["last_modified"],
+            "last_video_id": video_ids[0],
+            "video_ids": json.dumps(video_ids),
+            "updated_at": time.time(),
+        })
+    return video_ids
+
+def select_long_videos(
+    video_ids: List[str],
+    metadata: Dict[str, dict],
+    channel_url: str,
+    channel_name: str,
+    min_duration_seconds: int,
+    max_videos: int = MAX_VIDEOS_PER_CHANNEL,
+) -> List[VideoSummary]:
+    """
+    Filtra Shorts localmente usando la metadata cacheada, en el orden del playlist,
+    hasta max_videos. El veredicto guardado se recalcula si cambió la duración mínima.
+    """
+    long_videos = []
+    updated_verdicts = []
+    for video_id in video_ids:
+        record = metadata.get(video_id)
+        if record is None:
+            continue
+        if record["min_duration_seconds"] != min_duration_seconds:
+            record["min_duration_seconds"] = min_duration_seconds
+            record["accepted"] = record["duration_seconds"] >= min_duration_seconds
+            # Los videos en vivo o programados tampoco se cachean con su veredicto (ver fetch_video_metadata)
+            if record.get("cacheable", True):
+                updated_verdicts.append(record)
+
+        duration = record["duration_seconds"]
+        duration_min = int(duration // 60)
+        duration_sec = int(duration % 60)
+        
+        # FILTRAR SHORTS: solo videos más largos que min_duration_seconds
+        if not record["accepted"]:
+            log_print(
+                f"  [FILTRADO] {record['title'][:50]}... - Duración: {duration_min}m{duration_sec}s (menor a {min_duration_seconds // 60}m{min_duration_seconds % 60}s, se excluye)",
+                level=logging.DEBUG,
+                sample_rate=LOG_FILTERED_SAMPLE_RATE,
+                video_id=video_id,
+                channel_url=channel_url,
+            )
+            continue
+        
+        log_print(
+            f"  [✓ ACEPTADO] {record['title'][:60]}... - Duración: {duration_min}m{duration_sec}s - ID: {video_id}",
+            video_id=video_id,
+            channel_url=channel_url,
+        )
+        
+        video_summary = VideoSummary(
+            video_id=video_id,
+            title=record["title"],
+            channel_name=channel_name,
+            channel_url=channel_url,
+            published_at=record["published_at"],
+            video_url=f"https://www.youtube.com/watch?v={video_id}",
+            has_transcript=False
+        )
+        long_videos.append(video_summary)
+        
+        # Limitar a max_videos videos largos
+        if len(long_videos) >= max_videos:
+            break
+    if updated_verdicts:
+        save_video_metadata(updated_verdicts)
+    return long_videos
+
+def discover_uploads(channel_url: str, min_duration_seconds: int = None) -> Optional[dict]:
+    """
+    Primera fase de get_latest_videos: resuelve el canal y obtiene los ids candidatos del playlist
+    de uploads. El descubrimiento es incremental: se guarda por canal una marca de agua (último video visto)
+    y el ETag del playlist, así un refresh sin uploads nuevos cuesta una sola petición (304).
+    Con DISCOVERY_BACKEND=rss los candidatos salen del feed público de uploads, sin gastar cuota;
+    la Data API se usa solo para la duración de los ids nuevos (videos.list, en lotes).
+    Devuelve None si no se pudo descubrir el canal y lanza CircuitOpen si el upstream tiene el circuito abierto.
+    """
+    settings = channel_settings.get(channel_url)
     if min_duration_seconds is None:
-        min_duration_seconds = get_min_duration_for_channel(channel_url)
+        min_duration_seconds = settings.min_duration_seconds
+    # Candidatos que se miran para encontrar max_videos videos largos
+    max_candidates = settings.max_videos * 10
     if not YOUTUBE_API_KEY:
         log_print(f"Warning: YOUTUBE_API_KEY not configured. Cannot fetch videos for {channel_url}")
-        return []
-    channel_id = get_channel_id(channel_url)
-    if not channel_id:
+        return None
+    channel = resolve_feed_channel(channel_url) if DISCOVERY_BACKEND == "rss" else resolve_channel(channel_url)
+    if not channel:
         log_print(f"Could not get channel ID for {channel_url}")
-        return []
-    channel_name = get_channel_name(channel_id)
+        return None
     duration_min = min_duration_seconds // 60
     duration_sec = min_duration_seconds % 60
     if duration_min > 0:
@@ -133,109 +558,101 @@ def get_latest_videos(channel_url: str, min_duration_seconds: int = None) -> Lis
         duration_str = f"{duration_sec} segundos"
     log_print(f"  Buscando videos (mínimo {duration_str}) - EXCLUYENDO Shorts...")
     try:
-        # 1) Obtener el playlist de uploads del canal
-        channels_url = f"https://www.googleapis.com/youtube/v3/channels?part=contentDetails&id={channel_id}&key={YOUTUBE_API_KEY}"
-        channels_response = requests.get(channels_url)
-        if channels_response.status_code != 200:
-            error_data = channels_response.json() if channels_response.content else {}
-            error_msg = error_data.get("error", {}).get("message", "Unknown error")
-            log_print(f"Error fetching channel details for {channel_url} (status {channels_response.status_code}): {error_msg}")
-            return []
-        channels_data = channels_response.json()
-        if not channels_data.get("items"):
-            log_print(f"No channel data found for {channel_url}")
-            return []
-        uploads_playlist_id = channels_data["items"][0]["contentDetails"]["relatedPlaylists"]["uploads"]
+        if DISCOVERY_BACKEND == "rss":
+            video_ids = discover_feed_ids(channel, max_candidates)
+            if not video_ids:
+                log_print(f"  No se encontraron videos en el feed de uploads")
+            return {
+                "channel_url": channel_url,
+                "channel_name": channel["channel_name"] or channel_url,
+                "min_duration_seconds": min_duration_seconds,
+                "max_videos": settings.max_videos,
+                "video_ids": video_ids,
+            }
+        # 1) Playlist de uploads del canal (desde el registro de canales)
+        uploads_playlist_id = channel["uploads_playlist_id"]
         log_print(f"  Playlist de uploads encontrado: {uploads_playlist_id}")
+
+        watermark = get_upload_watermark(channel_url)
+        if watermark and watermark["uploads_playlist_id"] != uploads_playlist_id:
+            watermark = None
+        previous_ids = json.loads(watermark["video_ids"]) if watermark else []
         
-        # 2) Recorrer el playlist de uploads con paginación
-        video_ids = []
-        next_page_token = None
-        max_pages = 10  # Límite de seguridad para evitar loops infinitos
-        page_count = 0
-        
-        while len(video_ids) < MAX_VIDEOS_PER_CHANNEL * 10 and page_count < max_pages:
-            page_count += 1
-            playlist_url = f"https://www.googleapis.com/youtube/v3/playlistItems?part=contentDetails&playlistId={uploads_playlist_id}&maxResults=50&key={YOUTUBE_API_KEY}"
-            if next_page_token:
-                playlist_url += f"&pageToken={next_page_token}"
-            playlist_response = requests.get(playlist_url)
-            if playlist_response.status_code != 200:
-                error_data = playlist_response.json() if playlist_response.content else {}
-                error_msg = error_data.get("error", {}).get("message", "Unknown error")
-                log_print(f"Error fetching playlist items (status {playlist_response.status_code}): {error_msg}")
-                break
-            playlist_data = playlist_response.json()
-            page_video_ids = [item["contentDetails"]["videoId"] for item in playlist_data.get("items", [])]
-            video_ids.extend(page_video_ids)
-            log_print(f"  Página {page_count}: {len(page_video_ids)} videos encontrados (total acumulado: {len(video_ids)})")
-            next_page_token = playlist_data.get("nextPageToken")
-            if not next_page_token:
-                break
+        # 2) Recorrer el playlist de uploads hasta la marca de agua
+        uploads = fetch_upload_ids(
+            uploads_playlist_id,
+            stop_at_video_id=watermark["last_video_id"] if watermark else None,
+            etag=watermark["etag"] if watermark else None,
+            max_candidates=max_candidates,
+        )
+        if watermark and watermark["etag"]:
+            record_cache("playlist_etag", uploads["not_modified"])
+        if uploads["not_modified"]:
+            log_print(f"  Playlist sin cambios (304); reutilizando {len(previous_ids)} videos candidatos")
+            video_ids = previous_ids
+        else:
+            new_video_ids = uploads["video_ids"]
+            if uploads["reached_watermark"]:
+                log_print(f"  Marca de agua alcanzada: {len(new_video_ids)} videos nuevos desde el último refresh")
+                video_ids = (new_video_ids + previous_ids)[:max_candidates]
+            else:
+                # Si el playlist falló se siguen usando los candidatos anteriores
+                video_ids = new_video_ids or previous_ids
+            if new_video_ids or uploads["reached_watermark"]:
+                save_upload_watermark({
+                    "channel_url": channel_url,
+                    "uploads_playlist_id": uploads_playlist_id,
+                    "etag": uploads["etag"],
+                    "last_modified": None,
+                    "last_video_id": video_ids[0],
+                    "video_ids": json.dumps(video_ids),
+                    "updated_at": time.time(),
+                })
         
         if not video_ids:
             log_print(f"  No se encontraron videos en el playlist de uploads")
-            return []
-        
-        # 3) Obtener detalles de los videos (incluyendo duración) para filtrar Shorts
-        # Procesar en lotes de 50 (límite de la API)
-        long_videos = []
-        batch_size = 50
-        for i in range(0, len(video_ids), batch_size):
-            batch_ids = video_ids[i:i + batch_size]
-            video_ids_str = ",".join(batch_ids)
-            details_url = f"https://www.googleapis.com/youtube/v3/videos?part=snippet,contentDetails&id={video_ids_str}&key={YOUTUBE_API_KEY}"
-            details_response = requests.get(details_url)
-            if details_response.status_code != 200:
-                log_print(f"Error fetching video details for batch {i // batch_size + 1}")
-                continue
-            details_data = details_response.json()
-            
-            for item in details_data.get("items", []):
-                video_id = item["id"]
-                snippet = item["snippet"]
-                content_details = item.get("contentDetails", {})
-                duration_iso = content_details.get("duration", "PT0S")
-                
-                # Parsear duración ISO 8601 usando isodate
-                try:
-                    duration = isodate.parse_duration(duration_iso).total_seconds()
-                except Exception:
-                    duration = 0
-                
-                duration_min = int(duration // 60)
-                duration_sec = int(duration % 60)
-                
-                # FILTRAR SHORTS: solo videos más largos que min_duration_seconds
-                if duration < min_duration_seconds:
-                    log_print(f"  [FILTRADO] {snippet['title'][:50]}... - Duración: {duration_min}m{duration_sec}s (menor a {min_duration_seconds // 60}m{min_duration_seconds % 60}s, se excluye)")
-                    continue
-                
-                log_print(f"  [✓ ACEPTADO] {snippet['title'][:60]}... - Duración: {duration_min}m{duration_sec}s - ID: {video_id}")
-                
-                video_summary = VideoSummary(
-                    video_id=video_id,
-                    title=snippet["title"],
-                    channel_name=channel_name,
-                    channel_url=channel_url,
-                    published_at=snippet["publishedAt"],
-                    video_url=f"https://www.youtube.com/watch?v={video_id}",
-                    has_transcript=False
-                )
-                long_videos.append(video_summary)
-                
-                # Limitar a MAX_VIDEOS_PER_CHANNEL videos largos
-                if len(long_videos) >= MAX_VIDEOS_PER_CHANNEL:
-                    break
-            
-            if len(long_videos) >= MAX_VIDEOS_PER_CHANNEL:
-                break
-        
-        log_print(f"  Total videos aceptados: {len(long_videos)} (videos < {min_duration_seconds // 60}m{min_duration_seconds % 60}s excluidos)")
-        return long_videos
+        return {
+            "channel_url": channel_url,
+            "channel_name": channel["channel_name"],
+            "min_duration_seconds": min_duration_seconds,
+            "max_videos": settings.max_videos,
+            "video_ids": video_ids,
+        }
+    except CircuitOpen:
+        # YouTube caído no es una falla del canal (ver RefreshPipeline.discover_channel)
+        raise
     except Exception as e:
-        log_print(f"  ✗ Error getting videos for channel {channel_url}: {e}")
-        import traceback
-        traceback.print_exc()
-        return []
+        log_print(f"  ✗ Error getting videos for channel {channel_url}: {e}", level=logging.ERROR, exc_info=True)
+        return None
 
+def select_latest_videos(discovery: dict, metadata: Dict[str, dict]) -> List[VideoSummary]:
+    """Segunda fase de get_latest_videos: filtra los candidatos descubiertos con la metadata obtenida."""
+    min_duration_seconds = discovery["min_duration_seconds"]
+    long_videos = select_long_videos(
+        discovery["video_ids"],
+        metadata,
+        discovery["channel_url"],
+        discovery["channel_name"],
+        min_duration_seconds,
+        discovery["max_videos"],
+    )
+    log_print(f"  Total videos aceptados: {len(long_videos)} (videos < {min_duration_seconds // 60}m{min_duration_seconds % 60}s excluidos)")
+    return long_videos
+
+def get_latest_videos(channel_url: str, min_duration_seconds: int = None) -> List[VideoSummary]:
+    """
+    Get latest long videos from a YouTube channel, EXCLUYENDO Shorts y videos cortos.
+    Usa el playlist de uploads del canal para obtener videos de la pestaña "Videos" con paginación.
+    La duración de cada video se cachea, por lo que videos.list solo se llama para ids nuevos.
+    Para varios canales, el pipeline de refresh usa discover_uploads + video_details_batcher
+    + select_latest_videos para compartir los lotes de videos.list entre canales.
+    
+    Args:
+        channel_url: URL del canal de YouTube
+        min_duration_seconds: Duración mínima en segundos (default: desde config por canal o global)
+    """
+    discovery = discover_uploads(channel_url, min_duration_seconds)
+    if not discovery or not discovery["video_ids"]:
+        return []
+    metadata = video_details_batcher.fetch_metadata({channel_url: discovery["video_ids"]})
+    return select_latest_videos(discovery, metadata)
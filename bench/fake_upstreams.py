@@ -0,0 +1,435 @@
+"""
+Servidores HTTP locales que imitan a los upstreams del refresh, para medir rendimiento
+sin gastar cuota de YouTube ni créditos de OpenAI:
+
+- YouTube Data API (/youtube/v3/channels, /playlistItems, /videos, /search)
+- youtube.com (/watch y /api/timedtext, lo que usa youtube-transcript-api, y el feed de
+  uploads /feeds/videos.xml del backend de descubrimiento rss, con ETag y Last-Modified)
+- OpenAI (/v1/chat/completions y la Batch API: /v1/files, /v1/batches)
+
+Los datos son deterministas: el canal UCbench00042 tiene el playlist UUbench00042 con
+VIDEOS_PER_CHANNEL videos (uno de cada cuatro es un Short y uno de cada cinco no tiene
+subtítulos). Cada upstream tiene latencia, tasa de errores 500 y tasa de 429 configurables.
+Los batches de OpenAI quedan "in_progress" durante batch_seconds y después se completan de una
+vez; cada prompt del batch falla con la tasa de errores del perfil de OpenAI.
+"""
+import json
+import time
+import itertools
+from email.parser import BytesParser
+from email.policy import HTTP
+import random
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlparse, parse_qs
+
+VIDEOS_PER_CHANNEL = 60
+PAGE_SIZE = 50
+# Entradas del feed de uploads (YouTube publica los últimos 15 videos)
+FEED_SIZE = 15
+BASE_DATE = datetime(2024, 6, 1)
+WORDS = (
+    "inflación dólar reservas tasa bonos acciones riesgo país mercado banco central emisión "
+    "déficit superávit licitación cepo brecha importaciones exportaciones cosecha deuda"
+).split()
+
+class FaultProfile:
+    """Latencia (media y jitter, en ms) y probabilidad de responder 500 o 429."""
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0, throttle_rate: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+
+    def delay(self):
+        latency = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def fault(self) -> Optional[int]:
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+def channel_index(value: str) -> int:
+    return int("".join(ch for ch in value if ch.isdigit()) or 0)
+
+def video_id(channel: int, position: int) -> str:
+    return f"b{channel:05d}v{position:03d}"
+
+def parse_video_id(value: str):
+    channel, position = value[1:].split("v")
+    return int(channel), int(position)
+
+def video_duration_seconds(position: int) -> int:
+    return 45 if position % 4 == 3 else 600 + (position * 37) % 3000
+
+def has_captions(position: int) -> bool:
+    return position % 5 != 4
+
+def transcript_text(video: str, words: int) -> str:
+    rng = random.Random(video)
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+class FakeUpstreams:
+    """Los tres upstreams en un solo ThreadingHTTPServer, con perfiles de fallas separados."""
+
+    def __init__(
+        self,
+        youtube_api: FaultProfile = None,
+        youtube_web: FaultProfile = None,
+        openai: FaultProfile = None,
+        transcript_words: int = 1500,
+        batch_seconds: float = 1.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        self.profiles = {
+            "youtube_api": youtube_api or FaultProfile(),
+            "youtube_web": youtube_web or FaultProfile(),
+            "openai": openai or FaultProfile(),
+        }
+        self.transcript_words = transcript_words
+        self.batch_seconds = batch_seconds
+        self.files: Dict[str, bytes] = {}
+        self.batches: Dict[str, dict] = {}
+        self._ids = itertools.count(1)
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        handler = type("Handler", (_Handler,), {"upstreams": self})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> Dict[str, str]:
+        """Variables de entorno que apuntan la app a estos servidores."""
+        return {
+            "YOUTUBE_API_BASE_URL": f"{self.base_url}/youtube/v3",
+            "YOUTUBE_WEB_BASE_URL": self.base_url,
+            "OPENAI_BASE_URL": f"{self.base_url}/v1",
+            "YOUTUBE_API_KEY": "bench",
+            "OPENAI_API_KEY": "bench",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, route: str):
+        with self._lock:
+            self.requests[route] += 1
+
+    def new_id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-bench{next(self._ids):05d}"
+
+    def reset_counts(self) -> Dict[str, int]:
+        with self._lock:
+            counts = dict(self.requests)
+            self.requests.clear()
+        return counts
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    upstreams: FakeUpstreams = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _send_json(self, data, status: int = 200, headers: dict = None):
+        self._send(status, json.dumps(data).encode("utf-8"), headers=headers)
+
+    def _inject(self, upstream: str) -> bool:
+        """Aplica latencia y fallas del upstream; devuelve True si ya respondió con un error."""
+        profile = self.upstreams.profiles[upstream]
+        profile.delay()
+        status = profile.fault()
+        if status is None:
+            return False
+        self.upstreams.count(f"{upstream}:{status}")
+        message = "Too Many Requests" if status == 429 else "Internal Server Error"
+        if upstream == "openai":
+            self._send_json({"error": {"message": message, "type": "bench"}}, status, headers={"Retry-After": "0.1"})
+        elif upstream == "youtube_api":
+            self._send_json({"error": {"code": status, "message": message}}, status)
+        else:
+            self._send(status, message.encode("utf-8"), content_type="text/plain")
+        return True
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/youtube/v3/"):
+            endpoint = url.path.rsplit("/", 1)[-1]
+            self.upstreams.count(f"youtube_api:{endpoint}")
+            if self._inject("youtube_api"):
+                return
+            handler = getattr(self, f"_youtube_{endpoint}", None)
+            if handler is None:
+                self._send_json({"error": {"code": 404, "message": "Not Found"}}, 404)
+            else:
+                handler(query)
+        elif url.path == "/watch":
+            self.upstreams.count("youtube_web:watch")
+            if not self._inject("youtube_web"):
+                self._watch_page(query["v"])
+        elif url.path == "/feeds/videos.xml":
+            self.upstreams.count("youtube_web:feed")
+            if not self._inject("youtube_web"):
+                self._uploads_feed(query["channel_id"])
+        elif url.path == "/api/timedtext":
+            self.upstreams.count("youtube_web:timedtext")
+            if not self._inject("youtube_web"):
+                self._timedtext(query["v"])
+        elif url.path.startswith("/v1/batches/"):
+            self.upstreams.count("openai:batches.retrieve")
+            if not self._inject("openai"):
+                self._retrieve_batch(url.path.rsplit("/", 1)[-1])
+        elif url.path.startswith("/v1/files/") and url.path.endswith("/content"):
+            self.upstreams.count("openai:files.content")
+            if not self._inject("openai"):
+                self._file_content(url.path.split("/")[3])
+        else:
+            self._send(404, b"Not Found", content_type="text/plain")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self.upstreams.count("openai:chat.completions")
+            if not self._inject("openai"):
+                self._send_json(self._completion(json.loads(body or b"{}")))
+        elif self.path.rstrip("/").endswith("/files"):
+            self.upstreams.count("openai:files.create")
+            if not self._inject("openai"):
+                self._create_file(body)
+        elif self.path.rstrip("/").endswith("/batches"):
+            self.upstreams.count("openai:batches.create")
+            if not self._inject("openai"):
+                self._create_batch(json.loads(body or b"{}"))
+        else:
+            self._send_json({"error": {"message": "Not Found"}}, 404)
+
+    # --- YouTube Data API ---
+
+    def _youtube_channels(self, query: dict):
+        lookup = query.get("id") or query.get("forHandle") or ""
+        index = channel_index(lookup)
+        self._send_json({"items": [{
+            "id": f"UCbench{index:05d}",
+            "snippet": {"title": f"Canal bench {index}"},
+            "contentDetails": {"relatedPlaylists": {"uploads": f"UUbench{index:05d}"}},
+        }]})
+
+    def _youtube_playlistItems(self, query: dict):
+        playlist_id = query["playlistId"]
+        etag = f'"{playlist_id}-{VIDEOS_PER_CHANNEL}"'
+        if self.headers.get("If-None-Match") == etag:
+            self._send(304)
+            return
+        index = channel_index(playlist_id)
+        start = int(query.get("pageToken") or 0)
+        end = min(start + min(int(query.get("maxResults", PAGE_SIZE)), PAGE_SIZE), VIDEOS_PER_CHANNEL)
+        data = {
+            "etag": etag,
+            "items": [{"contentDetails": {"videoId": video_id(index, position)}} for position in range(start, end)],
+        }
+        if end < VIDEOS_PER_CHANNEL:
+            data["nextPageToken"] = str(end)
+        self._send_json(data, headers={"ETag": etag})
+
+    def _youtube_videos(self, query: dict):
+        items = []
+        for value in query.get("id", "").split(","):
+            if not value:
+                continue
+            _, position = parse_video_id(value)
+            items.append({
+                "id": value,
+                "snippet": {
+                    "title": f"Video {value}",
+                    "publishedAt": (BASE_DATE - timedelta(hours=position * 12)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "liveBroadcastContent": "none",
+                },
+                "contentDetails": {"duration": f"PT{video_duration_seconds(position)}S"},
+            })
+        self._send_json({"items": items})
+
+    def _youtube_search(self, query: dict):
+        self._send_json({"items": []})
+
+    # --- youtube.com (feed de uploads y transcripts) ---
+
+    def _uploads_feed(self, channel_id: str):
+        index = channel_index(channel_id)
+        etag = f'"feed-{channel_id}-{VIDEOS_PER_CHANNEL}"'
+        last_modified = BASE_DATE.strftime("%a, %d %b %Y %H:%M:%S GMT")
+        if self.headers.get("If-None-Match") == etag or self.headers.get("If-Modified-Since") == last_modified:
+            self._send(304)
+            return
+        entries = "".join(
+            f"<entry><id>yt:video:{video_id(index, position)}</id>"
+            f"<yt:videoId>{video_id(index, position)}</yt:videoId><yt:channelId>{channel_id}</yt:channelId>"
+            f"<title>Video {video_id(index, position)}</title>"
+            f"<published>{(BASE_DATE - timedelta(hours=position * 12)).strftime('%Y-%m-%dT%H:%M:%S+00:00')}</published>"
+            f"</entry>"
+            for position in range(min(FEED_SIZE, VIDEOS_PER_CHANNEL))
+        )
+        xml = (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<feed xmlns:yt="http://www.youtube.com/xml/schemas/2015" xmlns="http://www.w3.org/2005/Atom">'
+            f"<id>yt:channel:{channel_id}</id><yt:channelId>{channel_id}</yt:channelId>"
+            f"<title>Canal bench {index}</title><author><name>Canal bench {index}</name></author>"
+            f"{entries}</feed>"
+        )
+        self._send(200, xml.encode("utf-8"), content_type="text/xml; charset=utf-8", headers={
+            "ETag": etag, "Last-Modified": last_modified,
+        })
+
+    def _watch_page(self, value: str):
+        _, position = parse_video_id(value)
+        if has_captions(position):
+            captions = {"playerCaptionsTracklistRenderer": {
+                "captionTracks": [{
+                    "baseUrl": f"https://www.youtube.com/api/timedtext?v={value}&lang=es",
+                    "name": {"simpleText": "Español"},
+                    "languageCode": "es",
+                    "isTranslatable": True,
+                }],
+                "translationLanguages": [],
+            }}
+            player = f'"playabilityStatus":{{"status":"OK"}},"captions":{json.dumps(captions)},"videoDetails":{{"videoId":"{value}"}}'
+        else:
+            player = f'"playabilityStatus":{{"status":"OK"}},"videoDetails":{{"videoId":"{value}"}}'
+        html = f"<html><body><script>var ytInitialPlayerResponse = {{{player}}};</script></body></html>"
+        self._send(200, html.encode("utf-8"), content_type="text/html; charset=utf-8")
+
+    def _timedtext(self, value: str):
+        words = transcript_text(value, self.upstreams.transcript_words).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        xml = '<?xml version="1.0" encoding="utf-8" ?><transcript>' + "".join(
+            f'<text start="{i * 4}" dur="4">{line}</text>' for i, line in enumerate(lines)
+        ) + "</transcript>"
+        self._send(200, xml.encode("utf-8"), content_type="text/xml; charset=utf-8")
+
+    # --- OpenAI ---
+
+    def _completion(self, request: dict) -> dict:
+        prompt = " ".join(message.get("content", "") for message in request.get("messages", []))
+        content = "Resumen de prueba: " + " ".join(prompt.split()[-40:])
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        return {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "bench"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    # --- OpenAI Batch API ---
+
+    def _create_file(self, body: bytes):
+        message = BytesParser(policy=HTTP).parsebytes(
+            f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("latin-1") + body
+        )
+        fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+        content = fields["file"].get_payload(decode=True)
+        file_id = self.upstreams.new_id("file")
+        self.upstreams.files[file_id] = content
+        self._send_json({
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": fields["file"].get_filename(),
+            "purpose": fields["purpose"].get_content().strip(),
+            "status": "processed",
+        })
+
+    def _create_batch(self, request: dict):
+        batch_id = self.upstreams.new_id("batch")
+        batch = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request.get("input_file_id"),
+            "completion_window": request.get("completion_window"),
+            "status": "in_progress",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+            "ready_at": time.time() + self.upstreams.batch_seconds,
+        }
+        self.upstreams.batches[batch_id] = batch
+        self._send_json({key: value for key, value in batch.items() if key != "ready_at"})
+
+    def _retrieve_batch(self, batch_id: str):
+        batch = self.upstreams.batches.get(batch_id)
+        if batch is None:
+            self._send_json({"error": {"message": "No such batch"}}, 404)
+            return
+        if batch["status"] == "in_progress" and time.time() >= batch["ready_at"]:
+            self._run_batch(batch)
+        self._send_json({key: value for key, value in batch.items() if key != "ready_at"})
+
+    def _run_batch(self, batch: dict):
+        profile = self.upstreams.profiles["openai"]
+        output, errors = [], []
+        for line in self.upstreams.files[batch["input_file_id"]].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            self.upstreams.count("openai:batch.request")
+            status = profile.fault()
+            if status is None:
+                response = {"status_code": 200, "body": self._completion(request["body"])}
+                output.append({"id": f"req-{request['custom_id']}", "custom_id": request["custom_id"], "response": response, "error": None})
+            else:
+                response = {"status_code": status, "body": {"error": {"message": "bench", "type": "bench"}}}
+                errors.append({"id": f"req-{request['custom_id']}", "custom_id": request["custom_id"], "response": response, "error": None})
+        for key, lines in (("output_file_id", output), ("error_file_id", errors)):
+            if lines:
+                file_id = self.upstreams.new_id("file")
+                self.upstreams.files[file_id] = "".join(json.dumps(item) + "\n" for item in lines).encode("utf-8")
+                batch[key] = file_id
+        batch["request_counts"] = {"total": len(output) + len(errors), "completed": len(output), "failed": len(errors)}
+        batch["status"] = "completed"
+
+    def _file_content(self, file_id: str):
+        content = self.upstreams.files.get(file_id)
+        if content is None:
+            self._send_json({"error": {"message": "No such file"}}, 404)
+        else:
+            self._send(200, content, content_type="application/octet-stream")
@@ -0,0 +1,373 @@
+"""
+Benchmarks de punta a punta contra los upstreams falsos de bench/fake_upstreams.py.
+
+    python -m bench.run                         # refresh con 9, 100 y 1000 canales + /summaries con 10k resúmenes
+    python -m bench.run --channels 9 --summaries 0 --youtube-latency-ms 80 --throttle-rate 0.02
+
+Cada escenario corre en un subproceso con su propio DATA_DIR vacío, así el pico de memoria
+y los caches no se mezclan entre escenarios. Los resultados se imprimen y se agregan como una
+línea JSON a --output para poder comparar corridas en el tiempo.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+from bench.fake_upstreams import FakeUpstreams, FaultProfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_OUTPUT = os.path.join(REPO_ROOT, "bench", "results.jsonl")
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def latency_stats(samples_ms: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(samples_ms),
+        "p50_ms": round(percentile(samples_ms, 50), 2),
+        "p99_ms": round(percentile(samples_ms, 99), 2),
+        "max_ms": round(max(samples_ms), 2) if samples_ms else 0.0,
+    }
+
+def peak_rss_mb(who: int = resource.RUSAGE_SELF) -> float:
+    # ru_maxrss está en KB en Linux (en bytes en macOS)
+    maxrss = resource.getrusage(who).ru_maxrss
+    return round(maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def bench_channel_url(index: int) -> str:
+    return f"https://www.youtube.com/channel/UCbench{index:05d}"
+
+# --- Escenarios (corren dentro del subproceso, con la app apuntando a los upstreams falsos) ---
+
+def run_refresh_scenario(channels: int, summary_mode: str = "live") -> dict:
+    import asyncio
+    from app.pipeline import RefreshProgress, run_refresh
+    from app.batch_summarizer import batch_summarizer
+    from app.config import DISCOVERY_BACKEND
+
+    class TimingProgress(RefreshProgress):
+        def __init__(self):
+            self.channel_started_at = {}
+            self.channel_ms = []
+            self.video_started_at = {}
+            self.video_ms = []
+
+        def channel_started(self, channel_url):
+            self.channel_started_at[channel_url] = time.perf_counter()
+
+        def channel_videos(self, channel_url, videos):
+            now = time.perf_counter()
+            for video in videos:
+                self.video_started_at[video.video_id] = now
+
+        def channel_finished(self, channel_url, error=None):
+            started = self.channel_started_at.get(channel_url)
+            if started is not None:
+                self.channel_ms.append((time.perf_counter() - started) * 1000)
+
+        def video_finished(self, video, status):
+            started = self.video_started_at.get(video.video_id)
+            if started is not None:
+                self.video_ms.append((time.perf_counter() - started) * 1000)
+
+    channel_urls = [bench_channel_url(i) for i in range(channels)]
+    passes = {}
+    # Primera pasada con la base vacía; la segunda mide el refresh sin cambios (todo en cache / 304)
+    for name in ("cold", "warm"):
+        progress = TimingProgress()
+        started = time.perf_counter()
+        videos = asyncio.run(run_refresh(channel_urls, progress=progress, summary_mode=summary_mode))
+        elapsed = time.perf_counter() - started
+        batch_seconds = None
+        if summary_mode == "batch":
+            # El refresh solo encola: se mide además hasta que llega el último resumen del batch
+            while batch_summarizer.get_stats()["videos_pending"]:
+                time.sleep(0.2)
+                batch_summarizer.run_cycle()
+            batch_seconds = round(time.perf_counter() - started, 3)
+        passes[name] = {
+            "seconds": round(elapsed, 3),
+            "videos": len(videos),
+            "videos_per_second": round(len(videos) / elapsed, 2) if elapsed else 0.0,
+            "channels_per_second": round(channels / elapsed, 2) if elapsed else 0.0,
+            "channel_latency": latency_stats(progress.channel_ms),
+            "video_latency": latency_stats(progress.video_ms),
+            "batch_seconds": batch_seconds,
+        }
+    return {
+        "scenario": "refresh",
+        "channels": channels,
+        "summary_mode": summary_mode,
+        "discovery_backend": DISCOVERY_BACKEND,
+        "passes": passes,
+        "peak_rss_mb": peak_rss_mb(),
+        # Con REFRESH_PROCESSES > 0: el proceso de shard más grande
+        "peak_shard_rss_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+    }
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _seed_summaries(total: int, channels: int):
+    from app.models import VideoSummary
+    from app.storage import save_summaries_batch
+    from bench.fake_upstreams import BASE_DATE, transcript_text
+    from datetime import timedelta
+
+    batch = []
+    for i in range(total):
+        channel = i % channels
+        position = i // channels
+        video_id = f"s{channel:05d}v{position:05d}"
+        batch.append(VideoSummary(
+            video_id=video_id,
+            title=f"Video {video_id}",
+            channel_name=f"Canal bench {channel}",
+            channel_url=bench_channel_url(channel),
+            published_at=(BASE_DATE - timedelta(hours=position)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+            video_url=f"https://www.youtube.com/watch?v={video_id}",
+            summary=transcript_text(video_id, 90),
+            has_transcript=True,
+        ))
+        if len(batch) == 1000:
+            save_summaries_batch(batch)
+            batch = []
+    if batch:
+        save_summaries_batch(batch)
+
+def run_summaries_scenario(total: int, channels: int, requests_per_case: int) -> dict:
+    import requests
+    import uvicorn
+    from app.main import app
+    from app.storage import save_summary, get_cached_summary
+
+    started = time.perf_counter()
+    _seed_summaries(total, channels)
+    seed_seconds = time.perf_counter() - started
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    base = f"http://127.0.0.1:{port}"
+    session = requests.Session()
+    cases = {}
+
+    def measure(name: str, count: int, request, before=None) -> None:
+        samples, sizes = [], []
+        case_started = time.perf_counter()
+        for _ in range(count):
+            if before:
+                before()
+            t0 = time.perf_counter()
+            response = request()
+            samples.append((time.perf_counter() - t0) * 1000)
+            response.raise_for_status()
+            sizes.append(len(response.content))
+        elapsed = time.perf_counter() - case_started
+        stats = latency_stats(samples)
+        stats["requests_per_second"] = round(count / elapsed, 1) if elapsed else 0.0
+        stats["body_bytes"] = sizes[-1] if sizes else 0
+        cases[name] = stats
+
+    measure("full_cold", 1, lambda: session.get(f"{base}/summaries"))
+    etag = session.get(f"{base}/summaries").headers.get("ETag", "")
+    measure("full", requests_per_case, lambda: session.get(f"{base}/summaries"))
+    measure("not_modified", requests_per_case, lambda: session.get(f"{base}/summaries", headers={"If-None-Match": etag}))
+    measure("newest_5_per_channel", requests_per_case, lambda: session.get(f"{base}/summaries", params={"limit": 5}))
+    measure("one_channel", requests_per_case, lambda: session.get(
+        f"{base}/summaries", params={"channel": bench_channel_url(0), "limit": 20}
+    ))
+    # Búsqueda: términos que aparecen en casi todos los resúmenes (sin tildes, para que pase por el
+    # plegado del tokenizer), la tercera página de la misma búsqueda y un prefijo selectivo del título
+    measure("search_common", requests_per_case, lambda: session.get(f"{base}/search", params={"q": "dolar reservas"}))
+    measure("search_page_3", requests_per_case, lambda: session.get(
+        f"{base}/search", params={"q": "dolar reservas", "offset": 40}
+    ))
+    measure("search_selective", requests_per_case, lambda: session.get(f"{base}/search", params={"q": "s00001v0001"}))
+    # Una escritura antes de cada lectura: mide el costo de invalidar y recalcular la vista
+    written = get_cached_summary("s00000v00000")
+    measure(
+        "write_then_read",
+        max(1, requests_per_case // 4),
+        lambda: session.get(f"{base}/summaries", params={"limit": 5}),
+        before=lambda: save_summary(written),
+    )
+
+    server.should_exit = True
+    thread.join(timeout=10)
+    return {
+        "scenario": "summaries",
+        "stored_summaries": total,
+        "channels": channels,
+        "seed_seconds": round(seed_seconds, 3),
+        "cases": cases,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+# --- Orquestación (proceso padre) ---
+
+def _bench_env(args, upstreams: FakeUpstreams, data_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(upstreams.env())
+    env["DATA_DIR"] = data_dir
+    env["REFRESH_INTERVAL_MINUTES"] = "0"
+    env["REFRESH_PROCESSES"] = str(args.refresh_processes)
+    env["REFRESH_SHARD_SIZE"] = str(args.shard_size)
+    env["DISCOVERY_BACKEND"] = args.discovery_backend
+    if not args.respect_rate_limits:
+        # Se mide el pipeline, no el limitador: sin pausa inicial y con backoff corto
+        env.setdefault("TRANSCRIPT_REQUEST_DELAY_SECONDS", "0")
+        env.setdefault("TRANSCRIPT_RATE_MAX", "1000")
+        env.setdefault("TRANSCRIPT_RETRY_BACKOFF_SECONDS", "0.05")
+    return env
+
+def _run_child(args, upstreams: FakeUpstreams, child_args: List[str]) -> dict:
+    with tempfile.TemporaryDirectory(prefix="pots-bench-") as data_dir:
+        result_file = os.path.join(data_dir, "result.json")
+        command = [sys.executable, "-m", "bench.run", "--child-result", result_file] + child_args
+        output = None if args.verbose else subprocess.DEVNULL
+        subprocess.run(
+            command,
+            cwd=REPO_ROOT,
+            env=_bench_env(args, upstreams, os.path.join(data_dir, "data")),
+            stdout=output,
+            stderr=output,
+            check=True,
+        )
+        with open(result_file, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    result["upstream_requests"] = upstreams.reset_counts()
+    return result
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+def _print_result(result: dict):
+    if result["scenario"] == "refresh":
+        shard_rss = f" (shards: {result['peak_shard_rss_mb']} MB)" if result.get("peak_shard_rss_mb") else ""
+        mode = f" · resúmenes {result['summary_mode']}" if result.get("summary_mode", "live") != "live" else ""
+        if result.get("discovery_backend", "api") != "api":
+            mode += f" · descubrimiento {result['discovery_backend']}"
+        print(f"\nrefresh · {result['channels']} canales{mode} · pico RSS {result['peak_rss_mb']} MB{shard_rss}")
+        for name, data in result["passes"].items():
+            batch = f"  batch listo en {data['batch_seconds']:.2f}s" if data.get("batch_seconds") is not None else ""
+            print(
+                f"  {name:<5} {data['seconds']:>8.2f}s  {data['videos']:>5} videos  "
+                f"{data['videos_per_second']:>8.2f} videos/s  "
+                f"canal p50/p99 {data['channel_latency']['p50_ms']:.0f}/{data['channel_latency']['p99_ms']:.0f} ms  "
+                f"video p50/p99 {data['video_latency']['p50_ms']:.0f}/{data['video_latency']['p99_ms']:.0f} ms{batch}"
+            )
+    else:
+        print(
+            f"\n/summaries · {result['stored_summaries']} resúmenes en {result['channels']} canales · "
+            f"pico RSS {result['peak_rss_mb']} MB"
+        )
+        for name, data in result["cases"].items():
+            print(
+                f"  {name:<22} p50 {data['p50_ms']:>8.2f} ms  p99 {data['p99_ms']:>8.2f} ms  "
+                f"{data['requests_per_second']:>8.1f} req/s  {data['body_bytes']:>9} bytes"
+            )
+    calls = ", ".join(f"{route}={count}" for route, count in sorted(result["upstream_requests"].items()))
+    if calls:
+        print(f"  upstreams: {calls}")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks offline del refresh y de /summaries")
+    parser.add_argument("--channels", default="9,100,1000", help="Cantidades de canales del refresh, separadas por coma (vacío = no correr)")
+    parser.add_argument("--summaries", type=int, default=10000, help="Resúmenes guardados para el benchmark de /summaries (0 = no correr)")
+    parser.add_argument("--summary-channels", type=int, default=100, help="Canales entre los que se reparten los resúmenes")
+    parser.add_argument("--requests", type=int, default=200, help="Peticiones por caso del benchmark de /summaries")
+    parser.add_argument("--youtube-latency-ms", type=float, default=20)
+    parser.add_argument("--transcript-latency-ms", type=float, default=40)
+    parser.add_argument("--openai-latency-ms", type=float, default=300)
+    parser.add_argument("--jitter-ms", type=float, default=10, help="Variación uniforme ± de todas las latencias")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de 500 en cada upstream")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Probabilidad de 429 en cada upstream")
+    parser.add_argument("--transcript-words", type=int, default=1500, help="Largo de cada transcript falso")
+    parser.add_argument("--refresh-processes", type=int, default=0, help="REFRESH_PROCESSES del refresh (0 = en un solo proceso)")
+    parser.add_argument("--shard-size", type=int, default=50, help="REFRESH_SHARD_SIZE del refresh")
+    parser.add_argument("--discovery-backend", choices=["api", "rss"], default="api", help="Descubrimiento con la Data API o con el feed de uploads")
+    parser.add_argument("--summary-mode", choices=["live", "batch"], default="live", help="Resúmenes en vivo o con la Batch API de OpenAI")
+    parser.add_argument("--batch-seconds", type=float, default=1.0, help="Tiempo que tarda en completarse cada batch falso")
+    parser.add_argument("--respect-rate-limits", action="store_true", help="No relajar el limitador de transcripts")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Archivo JSONL donde se agregan los resultados")
+    parser.add_argument("--verbose", action="store_true", help="Mostrar los logs de la app")
+    parser.add_argument("--child-result", help=argparse.SUPPRESS)
+    parser.add_argument("--child-scenario", choices=["refresh", "summaries"], help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child_result:
+        if args.child_scenario == "refresh":
+            result = run_refresh_scenario(int(args.channels), args.summary_mode)
+        else:
+            result = run_summaries_scenario(args.summaries, args.summary_channels, args.requests)
+        with open(args.child_result, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return
+
+    def profile(latency_ms: float) -> FaultProfile:
+        return FaultProfile(latency_ms, args.jitter_ms, args.error_rate, args.throttle_rate)
+
+    upstreams = FakeUpstreams(
+        youtube_api=profile(args.youtube_latency_ms),
+        youtube_web=profile(args.transcript_latency_ms),
+        openai=profile(args.openai_latency_ms),
+        transcript_words=args.transcript_words,
+        batch_seconds=args.batch_seconds,
+    ).start()
+    run = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "settings": {key: value for key, value in vars(args).items() if not key.startswith("child") and key != "output"},
+        "results": [],
+    }
+    try:
+        for channels in [int(value) for value in args.channels.split(",") if value.strip()]:
+            result = _run_child(args, upstreams, [
+                "--child-scenario", "refresh", "--channels", str(channels), "--summary-mode", args.summary_mode,
+            ])
+            _print_result(result)
+            run["results"].append(result)
+        if args.summaries > 0:
+            result = _run_child(args, upstreams, [
+                "--child-scenario", "summaries",
+                "--summaries", str(args.summaries),
+                "--summary-channels", str(args.summary_channels),
+                "--requests", str(args.requests),
+            ])
+            _print_result(result)
+            run["results"].append(result)
+    finally:
+        upstreams.stop()
+
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(run, ensure_ascii=False) + "\n")
+    print(f"\nResultados agregados a {args.output}")
+
+if __name__ == "__main__":
+    main()